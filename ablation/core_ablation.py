@@ -10,6 +10,9 @@ import time
 from pathlib import Path
 from typing import Dict, Any, Callable, List, Optional
 from ablation.config import AblationConfig
+from agent.workdir_snapshot import restore_workdir
+from agent.tool_runtime import MAX_TOOL_RESULT_CHARS
+from agent.tools_localize import SymbolBlockBudget
 
 # Try to import get_model_id for vLLM model support
 try:
@@ -347,6 +350,34 @@ def _read_context_snippet(workdir: Path, rel_file: str, line: Optional[int], rad
     except Exception:
         return None
 
+def _evaluate_candidate_in_copy(copy_workdir: str, candidate: Dict[str, Any], adapter) -> Dict[str, Any]:
+    """
+    apply_edits -> syntax check -> compile gate for one patch candidate in a private workdir copy.
+    A passing result carries the copy's diff, so the workdir can take it without compiling again.
+    """
+    from agent.tools_common import apply_edits, get_git_diff
+    from agent.syntax_check import check_syntax
+
+    apply_result = apply_edits(copy_workdir, json.dumps(candidate["edits"], ensure_ascii=False))
+    if not apply_result.get("ok"):
+        return {"ok": False, "stage": "apply", "error": apply_result.get("error", "unknown error")}
+    applied_files = list(apply_result.get("applied_files") or [])
+    if not applied_files or apply_result.get("warning"):
+        return {"ok": False, "stage": "apply", "error": apply_result.get("warning", "No files were modified")}
+    syntax_result = check_syntax(copy_workdir, applied_files)
+    if not syntax_result.get("ok"):
+        return {"ok": False, "stage": "syntax", "error": syntax_result.get("error_summary", "")}
+    try:
+        compile_result = adapter.check_compile(copy_workdir)
+    except Exception as e:
+        compile_result = {"ok": False, "error_summary": str(e), "rc": -1}
+    if not compile_result.get("ok"):
+        error_summary = compile_result.get("error_summary", "") or compile_result.get("stderr", "") or compile_result.get("stdout", "")
+        return {"ok": False, "stage": "compile", "error": error_summary, "rc": compile_result.get("rc")}
+    # Only the edited files: build files the adapter patched may differ between copy and workdir
+    diff_result = get_git_diff(copy_workdir, applied_files)
+    return {"ok": True, "stage": "compile", "diff": diff_result.get("diff") if diff_result.get("ok") else None}
+
 def run_agent_loop_ablation(
     client,
     model: str,
@@ -407,9 +438,14 @@ def run_agent_loop_ablation(
         "apply_success_count": 0,
         "compile_attempt_count": 0,
         "compile_success_count": 0,
+        # Candidates rejected by the parse-level syntax check (never reached the compiler)
+        "syntax_reject_count": 0,
         "tdd_gate_red_verified": False,
         "tdd_gate_green_verified": False,
         "runtime_seconds": 0.0,
+        # Wall time spent inside LLM-issued tool calls per phase (per-tool breakdown: metrics["tool_timing"])
+        "localization_tool_seconds": 0.0,
+        "patch_tool_seconds": 0.0,
         "localization_predicted_files": [],
         "actual_modified_files": [],
         "file_hit_at_1": False,  # File Hit@1
@@ -665,7 +701,9 @@ def run_agent_loop_ablation(
         
         tool_call_count = 0
         max_tool_calls = 15
-        symbol_blocks_read = 0  # G2: Working set limit
+        # G2: Working set limit; explain_symbols claims its bodies from the same budget
+        block_budget = tool_runtime.block_budget or SymbolBlockBudget(config.max_symbol_blocks_per_round)
+        block_budget.reset(config.max_symbol_blocks_per_round)
         localization_api_count = 0  # Track API calls in localization phase
         max_localization_api_calls = config.max_localization_api_calls
         predicted_files = []  # Collect files accessed during localization (for File Hit@k)
@@ -750,11 +788,11 @@ def run_agent_loop_ablation(
                 break
             
             # G2: Working set limit check
-            if config.enable_index_retrieval and symbol_blocks_read >= config.max_symbol_blocks_per_round:
+            if config.enable_index_retrieval and block_budget.used >= config.max_symbol_blocks_per_round:
                 print(f"[WARN] [G2] Reached working set limit ({config.max_symbol_blocks_per_round} symbol blocks), forcing localization result...", file=sys.stderr, flush=True)
                 messages.append({
                     "role": "user",
-                    "content": f"You have read {symbol_blocks_read} symbol blocks (limit: {config.max_symbol_blocks_per_round}). Please return your localization result now."
+                    "content": f"You have read {block_budget.used} symbol blocks (limit: {config.max_symbol_blocks_per_round}). Please return your localization result now."
                 })
                 
                 # Retry mechanism for forced localization result
@@ -960,9 +998,14 @@ def run_agent_loop_ablation(
                         print(f"[DEBUG] Tool call {i} details: function={func_name}, args={json.dumps(args, ensure_ascii=False)[:200]}", file=sys.stderr, flush=True)
                         
                         # Extract file paths from tool calls for File Hit@k metric
-                        if func_name in ["read_file", "read_span", "grep", "search_in_files"]:
-                            file_path = args.get("path") or args.get("file")
-                            if file_path and isinstance(file_path, str):
+                        if func_name in ["read_file", "read_span", "read_spans", "grep", "search_in_files"]:
+                            if func_name == "read_spans":
+                                call_paths = [sp.get("path") for sp in (args.get("spans") or []) if isinstance(sp, dict)]
+                            else:
+                                call_paths = [args.get("path") or args.get("file")]
+                            for file_path in call_paths:
+                                if not (file_path and isinstance(file_path, str)):
+                                    continue
                                 # Normalize path (remove workdir prefix if present)
                                 workdir_str = str(harness_info.get("workdir", ""))
                                 if workdir_str and file_path.startswith(workdir_str):
@@ -989,13 +1032,15 @@ def run_agent_loop_ablation(
                     "tool_calls": msg.tool_calls,
                 })
                 
+                tool_t0 = time.time()
                 tool_results = tool_runtime.handle_tool_calls(msg.tool_calls)
+                metrics["localization_tool_seconds"] += time.time() - tool_t0
                 
                 # Truncate tool result content to prevent context overflow
                 for tr in tool_results:
                     if tr.get("role") == "tool":
                         content = tr.get("content", "")
-                        if isinstance(content, str) and len(content) > 10000:
+                        if isinstance(content, str) and len(content) > MAX_TOOL_RESULT_CHARS:
                             truncated = content[:5000] + "\n\n[... truncated ...]\n\n" + content[-500:]
                             tr["content"] = truncated
                             print(f"[WARN] Truncated tool result from {len(content)} to {len(truncated)} chars", file=sys.stderr, flush=True)
@@ -1003,7 +1048,22 @@ def run_agent_loop_ablation(
                         # G2: Track symbol blocks read
                         tool_name = tr.get("name", "")
                         if tool_name in ["read_span", "symbol_lookup"]:
-                            symbol_blocks_read += 1
+                            block_budget.charge(1)
+                        elif tool_name == "read_spans":
+                            # One block per merged span returned
+                            try:
+                                block_budget.charge(max(1, int(json.loads(content).get("spans_read", 0))))
+                            except (ValueError, TypeError, AttributeError):
+                                block_budget.charge(1)
+                        elif tool_name == "explain_symbols":
+                            # Its bodies were already claimed from the budget; a call that
+                            # returned none still counts once
+                            try:
+                                returned = int(json.loads(content).get("blocks", 0))
+                            except (ValueError, TypeError, AttributeError):
+                                returned = 0
+                            if returned == 0:
+                                block_budget.charge(1)
                         
                         # Extract file paths from tool calls for File Hit@k metric
                         # (This is done in the tool call processing loop above, not here)
@@ -1396,13 +1456,15 @@ def run_agent_loop_ablation(
                     "content": patch_msg.content or "",
                     "tool_calls": patch_msg.tool_calls,
                 })
+                tool_t0 = time.time()
                 tool_results = tool_runtime.handle_tool_calls(patch_msg.tool_calls)
+                metrics["patch_tool_seconds"] += time.time() - tool_t0
                 
                 # Truncate tool result content to prevent context overflow
                 for tr in tool_results:
                     if tr.get("role") == "tool":
                         content = tr.get("content", "")
-                        if isinstance(content, str) and len(content) > 10000:
+                        if isinstance(content, str) and len(content) > MAX_TOOL_RESULT_CHARS:
                             truncated = content[:5000] + "\n\n[... truncated ...]\n\n" + content[-500:]
                             tr["content"] = truncated
                             print(f"[WARN] Truncated patch tool result from {len(content)} to {len(truncated)} chars", file=sys.stderr, flush=True)
@@ -1616,8 +1678,57 @@ def run_agent_loop_ablation(
                         patch_applied = False
                         patch_already_applied = False
                         compilation_errors_collected = []  # Collect compilation errors for feedback
-                        
-                        for candidate_idx, candidate in enumerate(patch_candidates, 1):
+
+                        # Several candidates under the compile gate: apply/check/compile them concurrently in
+                        # private copies of the workdir, then apply only the first passing one (in candidate
+                        # order, as the sequential loop would pick it) to the workdir through the loop below,
+                        # which skips the gate when its diff matches the copy that already passed it.
+                        candidates_to_try = patch_candidates
+                        from agent.candidate_workdirs import PARALLEL_CANDIDATES, evaluate_candidates, get_candidate_workdirs, is_clean
+                        use_parallel = (
+                            len(patch_candidates) > 1
+                            and PARALLEL_CANDIDATES > 1
+                            and config.enable_patch_compile_gate
+                            and config.use_compile_gate
+                            and getattr(adapter, "parallel_candidates", False)
+                        )
+                        # Copies start from the workdir's state, so it must be HEAD plus at most the
+                        # build files the adapter itself patches (e.g. Chart/Time build.xml)
+                        if use_parallel and not is_clean(workdir, getattr(adapter, "build_config_files", ())):
+                            print(f"[INFO] Workdir has changes beyond the adapter's build files; evaluating the {len(patch_candidates)} patch candidates one by one", file=sys.stderr, flush=True)
+                            use_parallel = False
+                        if use_parallel:
+                            candidate_workdirs = get_candidate_workdirs(workdir, on_copy=adapter.prepare_candidate_copy)
+                            outcomes = evaluate_candidates(
+                                candidate_workdirs,
+                                patch_candidates,
+                                lambda copy_workdir, c: _evaluate_candidate_in_copy(copy_workdir, c, adapter),
+                            )
+                            broken = [o for o in outcomes if o is not None and o["stage"] in ("copy", "error")]
+                            if broken:
+                                print(f"[WARN] Parallel candidate evaluation failed ({broken[0]['error'][:300]}); trying candidates in the workdir", file=sys.stderr, flush=True)
+                            else:
+                                candidates_to_try = []
+                                for candidate, outcome in zip(patch_candidates, outcomes):
+                                    if outcome is None:
+                                        continue
+                                    if outcome["ok"]:
+                                        print(f"[INFO] Patch candidate {candidate['id']} compiled in its workdir copy; promoting it", file=sys.stderr, flush=True)
+                                        candidates_to_try = [dict(candidate, prevalidated=outcome)]
+                                        break
+                                    print(f"[WARN] Patch candidate {candidate['id']} failed at {outcome['stage']} (rc={outcome.get('rc')}): {(outcome.get('error') or '')[:300]}", file=sys.stderr, flush=True)
+                                    if outcome["stage"] == "syntax":
+                                        metrics["syntax_reject_count"] = metrics.get("syntax_reject_count", 0) + 1
+                                    elif outcome["stage"] == "compile":
+                                        metrics["compile_attempt_count"] = metrics.get("compile_attempt_count", 0) + 1
+                                    if outcome["stage"] in ("syntax", "compile"):
+                                        compilation_errors_collected.append({
+                                            "candidate_id": candidate['id'],
+                                            "strategy": candidate.get('strategy', 'unknown'),
+                                            "error": (outcome.get("error") or "Compilation failed")[:1000]
+                                        })
+
+                        for candidate_idx, candidate in enumerate(candidates_to_try, 1):
                             print(f"[INFO] Trying patch candidate {candidate['id']}/{len(patch_candidates)}: {candidate['strategy']}", file=sys.stderr, flush=True)
                             candidate_edits_json = json.dumps(candidate["edits"], ensure_ascii=False)
                             
@@ -1637,9 +1748,8 @@ def run_agent_loop_ablation(
                                 warning_msg = apply_result.get("warning", "No files were modified")
                                 print(f"[WARN] Patch candidate {candidate['id']}: {warning_msg}", file=sys.stderr, flush=True)
                                 # Reset and continue to next candidate
-                                if workdir_path and workdir_path.exists() and (workdir_path / ".git").exists():
-                                    import subprocess
-                                    subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=str(workdir_path), capture_output=True)
+                                if workdir_path and workdir_path.exists():
+                                    restore_workdir(str(workdir_path))
                                 continue
                             
                             # Mark that edits have been applied
@@ -1651,9 +1761,8 @@ def run_agent_loop_ablation(
                                 if not diff_result.get("ok") or not diff_result.get("has_changes"):
                                     print(f"[WARN] Patch candidate {candidate['id']}: No changes detected after applying edits", file=sys.stderr, flush=True)
                                     # Reset and continue to next candidate
-                                    if workdir_path and workdir_path.exists() and (workdir_path / ".git").exists():
-                                        import subprocess
-                                        subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=str(workdir_path), capture_output=True)
+                                    if workdir_path and workdir_path.exists():
+                                        restore_workdir(str(workdir_path))
                                     patch_already_applied = False
                                     continue
                                 
@@ -1661,6 +1770,40 @@ def run_agent_loop_ablation(
                                 print(f"[INFO] Patch candidate {candidate['id']} applied successfully (diff length: {len(patch_text)} chars)", file=sys.stderr, flush=True)
                                 patch_applied = True
 
+                                # Promoted from a workdir copy where this exact diff already passed the
+                                # syntax check and compile gate: do not compile it a second time here.
+                                prevalidated = candidate.get("prevalidated")
+                                if prevalidated is not None:
+                                    from agent.tools_common import get_git_diff
+                                    if prevalidated.get("diff") == get_git_diff(workdir, applied_files_list).get("diff"):
+                                        print(f"[INFO] Patch candidate {candidate['id']} already compiled in its workdir copy; skipping the compile gate", file=sys.stderr, flush=True)
+                                        metrics["compile_attempt_count"] = metrics.get("compile_attempt_count", 0) + 1
+                                        metrics["compile_success_count"] = metrics.get("compile_success_count", 0) + 1
+                                        break
+                                    print(f"[WARN] Patch candidate {candidate['id']} produced a different diff than in its workdir copy; running the compile gate", file=sys.stderr, flush=True)
+
+                                # Parse-level syntax check of the edited files (G3/TRACE): a candidate that
+                                # no longer parses is rejected before any compile round trip.
+                                if config.enable_patch_compile_gate and config.use_compile_gate:
+                                    from agent.syntax_check import check_syntax
+                                    syntax_result = check_syntax(workdir, applied_files_list)
+                                    if not syntax_result.get("ok"):
+                                        error_summary = syntax_result.get("error_summary", "")
+                                        print(f"[WARN] Patch candidate {candidate['id']} failed the syntax check: {error_summary[:300]}", file=sys.stderr, flush=True)
+                                        metrics["syntax_reject_count"] = metrics.get("syntax_reject_count", 0) + 1
+                                        compilation_errors_collected.append({
+                                            "candidate_id": candidate['id'],
+                                            "strategy": candidate.get('strategy', 'unknown'),
+                                            "error": error_summary[:1000] if error_summary else "Syntax error"
+                                        })
+                                        # Reset and try next candidate
+                                        if workdir_path and workdir_path.exists():
+                                            restore_workdir(str(workdir_path))
+                                        patch_text = None
+                                        patch_already_applied = False
+                                        patch_applied = False
+                                        continue
+
                                 # Sanity compile check for STRUCTURED EDITS.
                                 # Limit to G3/TRACE only (i.e., when compile gate is enabled in the variant),
                                 # so G0/G1/G2 behavior remains unchanged.
@@ -1690,9 +1833,8 @@ def run_agent_loop_ablation(
                                                 "error": error_summary[:1000] if error_summary else "Compilation failed"
                                             })
                                             # Reset and try next candidate
-                                            if workdir_path and workdir_path.exists() and (workdir_path / ".git").exists():
-                                                import subprocess
-                                                subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=str(workdir_path), capture_output=True)
+                                            if workdir_path and workdir_path.exists():
+                                                restore_workdir(str(workdir_path))
                                             patch_text = None
                                             patch_already_applied = False
                                             patch_applied = False
@@ -1719,9 +1861,8 @@ def run_agent_loop_ablation(
                                         })
                                         
                                         # Reset and try next candidate
-                                        if workdir_path and workdir_path.exists() and (workdir_path / ".git").exists():
-                                            import subprocess
-                                            subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=str(workdir_path), capture_output=True)
+                                        if workdir_path and workdir_path.exists():
+                                            restore_workdir(str(workdir_path))
                                         patch_text = None
                                         patch_already_applied = False
                                         patch_applied = False
@@ -1737,9 +1878,8 @@ def run_agent_loop_ablation(
                             else:
                                 print("[WARN] get_git_diff not available, cannot convert structured edits", file=sys.stderr, flush=True)
                                 # Reset and continue to next candidate
-                                if workdir_path and workdir_path.exists() and (workdir_path / ".git").exists():
-                                    import subprocess
-                                    subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=str(workdir_path), capture_output=True)
+                                if workdir_path and workdir_path.exists():
+                                    restore_workdir(str(workdir_path))
                                 patch_already_applied = False
                                 continue
                         
@@ -2112,9 +2252,8 @@ def run_agent_loop_ablation(
                             print(f"[DEBUG] Full compilation error:\n{error_summary[:1000]}", file=sys.stderr, flush=True)
                         # Reset workdir
                         workdir = harness_info.get("workdir", "")
-                        if workdir and Path(workdir).exists() and (Path(workdir) / ".git").exists():
-                            import subprocess
-                            subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=workdir, capture_output=True)
+                        if workdir and Path(workdir).exists():
+                            restore_workdir(workdir)
                         
                         # Compilation error feedback: provide detailed feedback to LLM for regeneration
                         compile_fail_count += 1
@@ -2161,9 +2300,8 @@ def run_agent_loop_ablation(
             def _reset_workdir_to_head():
                 workdir = harness_info.get("workdir", "")
                 try:
-                    if workdir and Path(workdir).exists() and (Path(workdir) / ".git").exists():
-                        import subprocess
-                        subprocess.run(["git", "reset", "--hard", "HEAD"], cwd=workdir, capture_output=True)
+                    if workdir and Path(workdir).exists():
+                        restore_workdir(workdir)
                 except Exception as e:
                     print(f"[WARN] Failed to reset workdir after patch failure: {e}", file=sys.stderr, flush=True)
 
@@ -97,8 +97,10 @@ def main():
 
     index_exists = False
     if index_dir:
-        # Flat layout: {index_dir}/{pid}-{bid}b_index.json
-        index_exists = (Path(index_dir) / f"{args.pid}-{args.bid}b_index.json").exists()
+        # Flat layout: {index_dir}/{pid}-{bid}b_index.json (or the compact _index.sqlite)
+        index_exists = any(
+            (Path(index_dir) / f"{args.pid}-{args.bid}b_index{ext}").exists() for ext in (".json", ".sqlite")
+        )
 
     # Register TDD Gate functions if enabled (need a RED test name)
     red_test_name = None
@@ -166,6 +168,9 @@ def main():
         green_log=green_log,
         adapter=adapter,
         meta_dir=meta_dir,
+        # TRACE_TOOL_TRACE=1: per-call JSONL trace next to the run logs
+        tool_trace_path=str(Path(log_dir) / "tool_trace.jsonl") if os.environ.get("TRACE_TOOL_TRACE") == "1" else None,
+        max_symbol_blocks=config.max_symbol_blocks_per_round,
     )
     
     def harness_fn():
@@ -199,7 +204,26 @@ def main():
         adapter=adapter,
         checkout_fn=adapter.checkout,
     )
-    
+
+    # Loaded-index cache counters (parsed once per process; hits should dominate in G2/TRACE)
+    if config.enable_index_retrieval and isinstance(result.get("metrics"), dict):
+        from agent.tools_build_index import get_index_cache_stats
+        index_cache_stats = get_index_cache_stats()
+        result["metrics"]["index_cache"] = index_cache_stats
+        print(f"[INFO] Index cache: {index_cache_stats}", file=sys.stderr, flush=True)
+
+    # Per-tool latency/payload/cache/error aggregates (which tools dominate localization/patch time)
+    if isinstance(result.get("metrics"), dict):
+        result["metrics"]["tool_timing"] = tool_runtime.tool_metrics()
+        print(f"[INFO] Tool timing: {result['metrics']['tool_timing'].get('_total')}", file=sys.stderr, flush=True)
+
+    # Tool-result cache counters (byte-bounded LRU; evictions > 0 means TRACE_TOOL_CACHE_MAX_MB was hit)
+    if isinstance(result.get("metrics"), dict):
+        from agent.utils import get_tool_cache_stats
+        tool_cache_stats = get_tool_cache_stats()
+        result["metrics"]["tool_cache"] = tool_cache_stats
+        print(f"[INFO] Tool cache: {tool_cache_stats}", file=sys.stderr, flush=True)
+
     # Print result
     import json
     print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -16,7 +16,7 @@ from typing import Any, Dict, List, Optional, Tuple
 from agent.tool_runtime import ToolRuntime
 from agent.tools_common import read_file, search_in_files
 
-from agent.tools_localize import localize_tool_schemas, register_localize_tools
+from agent.tools_localize import SymbolBlockBudget, localize_tool_schemas, register_localize_tools
 from agent.tools_patch import register_patch_tools
 from agent.tools_verify import register_verify_tools
 
@@ -33,10 +33,16 @@ def setup_tools(
     green_log: Optional[str],
     adapter=None,
     meta_dir: Optional[str] = None,
+    tool_trace_path: Optional[str] = None,
+    max_symbol_blocks: int = 10,
 ) -> Tuple[List[Dict[str, Any]], ToolRuntime]:
     """
     Returns:
       (tools_schema, tool_runtime)
+
+    tool_trace_path: when set, every tool call's latency/size/cache/error record is appended there as JSONL.
+    max_symbol_blocks: working-set limit per localization round; explain_symbols only returns
+      the bodies still left in it (tool_runtime.block_budget, reset by the agent loop each round).
     """
     # Phase mapping (schemas):
     # - Localize tools: read_file/search_in_files (+ retrieval tools for G2/TRACE)
@@ -45,9 +51,16 @@ def setup_tools(
     tools_schema = localize_tool_schemas(enable_index_retrieval=enable_index_retrieval)
 
     func_map: Dict[str, Any] = {}
+    # Shared with the agent loop through tool_runtime.block_budget
+    block_budget = SymbolBlockBudget(max_symbol_blocks)
 
     # Localize-stage registration
-    register_localize_tools(func_map, workdir=workdir, enable_index_retrieval=enable_index_retrieval)
+    register_localize_tools(
+        func_map,
+        workdir=workdir,
+        enable_index_retrieval=enable_index_retrieval,
+        block_budget=block_budget,
+    )
 
     # Patch-stage registration
     register_patch_tools(func_map, workdir=workdir)
@@ -67,6 +80,8 @@ def setup_tools(
             meta_dir=meta_dir,
         )
 
-    return tools_schema, ToolRuntime(func_map)
+    tool_runtime = ToolRuntime(func_map, workdir=workdir, trace_path=tool_trace_path)
+    tool_runtime.block_budget = block_budget
+    return tools_schema, tool_runtime
 
 
@@ -11,6 +11,12 @@ from typing import Any, Dict, Optional
 
 
 class DatasetAdapter(ABC):
+    # Multi-patch candidates may be compiled concurrently in private copies of the workdir
+    # (agent/candidate_workdirs.py); only worth the copies where check_compile does real work.
+    parallel_candidates = False
+    # Workdir-relative build files the adapter itself patches (not part of any candidate)
+    build_config_files: tuple = ()
+
     @abstractmethod
     def harness(
         self,
@@ -48,6 +54,6 @@ class DatasetAdapter(ABC):
     def checkout(self, pid: str, bid: int, workdir: str) -> Dict[str, Any]:
         raise NotImplementedError
 
-
-
-
+    def prepare_candidate_copy(self, workdir: str, copy: str) -> None:
+        """Called once `workdir` has been copied to `copy` (e.g. to carry over build state)."""
+        return None
@@ -1,3 +1,5 @@
+import os
+import re
 from pathlib import Path
 from typing import Dict, Any, Optional
 import subprocess
@@ -219,6 +221,12 @@ def harness(pid: str, bid: int, workdir: str, meta_dir: str, full_log: str, trig
     # Ensure Defects4J workdir marker exists even for archive-extracted dirs.
     _ensure_defects4j_config(workdir_path, pid=pid, bid=bid)
     _fix_compilation_config(workdir_path, log_prefix="[HARNESS]")
+    if _INCREMENTAL_COMPILE:
+        # The one clean build per harness; compile-gate calls after this are incremental
+        _clean_build_dir(workdir_path)
+        changed = _changed_java_files(workdir_path)
+        if changed is not None:
+            _compiled_changes[str(workdir_path.resolve())] = changed
     
     # Check if metadata already exists (can be shared across variants)
     # Note: We still need to run tests for each workdir to verify the bug state
@@ -250,7 +258,10 @@ def harness(pid: str, bid: int, workdir: str, meta_dir: str, full_log: str, trig
         # Prefer index_dir only if under TRACE_WORK_ROOT
         if str(index_dir).startswith(work_root):
             index_dir_under_root = str(Path(index_dir).resolve())
-    index_file_path = Path(index_dir_under_root) / f"{bug_id}_index.json"
+    # Prefer the compact SQLite index when one was built; fall back to the JSON index.
+    index_file_path = Path(index_dir_under_root) / f"{bug_id}_index.sqlite"
+    if not index_file_path.exists():
+        index_file_path = Path(index_dir_under_root) / f"{bug_id}_index.json"
     if index_file_path.exists():
         index_path = str(index_file_path)
         print(f"[HARNESS] Using index: {index_path}", file=sys.stderr, flush=True)
@@ -266,6 +277,35 @@ def harness(pid: str, bid: int, workdir: str, meta_dir: str, full_log: str, trig
     }
 
 
+# Workdir files the compile-config fixes below may rewrite
+BUILD_CONFIG_FILES = (
+    "build.xml",
+    "ant/build.xml",
+    "default.properties",
+    "defects4j.build.properties",
+    "build.properties",
+)
+
+
+def _write_build_file(workdir_path: Path, p: Path, text: str) -> None:
+    """
+    Write a build descriptor/properties file the adapter patches. Files inside the workdir
+    get their original recorded first, so restore_workdir reverts them like it reverts
+    candidate edits (as `git reset --hard` did) without resetting the whole tree.
+    """
+    from agent.utils import invalidate_file_fingerprints
+    from agent.workdir_snapshot import record_originals
+
+    try:
+        rel = p.resolve().relative_to(workdir_path.resolve()).as_posix()
+    except ValueError:
+        rel = None  # e.g. a project descriptor under DEFECTS4J_HOME
+    if rel is not None:
+        record_originals(str(workdir_path), [rel])
+    p.write_text(text, encoding="utf-8")
+    invalidate_file_fingerprints([str(p)])
+
+
 def _fix_compilation_config(workdir_path: Path, log_prefix: str = "[D4J]") -> None:
     """
     Fix common Defects4J compilation placeholders and ensure compile.target/source exist.
@@ -290,7 +330,7 @@ def _fix_compilation_config(workdir_path: Path, log_prefix: str = "[D4J]") -> No
                     content = content.replace("${compile.source}", "1.6")
                     modified = True
                 if modified:
-                    prop_file.write_text(content, encoding="utf-8")
+                    _write_build_file(workdir_path, prop_file, content)
                     print(f"{log_prefix} Fixed {prop_file.name}: replaced ${{compile.target}}/${{compile.source}} with 1.6", file=sys.stderr, flush=True)
             except Exception:
                 pass
@@ -306,7 +346,7 @@ def _fix_compilation_config(workdir_path: Path, log_prefix: str = "[D4J]") -> No
                 content += "\ncompile.source = 1.6\n"
                 changed = True
             if changed:
-                default_props.write_text(content, encoding="utf-8")
+                _write_build_file(workdir_path, default_props, content)
                 print(f"{log_prefix} Added compile.target/compile.source to default.properties", file=sys.stderr, flush=True)
         except Exception:
             pass
@@ -333,7 +373,7 @@ def _fix_compilation_config(workdir_path: Path, log_prefix: str = "[D4J]") -> No
                 content = re.sub(r'source=["\']5["\']', 'source="6"', content)
                 content = re.sub(r'target=["\']5["\']', 'target="6"', content)
                 if content != original:
-                    build_xml.write_text(content, encoding="utf-8")
+                    _write_build_file(workdir_path, build_xml, content)
                     changes = []
                     if "1.4" in original and "1.6" in content:
                         changes.append("1.4->1.6")
@@ -476,7 +516,7 @@ def _fix_javac_encoding(workdir_path: Path, *, encoding: str, log_prefix: str =
 
             new = pat.sub(_repl, text)
             if new != text:
-                p.write_text(new, encoding="utf-8")
+                _write_build_file(workdir_path, p, new)
                 changed = True
                 print(f"{log_prefix} Patched javac encoding in {p} -> {encoding}", file=sys.stderr, flush=True)
         except Exception:
@@ -517,7 +557,7 @@ def _set_ant_compile_level(workdir_path: Path, *, source: str, target: str, log_
             else:
                 txt = txt.rstrip() + f"\ncompile.target = {target}\n"
             if txt != orig:
-                p.write_text(txt, encoding="utf-8")
+                _write_build_file(workdir_path, p, txt)
                 changed = True
                 print(f"{log_prefix} Set compile.source/target in {p.name} -> {source}/{target}", file=sys.stderr, flush=True)
         except Exception:
@@ -525,22 +565,187 @@ def _set_ant_compile_level(workdir_path: Path, *, source: str, target: str, log_
     return changed
 
 
+# ---------------------------------------------------------------------------
+# Incremental compile gate
+# ---------------------------------------------------------------------------
+#
+# build/ is wiped once per harness (extracted archives may carry class files built by
+# another Java version). Later compile-gate calls keep it and let Ant recompile only
+# sources whose class files are stale or missing: the classes of every .java file that
+# differs from HEAD (or did at the previous compile, i.e. was since reverted) are deleted,
+# together with those of sources that mention one of the types declared in them.
+# A failing incremental build is always re-run as a full clean build, so rejections
+# (and their error_summary) come from the same build as before.
+# TRACE_D4J_INCREMENTAL_COMPILE=0 restores a clean build on every call.
+
+_INCREMENTAL_COMPILE = os.environ.get("TRACE_D4J_INCREMENTAL_COMPILE", "1") != "0"
+# "javac-server": answer incremental compile-gate calls from a warm javac (see javac_server.py)
+_COMPILE_BACKEND = os.environ.get("TRACE_D4J_COMPILE_BACKEND", "defects4j")
+# Resolved workdirs whose build/ was cleaned in this process -> .java files that differed
+# from HEAD when they were last compiled
+_compiled_changes: Dict[str, set] = {}
+
+_JAVA_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.M)
+_JAVA_TYPE_DECL_RE = re.compile(r"\b(?:class|interface|enum)\s+([A-Za-z_$][\w$]*)")
+
+
+def _clean_build_dir(workdir_path: Path) -> None:
+    """Remove build/ (ignoring errors) so the next compile starts from scratch."""
+    import shutil
+    build_dir = workdir_path / "build"
+    if build_dir.exists():
+        try:
+            shutil.rmtree(build_dir)
+        except Exception:
+            pass  # Ignore errors, continue with compilation
+
+
+def _changed_java_files(workdir_path: Path) -> Optional[set]:
+    """Workdir-relative .java files that differ from HEAD, or None if unknown (no git, deletions, renames)."""
+    try:
+        p = subprocess.run(
+            ["git", "status", "--porcelain", "-z", "--untracked-files=all"],
+            cwd=str(workdir_path), capture_output=True, timeout=60,
+        )
+    except Exception:
+        return None
+    if p.returncode != 0:
+        return None
+    changed = set()
+    for entry in p.stdout.decode("utf-8", "surrogateescape").split("\0"):
+        if not entry:
+            continue
+        status, rel = entry[:2], entry[3:]
+        if "D" in status or "R" in status or "C" in status:
+            return None
+        if rel.endswith(".java"):
+            changed.add(rel)
+    return changed
+
+
+def _java_class_key(text: str, stem: str) -> str:
+    """Package path + top-level class name of a source file (e.g. org/foo/Bar)."""
+    m = _JAVA_PACKAGE_RE.search(text)
+    return f"{m.group(1).replace('.', '/')}/{stem}" if m else stem
+
+
+def _referencing_sources(workdir_path: Path, sources: set, class_files: Optional[list] = None) -> Optional[Dict[str, str]]:
+    """
+    Workdir-relative .java files -> class key, for `sources` and every source that mentions
+    a type declared in them; None if a source is missing. One walk over the workdir, which
+    also collects the .class files found into class_files when given.
+    """
+    found: Dict[str, str] = {}
+    names = set()
+    for rel in sources:
+        fp = workdir_path / rel
+        if not fp.is_file():
+            return None
+        text = fp.read_text(encoding="utf-8", errors="replace")
+        found[rel] = _java_class_key(text, fp.stem)
+        names.add(fp.stem)
+        names.update(_JAVA_TYPE_DECL_RE.findall(text))
+    if not names and class_files is None:
+        return found
+    mention = re.compile(r"\b(?:" + "|".join(re.escape(n) for n in sorted(names)) + r")\b") if names else None
+
+    for dirpath, dirnames, filenames in os.walk(workdir_path):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        for fn in filenames:
+            if fn.endswith(".class"):
+                if class_files is not None:
+                    class_files.append(os.path.join(dirpath, fn))
+            elif fn.endswith(".java") and mention is not None:
+                fp = Path(dirpath) / fn
+                try:
+                    text = fp.read_text(encoding="utf-8", errors="replace")
+                except OSError:
+                    continue
+                if mention.search(text):
+                    found.setdefault(fp.relative_to(workdir_path).as_posix(), _java_class_key(text, fp.stem))
+    return found
+
+
+def _drop_stale_classes(workdir_path: Path, sources: set) -> bool:
+    """
+    Delete the class files of `sources` and of every source that mentions a type declared
+    in them, so Ant recompiles exactly those. False if that cannot be determined.
+    """
+    if not sources:
+        return True
+    class_files: list = []
+    found = _referencing_sources(workdir_path, sources, class_files)
+    if found is None:
+        return False
+    by_name: Dict[str, list] = {}
+    for k in set(found.values()):
+        by_name.setdefault(k.rsplit("/", 1)[-1], []).append(k)
+    for cf in class_files:
+        rel = Path(cf).relative_to(workdir_path).as_posix()[:-len(".class")]
+        head, _, base = rel.rpartition("/")
+        outer = base.split("$", 1)[0]
+        for k in by_name.get(outer, ()):
+            if f"{head}/{outer}".endswith("/" + k) or f"{head}/{outer}" == k:
+                try:
+                    os.remove(cf)
+                except OSError:
+                    return False
+                break
+    return True
+
+
 def check_compile(workdir: str) -> Dict[str, Any]:
     """Check if the code compiles. Returns ok=True if compilation succeeds."""
+    import sys
+    workdir_path = Path(workdir)
+    key = str(workdir_path.resolve())
+    if _INCREMENTAL_COMPILE and key in _compiled_changes:
+        changed = _changed_java_files(workdir_path)
+        if changed is not None and _drop_stale_classes(workdir_path, changed | _compiled_changes[key]):
+            if _COMPILE_BACKEND == "javac-server":
+                from agent.adapters.javac_server import server_compile
+                result = server_compile(workdir, changed)
+                if result is not None and result.get("ok"):
+                    # Stale classes are already gone, so the next Ant build recompiles what changed
+                    _compiled_changes[key] = changed
+                    return result
+                if result is not None:
+                    # The server's javac options are rebuilt from the export and may differ from
+                    # the real build: a rejection must be confirmed by defects4j compile
+                    print("[D4J] javac server rejected the patch; confirming with defects4j compile...", file=sys.stderr, flush=True)
+            result = _check_compile(workdir, clean=False)
+            if result.get("ok"):
+                _compiled_changes[key] = changed
+                return result
+            print("[D4J] Incremental compile failed; confirming with a clean build...", file=sys.stderr, flush=True)
+    result = _check_compile(workdir, clean=True)
+    if _INCREMENTAL_COMPILE:
+        changed = _changed_java_files(workdir_path)
+        if changed is None:
+            _compiled_changes.pop(key, None)
+        else:
+            _compiled_changes[key] = changed
+    return result
+
+
+def inherit_compile_state(workdir: str, copy: str) -> None:
+    """A copy of workdir taken between compiles (build/ included) may compile incrementally too."""
+    changes = _compiled_changes.get(str(Path(workdir).resolve()))
+    if changes is not None:
+        _compiled_changes[str(Path(copy).resolve())] = set(changes)
+
+
+def _check_compile(workdir: str, clean: bool = True) -> Dict[str, Any]:
+    """One compile-gate run (defects4j compile plus environment auto-fixes); clean wipes build/ first."""
     import os
     import re
-    import shutil
     import sys
     from pathlib import Path
     # Clean build directory before compilation to avoid Java version conflicts
     # (archives may contain build artifacts compiled with different Java versions)
     workdir_path = Path(workdir)
-    build_dir = workdir_path / "build"
-    if build_dir.exists():
-        try:
-            shutil.rmtree(build_dir)
-        except Exception:
-            pass  # Ignore errors, continue with compilation
+    if clean:
+        _clean_build_dir(workdir_path)
     
     # Fix missing `.defects4j.config` (required by defects4j compile).
     # Do NOT require `.git` to exist: many archives omit it.
@@ -627,7 +832,7 @@ def check_compile(workdir: str) -> Dict[str, Any]:
                 if "compile.source" not in content:
                     content += "\ncompile.source = 1.6\n"
                 if content != original_content:
-                    prop_file.write_text(content, encoding="utf-8")
+                    _write_build_file(workdir_path, prop_file, content)
             except Exception:
                 pass  # If we can't fix it, try compiling anyway
     
@@ -663,7 +868,7 @@ def check_compile(workdir: str) -> Dict[str, Any]:
             return False
 
         try:
-            p.write_text(txt, encoding="utf-8")
+            _write_build_file(workdir_path, p, txt)
             return True
         except Exception:
             return False
@@ -699,7 +904,7 @@ def check_compile(workdir: str) -> Dict[str, Any]:
             return False
 
         try:
-            p.write_text(txt, encoding="utf-8")
+            _write_build_file(workdir_path, p, txt)
             return True
         except Exception:
             return False
@@ -1017,6 +1222,9 @@ class Defects4JAdapter(DatasetAdapter):
     This keeps behavior identical while allowing ablation code to depend on an adapter interface.
     """
 
+    parallel_candidates = True
+    build_config_files = BUILD_CONFIG_FILES
+
     def harness(
         self,
         pid: str,
@@ -1049,3 +1257,6 @@ class Defects4JAdapter(DatasetAdapter):
     def checkout(self, pid: str, bid: int, workdir: str) -> Dict[str, Any]:
         return d4j_checkout(pid, bid, workdir)
 
+    def prepare_candidate_copy(self, workdir: str, copy: str) -> None:
+        inherit_compile_state(workdir, copy)
+
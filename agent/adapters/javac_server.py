@@ -0,0 +1,281 @@
+"""
+Warm javac backend for the Defects4J compile gate (TRACE_D4J_COMPILE_BACKEND=javac-server).
+
+`defects4j compile` starts Perl, then Ant, then a cold javac JVM for every patch candidate.
+This backend keeps one long-lived JVM per worker process that runs javax.tools.JavaCompiler
+on request, and compiles only the changed sources (plus the sources that reference their
+types) against the project's classpath, which is exported from Defects4J once per workdir.
+Classes are written to a scratch directory, so the Ant build output is never touched.
+
+The result is only trusted when it is conclusive: a clean compile, or errors that all lie
+in the files that were compiled. Anything else (no JDK, no build output yet, errors in
+other files, a dead server) returns None and check_compile runs `defects4j compile`.
+A rejection is never final either: the options here are rebuilt from `defects4j export`
+rather than taken from the Ant build, so check_compile confirms every failure with
+`defects4j compile` the same way it confirms a failed incremental Ant build.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_SERVER_CLASS = "TraceJavacServer"
+
+# One request per line: javac options and source files separated by tabs.
+# Reply: javac's diagnostics, then a line "@@END <rc>".
+_SERVER_SOURCE = r"""
+import javax.tools.*;
+import java.io.*;
+import java.util.*;
+
+public class TraceJavacServer {
+    public static void main(String[] argv) throws IOException {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        JavaCompiler javac = ToolProvider.getSystemJavaCompiler();
+        if (javac == null) {
+            out.println("error: no system Java compiler (running on a JRE?)");
+            out.println("@@END 2");
+            return;
+        }
+        // Kept across requests: jar and directory listings stay cached in the warm JVM
+        StandardJavaFileManager fm = javac.getStandardFileManager(null, null, null);
+        out.println("@@READY");
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) continue;
+            List<String> options = new ArrayList<String>();
+            List<String> files = new ArrayList<String>();
+            for (String a : line.split("\t")) {
+                if (a.endsWith(".java")) files.add(a); else options.add(a);
+            }
+            StringWriter diag = new StringWriter();
+            int rc;
+            try {
+                Boolean ok = javac.getTask(diag, fm, null, options, null,
+                        fm.getJavaFileObjectsFromStrings(files)).call();
+                rc = ok ? 0 : 1;
+            } catch (Throwable t) {
+                t.printStackTrace(new PrintWriter(diag));
+                rc = 3;
+            }
+            out.print(diag.toString());
+            out.println();
+            out.println("@@END " + rc);
+        }
+    }
+}
+"""
+
+_EXPORT_PROPS = ("cp.test", "dir.src.classes", "dir.src.tests", "dir.bin.classes")
+
+_ERROR_FILE_RE = re.compile(r"^(.+?\.java):\d+: error:", re.M)
+_ENCODING_RE = re.compile(r"<javac\b[^>]*\bencoding=[\"']([^\"']+)[\"']")
+_SOURCE_LEVEL_RE = re.compile(r"(?m)^\s*compile\.source\s*=\s*(\S+)\s*$")
+
+
+def _work_dir() -> Path:
+    return Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")) / "javac_server"
+
+
+def _d4j_env() -> Dict[str, str]:
+    """The environment `defects4j compile` runs with (same JDK selection)."""
+    from agent.adapters.defects4j import _USE_JSON_CONFIG
+    env = os.environ.copy()
+    if _USE_JSON_CONFIG:
+        from dataset.env_config import apply_defects4j_env
+        env.update(apply_defects4j_env(overrides=env))
+    return env
+
+
+def _jdk_tool(env: Dict[str, str], name: str) -> Optional[str]:
+    for home in (env.get("DEFECTS4J_JAVA_HOME"), env.get("JAVA_HOME")):
+        if home and os.path.exists(os.path.join(home, "bin", name)):
+            return os.path.join(home, "bin", name)
+    return shutil.which(name, path=env.get("PATH"))
+
+
+class _JavacServer:
+    """A long-lived JVM running TraceJavacServer; requests are serialized."""
+
+    def __init__(self, java: str, javac: str):
+        self.java = java
+        self.javac = javac
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        digest = hashlib.sha1(f"{self.javac}\0{_SERVER_SOURCE}".encode()).hexdigest()[:12]
+        classes = _work_dir() / f"classes-{digest}"
+        if not (classes / f"{_SERVER_CLASS}.class").exists():
+            classes.mkdir(parents=True, exist_ok=True)
+            src = classes / f"{_SERVER_CLASS}.java"
+            src.write_text(_SERVER_SOURCE, encoding="utf-8")
+            r = subprocess.run([self.javac, "-nowarn", "-d", str(classes), str(src)], capture_output=True, text=True)
+            if r.returncode != 0:
+                raise RuntimeError(f"cannot build javac server: {(r.stderr or r.stdout)[:500]}")
+        self._proc = subprocess.Popen(
+            [self.java, "-Xss4m", "-XX:+UseSerialGC", "-cp", str(classes), _SERVER_CLASS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", errors="replace", bufsize=1,
+        )
+        ready = self._proc.stdout.readline()
+        if ready.strip() != "@@READY":
+            self.close()
+            raise RuntimeError(f"javac server did not start: {ready.strip()[:200]}")
+
+    def compile(self, args: List[str]) -> Tuple[int, str]:
+        """Run javac with args in the warm JVM; (rc, diagnostics). Restarts a dead server once."""
+        with self._lock:
+            for attempt in (0, 1):
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                try:
+                    self._proc.stdin.write("\t".join(args) + "\n")
+                    self._proc.stdin.flush()
+                    out: List[str] = []
+                    for line in self._proc.stdout:
+                        if line.startswith("@@END "):
+                            return int(line.split()[1]), "".join(out).strip()
+                        out.append(line)
+                except (OSError, ValueError):
+                    pass
+                self.close()
+            raise RuntimeError("javac server exited while compiling")
+
+    def close(self) -> None:
+        if self._proc is not None:
+            try:
+                self._proc.kill()
+            except OSError:
+                pass
+            self._proc = None
+
+
+_servers: Dict[str, _JavacServer] = {}
+_servers_lock = threading.Lock()
+_project_info: Dict[str, Dict[str, str]] = {}
+
+
+def _get_server(env: Dict[str, str]) -> Optional[_JavacServer]:
+    java, javac = _jdk_tool(env, "java"), _jdk_tool(env, "javac")
+    if not java or not javac:
+        return None
+    with _servers_lock:
+        server = _servers.get(javac)
+        if server is None:
+            server = _servers[javac] = _JavacServer(java, javac)
+        return server
+
+
+@atexit.register
+def _shutdown_servers() -> None:
+    for server in list(_servers.values()):
+        server.close()
+
+
+def _project(workdir_path: Path) -> Optional[Dict[str, str]]:
+    """Classpath and source/output dirs of a workdir, from `defects4j export` (cached on disk)."""
+    key = str(workdir_path.resolve())
+    info = _project_info.get(key)
+    if info is not None:
+        return info
+    cache = _work_dir() / "projects" / (hashlib.sha1(key.encode()).hexdigest()[:16] + ".json")
+    if cache.exists():
+        try:
+            info = json.loads(cache.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            info = None
+    if info is None:
+        from agent.adapters.defects4j import _run
+        info = {}
+        for prop in _EXPORT_PROPS:
+            r = _run(["defects4j", "export", "-p", prop, "-w", key])
+            value = (r.get("stdout") or "").strip()
+            if r["rc"] != 0 or not value:
+                return None
+            info[prop] = value
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        cache.write_text(json.dumps(info), encoding="utf-8")
+    _project_info[key] = info
+    return info
+
+
+def _javac_options(workdir_path: Path, info: Dict[str, str], out_dir: str) -> List[str]:
+    """Options mirroring the Ant build: classpath, sourcepath, source level and encoding."""
+    opts = [
+        "-d", out_dir,
+        "-cp", info["cp.test"],
+        "-sourcepath", os.pathsep.join(str(workdir_path / info[p]) for p in ("dir.src.classes", "dir.src.tests")),
+        "-implicit:none", "-proc:none", "-nowarn", "-g:none",
+    ]
+    for name in ("build.xml", "maven-build.xml"):
+        bx = workdir_path / name
+        if bx.exists():
+            m = _ENCODING_RE.search(bx.read_text(encoding="utf-8", errors="replace"))
+            if m:
+                opts += ["-encoding", m.group(1)]
+                break
+    for name in ("defects4j.build.properties", "default.properties", "build.properties"):
+        pf = workdir_path / name
+        if pf.exists():
+            m = _SOURCE_LEVEL_RE.search(pf.read_text(encoding="utf-8", errors="replace"))
+            if m and "$" not in m.group(1):
+                opts += ["-source", m.group(1)]
+                break
+    return opts
+
+
+def server_compile(workdir: str, changed: set) -> Optional[Dict[str, Any]]:
+    """
+    Compile-gate result from the warm javac for the .java files that differ from HEAD, in
+    check_compile's format, or None when the answer is not conclusive and
+    `defects4j compile` must decide.
+    """
+    from agent.adapters.defects4j import _referencing_sources
+
+    workdir_path = Path(workdir)
+    if not changed:
+        # Nothing differs from HEAD: the checked-out version is known to compile
+        return {"ok": True, "rc": 0, "stdout": "", "stderr": "", "error_summary": "", "backend": "javac-server"}
+    try:
+        info = _project(workdir_path)
+        if info is None or not (workdir_path / info["dir.bin.classes"]).is_dir():
+            return None
+        sources = _referencing_sources(workdir_path, changed)
+        server = _get_server(_d4j_env())
+        if sources is None or server is None:
+            return None
+        with tempfile.TemporaryDirectory(prefix="javac_gate_") as out_dir:
+            files = [str((workdir_path / rel).resolve()) for rel in sorted(sources)]
+            rc, output = server.compile(_javac_options(workdir_path, info, out_dir) + files)
+    except Exception as e:
+        print(f"[D4J] javac server unavailable ({e}); using defects4j compile", file=sys.stderr, flush=True)
+        return None
+
+    if rc == 0:
+        return {"ok": True, "rc": 0, "stdout": "", "stderr": output[:2000], "error_summary": "", "backend": "javac-server"}
+    error_files = {str(Path(f).resolve()) for f in _ERROR_FILE_RE.findall(output)}
+    if rc != 1 or not error_files or not error_files <= set(files):
+        # Errors outside the compiled files (or none parsed): let the authoritative build decide
+        return None
+    error_lines = [line for line in output.splitlines() if "error:" in line.lower()]
+    return {
+        "ok": False,
+        "rc": rc,
+        "stdout": "",
+        "stderr": output[:2000],
+        "error_summary": "\n".join(error_lines[:10])[:2000],
+        "backend": "javac-server",
+    }
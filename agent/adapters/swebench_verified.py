@@ -1100,9 +1100,12 @@ class SWEbenchVerifiedAdapter(DatasetAdapter):
                 scratch_base = dataset_cfg.get("paths", {}).get("scratch_base") or os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")
                 asts_dir = resolve_path_template(asts_dir_template, scratch_base=scratch_base)
                 
-                # Flat format: {instance_id}_index.json
-                abcoder_index_path = asts_dir / f"{instance_id}_index.json"
-                
+                # Flat format: {instance_id}_index.json (or the compact _index.sqlite, preferred)
+                for ext in (".sqlite", ".json"):
+                    abcoder_index_path = asts_dir / f"{instance_id}_index{ext}"
+                    if abcoder_index_path.exists():
+                        break
+
                 if abcoder_index_path.exists():
                     index_path = str(abcoder_index_path)
                     print(f"[CHECKOUT] ✓ ABCoder index found: {index_path}", flush=True)
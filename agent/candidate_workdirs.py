@@ -0,0 +1,148 @@
+"""
+Private copies of a workdir for evaluating patch candidates concurrently.
+
+Each slot is a full copy of the workdir (reflinked where the filesystem supports it, so
+build output and untracked config come along) under
+$TRACE_WORK_ROOT/candidate_workdirs/<workdir name>-<process id>/<slot>/<workdir name>.
+The basename is kept because adapters derive the project/bug id from it. A slot is
+copied on first use, restored to HEAD (agent/workdir_snapshot.py) before every later
+use, and removed at exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from agent.workdir_snapshot import restore_workdir
+
+# Concurrent candidates per round (1 = evaluate them one by one in the workdir itself)
+PARALLEL_CANDIDATES = max(1, int(os.environ.get("TRACE_PARALLEL_CANDIDATES", "3")))
+
+
+def is_clean(workdir: str, ignore: Iterable[str] = ()) -> bool:
+    """
+    Whether the tracked files of workdir match HEAD (copies are restored to HEAD), apart
+    from the workdir-relative paths in ignore (e.g. build files the adapter patches).
+    """
+    r = subprocess.run(["git", "status", "--porcelain", "-uno", "--no-renames"], cwd=workdir, capture_output=True, text=True)
+    if r.returncode != 0:
+        return False
+    ignored = set(ignore)
+    return all(line[3:].strip('"') in ignored for line in r.stdout.splitlines() if line.strip())
+
+
+class CandidateWorkdirs:
+    """Lazily created copies of one workdir, handed out one slot per running candidate."""
+
+    def __init__(self, workdir: str, on_copy: Optional[Callable[[str, str], Any]] = None):
+        self.workdir = str(Path(workdir).resolve())
+        name = Path(self.workdir).name
+        self.root = Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")) / "candidate_workdirs" / f"{name}-{os.getpid()}"
+        self._on_copy = on_copy
+        self._copies: Dict[int, str] = {}
+        self._free: "queue.Queue[int]" = queue.Queue()
+        self._n_slots = 0
+        self._lock = threading.Lock()
+
+    def _prepare(self, slot: int) -> str:
+        path = self._copies.get(slot)
+        if path is not None:
+            if restore_workdir(path).get("ok"):
+                return path
+            del self._copies[slot]
+        dst = self.root / str(slot) / Path(self.workdir).name
+        shutil.rmtree(dst.parent, ignore_errors=True)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        r = subprocess.run(["cp", "-a", "--reflink=auto", self.workdir, str(dst)], capture_output=True)
+        if r.returncode != 0:
+            shutil.rmtree(dst, ignore_errors=True)
+            shutil.copytree(self.workdir, dst, symlinks=True)
+        if self._on_copy is not None:
+            self._on_copy(self.workdir, str(dst))
+        self._copies[slot] = str(dst)
+        return str(dst)
+
+    def run(self, fn: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """fn(copy_path) on a free slot (a new one if all are busy)."""
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                slot = self._n_slots
+                self._n_slots += 1
+        try:
+            try:
+                path = self._prepare(slot)
+            except (OSError, shutil.Error) as e:
+                return {"ok": False, "stage": "copy", "error": f"cannot copy workdir: {e}"}
+            return fn(path)
+        finally:
+            self._free.put(slot)
+
+    def close(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._copies.clear()
+
+
+_pools: Dict[str, CandidateWorkdirs] = {}
+_pools_lock = threading.Lock()
+
+
+def get_candidate_workdirs(workdir: str, on_copy: Optional[Callable[[str, str], Any]] = None) -> CandidateWorkdirs:
+    key = str(Path(workdir).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = CandidateWorkdirs(key, on_copy)
+        return pool
+
+
+@atexit.register
+def _remove_copies() -> None:
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+def evaluate_candidates(
+    workdirs: CandidateWorkdirs,
+    candidates: List[Any],
+    evaluate: Callable[[str, Any], Dict[str, Any]],
+    max_workers: int = PARALLEL_CANDIDATES,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    evaluate(copy_path, candidate) for each candidate on up to max_workers copies.
+
+    Results come back in candidate order. A candidate is not started once an earlier one
+    has passed (result["ok"]); its result is None. The first passing result is therefore
+    the same one trying the candidates in order would have picked.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(candidates)
+    best = [len(candidates)]
+    best_lock = threading.Lock()
+
+    def task(i: int) -> None:
+        if i > best[0]:
+            return
+        try:
+            res = workdirs.run(lambda path: evaluate(path, candidates[i]))
+        except Exception as e:
+            res = {"ok": False, "stage": "error", "error": str(e)}
+        results[i] = res
+        if res.get("ok"):
+            with best_lock:
+                best[0] = min(best[0], i)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="candidate") as ex:
+        list(ex.map(task, range(len(candidates))))
+    print(f"[INFO] Evaluated {sum(r is not None for r in results)}/{len(candidates)} patch candidates in parallel workdir copies",
+          file=sys.stderr, flush=True)
+    return results
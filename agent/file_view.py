@@ -0,0 +1,148 @@
+"""
+Shared line-indexed views of source files for read_file / read_span.
+
+Each file is memory-mapped once and scanned once for line boundaries; a line range is
+then served by slicing the mapping, so repeated reads of one large file cost O(span)
+instead of re-reading and splitting the whole file. Line numbering is exactly that of
+str.splitlines() on the decoded text.
+
+Views are dropped when agent.utils.invalidate_file_fingerprints reports an edit, and
+re-validated against the file's size and mtime on every access.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.utils import on_files_invalidated
+
+# UTF-8 encodings of the separators str.splitlines() recognizes (\r\n counts as one)
+_LINE_BREAK_RE = re.compile(rb"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+
+class _FileView:
+    """
+    One mapped file: start/end byte offsets of every line (separators excluded).
+
+    Valid UTF-8 (the common case) is indexed once over the mapping itself. Otherwise the
+    decode error handler can change where lines break (e.g. "\\r<bad bytes>\\n" is one break
+    under errors="ignore"), so each handler gets its own table over the re-encoded text.
+    """
+
+    def __init__(self, path: str, key: Tuple[int, int], data):
+        self.path = path
+        self.key = key
+        self._data = data
+        self._tables: Dict[str, Tuple[Any, array, array]] = {}
+        try:
+            str(data, "utf-8")
+            self._valid = True
+        except UnicodeDecodeError:
+            self._valid = False
+        self._lock = threading.Lock()
+
+    def _table(self, errors: str) -> Tuple[Any, array, array]:
+        tkey = "" if self._valid else errors
+        table = self._tables.get(tkey)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(tkey)
+                if table is None:
+                    data = self._data if self._valid else str(self._data, "utf-8", errors).encode("utf-8")
+                    starts, ends = array("Q"), array("Q")
+                    pos = 0
+                    for m in _LINE_BREAK_RE.finditer(data):
+                        starts.append(pos)
+                        ends.append(m.start())
+                        pos = m.end()
+                    if pos < len(data):
+                        starts.append(pos)
+                        ends.append(len(data))
+                    table = self._tables[tkey] = (data, starts, ends)
+        return table
+
+    def line_count(self, errors: str = "replace") -> int:
+        return len(self._table(errors)[1])
+
+    def lines(self, start: int, end: int, errors: str = "replace") -> List[str]:
+        """Decoded lines start..end (1-based, inclusive; clamped to the file)."""
+        data, starts, ends = self._table(errors)
+        lo, hi = max(1, start) - 1, min(end, len(starts))
+        if lo >= hi:
+            return []
+        # One slice for the whole span, then split at the known offsets
+        base = starts[lo]
+        chunk = data[base:ends[hi - 1]]
+        return [chunk[starts[i] - base:ends[i] - base].decode("utf-8", errors) for i in range(lo, hi)]
+
+
+class _FileViewCache:
+    """
+    Process-wide LRU of file views keyed by resolved path.
+
+    Dropped views are not closed explicitly: a concurrent reader may still hold one, and
+    the mapping is released once the last reference goes away.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, _FileView]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, p: Path) -> _FileView:
+        path = str(p.resolve())
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            view = self._entries.get(path)
+            if view is not None and view.key == key:
+                self._entries.move_to_end(path)
+                self._stats["hits"] += 1
+                return view
+            self._stats["misses"] += 1
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else b""
+        view = _FileView(path, key, data)
+        with self._lock:
+            self._entries[path] = view
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return view
+
+    def invalidate(self, paths: Optional[List[str]] = None) -> None:
+        with self._lock:
+            self._stats["invalidations"] += 1
+            if paths is None:
+                self._entries.clear()
+                return
+            for p in paths:
+                self._entries.pop(str(Path(p).resolve()), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._entries)
+            return out
+
+
+_FILE_VIEWS = _FileViewCache(max_entries=int(os.environ.get("TRACE_FILE_VIEW_MAX_ENTRIES", "64")))
+on_files_invalidated(_FILE_VIEWS.invalidate)
+
+
+def read_lines(path: Path, start: int, end: int, errors: str = "replace") -> Tuple[List[str], int]:
+    """(lines start..end, total line count) of a file, as if from read_text(errors=...).splitlines()."""
+    view = _FILE_VIEWS.get(path)
+    return view.lines(start, end, errors), view.line_count(errors)
+
+
+def get_file_view_stats() -> dict:
+    return _FILE_VIEWS.stats()
@@ -1,77 +1,205 @@
 import json
+import os
 import sys
-from typing import Dict, Any, Callable
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from agent.utils import get_cached_result, cache_tool_result
 
+# Tools without side effects on the workdir; they may run concurrently within one turn.
+# Everything else (apply_edits, apply_patch, check_compile, verify_*) runs alone, in order.
+READ_ONLY_TOOLS = frozenset({
+    "read_file",
+    "read_span",
+    "read_spans",
+    "search_in_files",
+    "symbol_lookup",
+    "find_references",
+    "explain_symbols",
+    "get_git_diff",
+})
+
+# The agent loop cuts serialized tool results longer than this; tools that return large
+# payloads (read_spans, explain_symbols) keep their JSON within it so it stays parseable.
+MAX_TOOL_RESULT_CHARS = 10000
+
 class ToolRuntime:
-    def __init__(self, func_map: Dict[str, Callable[..., Dict[str, Any]]]):
+    def __init__(
+        self,
+        func_map: Dict[str, Callable[..., Dict[str, Any]]],
+        workdir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        trace_path: Optional[str] = None,
+    ):
         self.func_map = func_map
+        # Resolves workdir-relative paths when keying cached results by file content
+        self.workdir = workdir
+        self.max_workers = max_workers if max_workers is not None else int(os.environ.get("TRACE_TOOL_WORKERS", "4"))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # One record per executed call (see tool_metrics); also appended to trace_path as JSONL
+        self.call_records: List[Dict[str, Any]] = []
+        self.trace_path = trace_path
+        # Localization working-set budget shared with explain_symbols (set by ablation.tools.setup_tools)
+        self.block_budget = None
 
-    def handle_tool_calls(self, tool_calls):
-        tool_messages = []
-        for tc in tool_calls:
-            name = tc.function.name
-            # Parse arguments with error handling
-            args_str = tc.function.arguments or "{}"
+    def _parse_args(self, name: str, args_str: str) -> Dict[str, Any]:
+        # Parse arguments with error handling
+        try:
+            args = json.loads(args_str)
+        except json.JSONDecodeError as e:
+            print(f"[WARN] Failed to parse tool call arguments for {name}: {e}", file=sys.stderr, flush=True)
+            print(f"[WARN] Arguments string (first 200 chars): {args_str[:200]}", file=sys.stderr, flush=True)
+            # Try to fix common JSON issues
+            # Remove any trailing incomplete JSON
+            args_str_clean = args_str.strip()
+            # Try to extract valid JSON by finding the last complete object
+            if args_str_clean and not args_str_clean.endswith('}'):
+                # Try to find the last complete JSON object
+                last_brace = args_str_clean.rfind('}')
+                if last_brace > 0:
+                    args_str_clean = args_str_clean[:last_brace + 1]
+                else:
+                    # If no closing brace, try to add one
+                    args_str_clean = args_str_clean.rstrip(',') + '}'
             try:
-                args = json.loads(args_str)
-            except json.JSONDecodeError as e:
-                print(f"[WARN] Failed to parse tool call arguments for {name}: {e}", file=sys.stderr, flush=True)
-                print(f"[WARN] Arguments string (first 200 chars): {args_str[:200]}", file=sys.stderr, flush=True)
-                # Try to fix common JSON issues
-                # Remove any trailing incomplete JSON
-                args_str_clean = args_str.strip()
-                # Try to extract valid JSON by finding the last complete object
-                if args_str_clean and not args_str_clean.endswith('}'):
-                    # Try to find the last complete JSON object
-                    last_brace = args_str_clean.rfind('}')
-                    if last_brace > 0:
-                        args_str_clean = args_str_clean[:last_brace + 1]
-                    else:
-                        # If no closing brace, try to add one
-                        args_str_clean = args_str_clean.rstrip(',') + '}'
-                try:
-                    args = json.loads(args_str_clean)
-                    print(f"[INFO] Successfully fixed JSON for {name}", file=sys.stderr, flush=True)
-                except json.JSONDecodeError:
-                    # If still fails, use empty dict
-                    print(f"[ERROR] Could not fix JSON for {name}, using empty dict", file=sys.stderr, flush=True)
-                    args = {}
-            
-            # Check if tool exists
-            if name not in self.func_map:
-                # Only expose tools that are in the current phase's schema, not all func_map tools
-                # This prevents LLM from discovering tools that shouldn't be available in the current phase
-                available_tools = ", ".join(sorted(self.func_map.keys()))
-                error_msg = f"Tool '{name}' is not available. Available tools: {available_tools}"
-                print(f"[ERROR] {error_msg}", file=sys.stderr, flush=True)
-                # Don't expose all func_map tools in the error message to avoid LLM discovering tools
-                # that shouldn't be available in the current phase (e.g., verify_red in patch phase)
-                result = {
-                    "ok": False,
-                    "error": f"Tool '{name}' is not available in the current phase.",
-                    # Don't include available_tools list to prevent LLM from discovering tools
-                    # that aren't in the current phase's schema
-                }
+                args = json.loads(args_str_clean)
+                print(f"[INFO] Successfully fixed JSON for {name}", file=sys.stderr, flush=True)
+            except json.JSONDecodeError:
+                # If still fails, use empty dict
+                print(f"[ERROR] Could not fix JSON for {name}, using empty dict", file=sys.stderr, flush=True)
+                args = {}
+        return args
+
+    def _execute(self, name: str, args: Dict[str, Any]) -> Tuple[Dict[str, Any], bool, float]:
+        """(result, served from cache, wall seconds) for one call."""
+        t0 = time.perf_counter()
+        cached = False
+        # Check if tool exists
+        if name not in self.func_map:
+            # Only expose tools that are in the current phase's schema, not all func_map tools
+            # This prevents LLM from discovering tools that shouldn't be available in the current phase
+            available_tools = ", ".join(sorted(self.func_map.keys()))
+            error_msg = f"Tool '{name}' is not available. Available tools: {available_tools}"
+            print(f"[ERROR] {error_msg}", file=sys.stderr, flush=True)
+            # Don't expose all func_map tools in the error message to avoid LLM discovering tools
+            # that shouldn't be available in the current phase (e.g., verify_red in patch phase)
+            result = {
+                "ok": False,
+                "error": f"Tool '{name}' is not available in the current phase.",
+                # Don't include available_tools list to prevent LLM from discovering tools
+                # that aren't in the current phase's schema
+            }
+        else:
+            # Check cache first
+            cached_result = get_cached_result(name, args, self.workdir)
+            if cached_result is not None:
+                print(f"[CACHE] Using cached result for {name}({json.dumps(args, ensure_ascii=False)[:100]}...)", file=sys.stderr, flush=True)
+                result = cached_result
+                cached = True
             else:
-                # Check cache first
-                cached_result = get_cached_result(name, args)
-                if cached_result is not None:
-                    print(f"[CACHE] Using cached result for {name}({json.dumps(args, ensure_ascii=False)[:100]}...)", file=sys.stderr, flush=True)
-                    result = cached_result
-                else:
-                    # Execute tool call
+                # Execute tool call; a raising tool becomes an error result so the rest of
+                # its batch survives and the call is still recorded (with error: True)
+                try:
                     result = self.func_map[name](**args)
+                except Exception as e:
+                    print(f"[ERROR] Tool {name} raised {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+                    result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                else:
                     # Cache the result
-                    cache_tool_result(name, args, result)
-            
-            tool_messages.append({
-                "role": "tool",
-                "tool_call_id": tc.id,
-                "name": name,
-                "content": json.dumps(result, ensure_ascii=False),
-            })
-        return tool_messages
+                    cache_tool_result(name, args, result, self.workdir)
+        return result, cached, time.perf_counter() - t0
+
+    def _run_batch(self, batch):
+        """Run one group of calls: concurrently when it holds several read-only calls."""
+        if len(batch) > 1 and self.max_workers > 1:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+            return list(self._pool.map(lambda c: self._execute(c[1], c[2]), batch))
+        return [self._execute(name, args) for _, name, args in batch]
 
+    def handle_tool_calls(self, tool_calls):
+        calls = []
+        for tc in tool_calls:
+            name = tc.function.name
+            calls.append((tc, name, self._parse_args(name, tc.function.arguments or "{}")))
+
+        # Consecutive read-only calls form one concurrent batch; every mutating call is a
+        # batch of its own, so calls still observe the effects of earlier calls in the turn.
+        batches, batch = [], []
+        for call in calls:
+            if call[1] in READ_ONLY_TOOLS or call[1] not in self.func_map:
+                batch.append(call)
+                continue
+            if batch:
+                batches.append(batch)
+                batch = []
+            batches.append([call])
+        if batch:
+            batches.append(batch)
+
+        tool_messages = []
+        records = []
+        for batch in batches:
+            for (tc, name, _), (result, cached, seconds) in zip(batch, self._run_batch(batch)):
+                content = json.dumps(result, ensure_ascii=False)
+                tool_messages.append({
+                    "role": "tool",
+                    "tool_call_id": tc.id,
+                    "name": name,
+                    "content": content,
+                })
+                records.append({
+                    "tool": name,
+                    "tool_call_id": tc.id,
+                    "seconds": round(seconds, 6),
+                    "chars": len(content),
+                    "bytes": len(content.encode("utf-8")),
+                    "cached": cached,
+                    "error": not (isinstance(result, dict) and result.get("ok")),
+                    "batch_size": len(batch),
+                })
+        self.call_records.extend(records)
+        if self.trace_path and records:
+            try:
+                with open(self.trace_path, "a", encoding="utf-8") as f:
+                    ts = time.time()
+                    for r in records:
+                        f.write(json.dumps({"ts": ts, **r}, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"[WARN] Failed to write tool trace {self.trace_path}: {e}", file=sys.stderr, flush=True)
+        return tool_messages
 
+    def tool_metrics(self) -> Dict[str, Any]:
+        """Per-tool totals and latency/payload percentiles over all calls handled so far."""
+        def pct(values: List[float], q: float) -> float:
+            s = sorted(values)
+            return s[min(len(s) - 1, int(round(q * (len(s) - 1))))] if s else 0
 
+        by_tool: Dict[str, List[Dict[str, Any]]] = {}
+        for r in self.call_records:
+            by_tool.setdefault(r["tool"], []).append(r)
+        out: Dict[str, Any] = {}
+        for name, recs in sorted(by_tool.items()):
+            ms = [r["seconds"] * 1000.0 for r in recs]
+            sizes = [r["bytes"] for r in recs]
+            out[name] = {
+                "calls": len(recs),
+                "errors": sum(1 for r in recs if r["error"]),
+                "cache_hits": sum(1 for r in recs if r["cached"]),
+                "total_seconds": round(sum(ms) / 1000.0, 3),
+                "p50_ms": round(pct(ms, 0.5), 2),
+                "p95_ms": round(pct(ms, 0.95), 2),
+                "max_ms": round(max(ms), 2),
+                "total_bytes": sum(sizes),
+                "p50_bytes": pct(sizes, 0.5),
+                "p95_bytes": pct(sizes, 0.95),
+                "max_bytes": max(sizes),
+            }
+        out["_total"] = {
+            "calls": len(self.call_records),
+            "errors": sum(1 for r in self.call_records if r["error"]),
+            "cache_hits": sum(1 for r in self.call_records if r["cached"]),
+            "total_seconds": round(sum(r["seconds"] for r in self.call_records), 3),
+            "total_bytes": sum(r["bytes"] for r in self.call_records),
+        }
+        return out
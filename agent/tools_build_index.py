@@ -4,23 +4,32 @@ Retrieval-index tools (replacement for ABCoder/LSP-based indexing).
 Implements the same tool API used by G2/TRACE localization:
 - symbol_lookup(index_path, symbol)
 - find_references(index_path, symbol)
-- read_span(path, start_line, end_line, workdir)
+- read_span(path, start_line, end_line, workdir[, index_path, snap_to_def, max_lines])
+- read_spans(spans, workdir[, max_chars]) (several spans in one call)
+- explain_symbols(index_path, symbols, workdir) (definitions, bodies and callers in one call)
 
 But changes the index building to a stable, reproducible, non-LSP pipeline:
-- Layer 1: structural index (Tree-sitter if usable; otherwise regex+brace fallback for Java)
+- Layer 1: structural index (Tree-sitter if usable; otherwise a single-pass scanner for Java)
 - Layer 2: (optional) CodeQL hooks can be added later to populate precise refs/edges
 
 Index schema follows the current retrieval index JSON format written to runs/index/....
+The same v1 content can also be written as SQLite ({bug_id}_index.sqlite), which the
+lookup tools open read-only and memory-mapped instead of parsing a JSON blob.
 """
 
 from __future__ import annotations
 
+import bisect
 import json
+import os
 import re
+import sqlite3
+import threading
 import time
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 # ----------------------------
@@ -57,11 +66,8 @@ def _safe_relpath(workdir: Path, p: Path) -> str:
         return str(p)
 
 
-def _score_symbol(query: str, cand: str) -> int:
-    """
-    Higher is better.
-    Prefer exact match, then suffix match, then substring match.
-    """
+def _normalize_symbol_query(query: str) -> str:
+    """Normalize a user/LLM symbol query the same way for scoring and candidate generation."""
     q = (query or "").strip()
     # Normalize common query formats used by prompts/LLMs
     q = q.replace("::", ".").replace("#", ".")
@@ -75,6 +81,14 @@ def _score_symbol(query: str, cand: str) -> int:
     if len(parts) >= 2 and parts[-1] == parts[-2]:
         parts[-1] = "<init>"
         q = ".".join(parts)
+    return q
+
+
+def _last_segment(s: str) -> str:
+    return s.split(".")[-1].split("::")[-1]
+
+
+def _score_normalized(q: str, cand: str) -> int:
     c = (cand or "").strip()
     if not q or not c:
         return 0
@@ -87,15 +101,88 @@ def _score_symbol(query: str, cand: str) -> int:
     if q in c:
         return 300 + min(50, len(q))
     # try last segment match (method name, class name)
-    q_last = q.split(".")[-1].split("::")[-1]
-    c_last = c.split(".")[-1].split("::")[-1]
+    q_last = _last_segment(q)
+    c_last = _last_segment(c)
     if q_last and q_last == c_last:
         return 250
     return 0
 
 
+def _score_symbol(query: str, cand: str) -> int:
+    """
+    Higher is better.
+    Prefer exact match, then suffix match, then substring match.
+    """
+    return _score_normalized(_normalize_symbol_query(query), cand)
+
+
+class _JoinedStrings:
+    """
+    Substring search over a fixed list of strings: one str.find sweep over the
+    newline-joined list instead of a Python-level `in` test per string.
+    """
+
+    def __init__(self, items: List[str]):
+        self.items = items
+        self._starts: List[int] = []
+        pos = 0
+        for it in items:
+            self._starts.append(pos)
+            pos += len(it) + 1
+        self._joined = "\n".join(items)
+
+    def containing(self, needle: str) -> set:
+        """Indices of items that contain needle."""
+        if not needle or "\n" in needle:
+            return {i for i, it in enumerate(self.items) if needle in it}
+        found = set()
+        joined, starts = self._joined, self._starts
+        pos = joined.find(needle)
+        while pos != -1:
+            i = bisect.bisect_right(starts, pos) - 1
+            found.add(i)
+            if i + 1 >= len(starts):
+                break
+            pos = joined.find(needle, starts[i + 1])
+        return found
+
+
+class _SymbolTable:
+    """
+    Candidate generator over a fixed list of symbols.
+
+    candidates(q) returns exactly the indices whose symbol can score > 0 against the
+    normalized query q, without calling _score_symbol on every symbol:
+    - q is a substring of c (exact/suffix/substring cases): _JoinedStrings search
+    - c is a suffix of q: hash lookups of every suffix of q
+    - same last segment: hash lookup
+    """
+
+    def __init__(self, symbols: List[str]):
+        self.symbols = [(s or "").strip() for s in symbols]
+        self.by_symbol: Dict[str, List[int]] = {}
+        self.by_last: Dict[str, List[int]] = {}
+        for i, c in enumerate(self.symbols):
+            if not c:
+                continue
+            self.by_symbol.setdefault(c, []).append(i)
+            self.by_last.setdefault(_last_segment(c), []).append(i)
+        self._text = _JoinedStrings(self.symbols)
+
+    def candidates(self, q: str) -> List[int]:
+        if not q:
+            return []
+        found = {i for i in self._text.containing(q) if self.symbols[i]}
+        for k in range(len(q)):
+            found.update(self.by_symbol.get(q[k:], ()))
+        q_last = _last_segment(q)
+        if q_last:
+            found.update(self.by_last.get(q_last, ()))
+        return sorted(found)
+
+
 # ----------------------------
-# Java structural index (regex+brace fallback)
+# Java structural index (single-pass scanner)
 # ----------------------------
 
 JAVA_KEYWORDS = {
@@ -103,312 +190,958 @@ JAVA_KEYWORDS = {
     "synchronized", "do", "try", "else", "case", "default",
 }
 
+# Comments and string/char literals are consumed whole, so braces, parens and
+# identifiers inside them never reach the state machine.
+_JAVA_SKIP = (
+    r"//[^\n]*"
+    r"|/\*.*?(?:\*/|\Z)"
+    r'|""".*?(?:"""|\Z)'
+    r'|"(?:[^"\\\n]|\\.)*"?'
+    r"|'(?:[^'\\\n]|\\.)*'?"
+)
 
-@dataclass
-class _ClassCtx:
-    name: str
-    brace_depth_enter: int
+# Declaration level (top level / class bodies): one token per match; every other
+# non-space character is its own token, so "ident (" adjacency is exact.
+_JAVA_TOKEN_RE = re.compile(_JAVA_SKIP + r"|(?:[^\W\d]|\$)[\w$]*|\d[\w.]*|\S", re.S)
 
+# Inside bodies only braces and '(' matter; every alternative starts with a fixed character,
+# so the regex engine skips everything else without trying identifier matches.
+_JAVA_BODY_RE = re.compile(_JAVA_SKIP + r"|[{}(]", re.S)
 
-def _strip_comments_and_strings(line: str, state: Dict[str, Any]) -> str:
-    """
-    Very small lexer to make brace counting and signature detection less wrong.
-    state contains: in_block_comment, in_string, in_char
+# Callee name before a '(', matched on the reversed source (group 2 marks an annotation).
+_JAVA_CALLEE_REV_RE = re.compile(r"\s*([\w$]+)(\s*@)?")
+
+_CLASS_KEYWORDS = ("class", "interface", "enum")
+
+
+def _scan_java_source(text: str) -> Tuple[List[List[Any]], List[List[Any]]]:
     """
-    out = []
-    i = 0
-    while i < len(line):
-        ch = line[i]
-        nxt = line[i + 1] if i + 1 < len(line) else ""
+    Single sweep over a Java source file.
 
-        if state.get("in_block_comment"):
-            if ch == "*" and nxt == "/":
-                state["in_block_comment"] = False
-                i += 2
-                continue
-            i += 1
+    Returns (defs, calls) without file paths:
+      defs:  [symbol, kind, start, end, sig] for classes, methods and constructors
+      calls: [callee, line, col] for "name(" sites in bodies and initializers
+    Lines are 1-based and follow str.splitlines (same numbering as read_span); col is 1-based.
+
+    Scopes are tracked on a stack of class / method / other-block frames, so every span
+    ends at its matching brace without rescanning the body. Declaration levels are
+    tokenized fully; inside bodies only braces, literals/comments and '(' are visited.
+    """
+    rev = text[::-1]
+    n_text = len(text)
+    starts = [0]
+    acc = 0
+    for ln in text.splitlines(True):
+        acc += len(ln)
+        starts.append(acc)
+    n_lines = len(starts) - 1
+
+    def line_of(pos: int) -> int:
+        return bisect.bisect_right(starts, pos)
+
+    defs: List[List[Any]] = []
+    calls: List[List[Any]] = []
+    pkg = ""
+    pkg_parts: Optional[List[str]] = None
+
+    # frame = [kind, def index (-1 for blocks), enum constants pending, reset member state on close]
+    stack: List[List[Any]] = []
+    class_names: List[str] = []
+    in_body = False
+
+    # Current member declaration (top level or directly in a class body)
+    decl_start = -1
+    has_eq = False
+    cand: Optional[str] = None
+    parens = 0
+    class_kw: Optional[str] = None
+    class_name: Optional[str] = None
+    anno = 0  # 1: after '@', 2: after annotation name, 3: inside annotation arguments
+    anno_depth = 0
+
+    prev = ""
+    prev_pos = 0
+    prev_ident = False
+    prev2 = ""
+
+    def symbol_for(member: str) -> str:
+        fqn = "$".join(class_names)
+        owner = f"{pkg}.{fqn}" if pkg else fqn
+        return f"{owner}.{member}" if member else owner
+
+    def add_call(name: str, pos: int) -> None:
+        ln = line_of(pos)
+        calls.append([name, ln, pos - starts[ln - 1] + 1])
+
+    pos = 0
+    while pos < n_text:
+        if in_body:
+            for m in _JAVA_BODY_RE.finditer(text, pos):
+                tok = m.group()
+                if tok == "(":
+                    r = _JAVA_CALLEE_REV_RE.match(rev, n_text - m.start())
+                    if r is not None and r.group(2) is None:
+                        name = r.group(1)[::-1]
+                        if not name[0].isdigit() and name not in JAVA_KEYWORDS:
+                            add_call(name, n_text - r.end(1))
+                elif tok == "{":
+                    stack.append(["block", -1, False, False])
+                elif tok == "}":
+                    _, idx, _, reset = stack.pop()
+                    if idx >= 0:
+                        defs[idx][3] = line_of(m.start())
+                    if not stack or stack[-1][0] == "class":
+                        in_body = False
+                        prev, prev_ident, prev2 = "}", False, ""
+                        if reset:
+                            decl_start, has_eq, cand, parens, class_kw, class_name = -1, False, None, 0, None, None
+                        pos = m.end()
+                        break
+            else:
+                pos = n_text
             continue
 
-        if state.get("in_string"):
-            if ch == "\\":
-                i += 2
+        for m in _JAVA_TOKEN_RE.finditer(text, pos):
+            tok = m.group()
+            c = tok[0]
+            if c == "/" and len(tok) > 1 and tok[1] in "/*":
                 continue
-            if ch == "\"":
-                state["in_string"] = False
-            i += 1
-            continue
 
-        if state.get("in_char"):
-            if ch == "\\":
-                i += 2
+            if anno:
+                if anno == 3:
+                    if tok == "(":
+                        anno_depth += 1
+                    elif tok == ")":
+                        anno_depth -= 1
+                        if anno_depth == 0:
+                            anno = 0
+                    continue
+                if anno == 1 and tok != "interface" and (c.isalpha() or c in "_$"):
+                    anno = 2
+                    continue
+                if anno == 2 and tok == ".":
+                    anno = 1
+                    continue
+                if anno == 2 and tok == "(":
+                    anno = 3
+                    anno_depth = 1
+                    continue
+                anno = 0
+
+            frame = stack[-1] if stack else None
+            if tok == "{":
+                if parens == 0 and class_name is not None:
+                    class_names.append(class_name)
+                    defs.append([symbol_for(""), "class", line_of(decl_start if decl_start >= 0 else m.start()), 0, class_kw])
+                    stack.append(["class", len(defs) - 1, class_kw == "enum", True])
+                elif parens == 0 and cand is not None and not has_eq and frame is not None:
+                    kind, name = ("constructor", "<init>") if cand == class_names[-1] else ("method", cand)
+                    defs.append([symbol_for(name), kind, line_of(decl_start), 0, " ".join(text[decl_start:m.end()].split())[:200]])
+                    stack.append(["method", len(defs) - 1, False, True])
+                    in_body = True
+                else:
+                    # initializer / array / anonymous-class / lambda body; member state survives
+                    # only for field initializers (closed later by ';')
+                    stack.append(["block", -1, False, parens == 0 and not has_eq])
+                    in_body = True
+                if stack[-1][3]:
+                    decl_start, has_eq, cand, parens, class_kw, class_name = -1, False, None, 0, None, None
+                if in_body:
+                    pos = m.end()
+                    break
+            elif tok == "}":
+                if stack:
+                    _, idx, _, _ = stack.pop()
+                    defs[idx][3] = line_of(m.start())
+                    class_names.pop()
+                    decl_start, has_eq, cand, parens, class_kw, class_name = -1, False, None, 0, None, None
+            elif pkg_parts is not None:
+                if tok == ";":
+                    pkg = "".join(pkg_parts)
+                    pkg_parts = None
+                    decl_start = -1
+                else:
+                    pkg_parts.append(tok)
                 continue
-            if ch == "'":
-                state["in_char"] = False
-            i += 1
-            continue
+            elif tok == "@":
+                anno = 1
+                continue
+            elif tok == "package" and frame is None and decl_start < 0:
+                pkg_parts = []
+                continue
+            else:
+                if tok in _CLASS_KEYWORDS and prev != "." and class_kw is None:
+                    class_kw = tok
+                elif class_kw is not None and class_name is None and (c.isalpha() or c in "_$"):
+                    class_name = tok
+                if decl_start < 0 and tok not in (";", ","):
+                    decl_start = m.start()
+                if tok == "(":
+                    if prev_ident and prev not in JAVA_KEYWORDS and frame is not None and class_kw is None:
+                        if parens == 0 and not frame[2] and cand is None and not has_eq:
+                            cand = prev
+                        elif (has_eq or parens > 0) and prev2 != "@":
+                            # field initializer / enum constant argument
+                            add_call(prev, prev_pos)
+                    parens += 1
+                elif tok == ")":
+                    parens = max(0, parens - 1)
+                elif parens == 0:
+                    if tok == "=":
+                        has_eq = True
+                    elif tok == ";" or (tok == "," and frame is not None and frame[2]):
+                        if tok == ";" and frame is not None and frame[2]:
+                            frame[2] = False  # end of enum constants
+                        elif tok == ";" and cand is not None and not has_eq and frame is not None:
+                            # abstract / interface / annotation-type method (no body)
+                            kind, name = ("constructor", "<init>") if cand == class_names[-1] else ("method", cand)
+                            defs.append([symbol_for(name), kind, line_of(decl_start), line_of(m.start()),
+                                         " ".join(text[decl_start:m.end()].split())[:200]])
+                        decl_start, has_eq, cand, class_kw, class_name = -1, False, None, None, None
+
+            prev2 = prev
+            prev = tok
+            prev_pos = m.start()
+            prev_ident = c.isalpha() or c in "_$"
+        else:
+            pos = n_text
+
+    for _, idx, _, _ in stack:
+        if idx >= 0:
+            defs[idx][3] = n_lines
+    return defs, calls
+
+
+# ----------------------------
+# Python structural index (stdlib ast)
+# ----------------------------
+
+def _python_module_name(rel: str) -> str:
+    """Dotted module for a repo-relative .py path (src/ and lib/ layouts stripped)."""
+    parts = list(Path(rel).with_suffix("").parts)
+    if len(parts) > 1 and parts[0] in ("src", "lib"):
+        parts = parts[1:]
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _ast_index_python_source(text: str, module: str) -> Tuple[List[List[Any]], List[List[Any]]]:
+    """
+    (defs, calls) for a Python module from the stdlib parser, same shape as the Java indexers:
+    classes, module-level functions and methods (nested classes qualified by their enclosing
+    classes; defs inside functions are skipped), and every call site (callee = name or attribute).
+    Raises SyntaxError/ValueError when the running interpreter cannot parse the file.
+    """
+    import ast
+
+    tree = ast.parse(text)
+    lines = text.split("\n")
+    # ast counts lines by newline tokens; read_span numbers lines like str.splitlines
+    remap: Optional[Callable[[int], int]] = None
+    if len(text.splitlines()) != len(text.rstrip("\n").split("\n")) or "\r" in text:
+        nl_starts = [0]
+        for ln in text.splitlines(True):
+            nl_starts.append(nl_starts[-1] + len(ln))
+        ast_starts = [0]
+        for m in re.finditer(r"\r\n|\r|\n", text):
+            ast_starts.append(m.end())
+        remap = lambda ln: bisect.bisect_right(nl_starts, ast_starts[min(ln, len(ast_starts)) - 1])  # noqa: E731
+        lines = [text[ast_starts[i]:(ast_starts[i + 1] if i + 1 < len(ast_starts) else len(text))]
+                 for i in range(len(ast_starts))]
+
+    def char_col(ln: int, byte_col: int) -> int:
+        line = lines[ln - 1] if 0 < ln <= len(lines) else ""
+        if line.isascii():
+            return byte_col + 1
+        return len(line.encode("utf-8")[:byte_col].decode("utf-8", "ignore")) + 1
+
+    def out_line(ln: int) -> int:
+        return remap(ln) if remap is not None else ln
+
+    def header(node: Any) -> str:
+        # Source from the def/class keyword up to the first body statement
+        first = node.body[0] if node.body else None
+        if first is not None and getattr(first, "decorator_list", None):
+            first = first.decorator_list[0]
+        end_ln = first.lineno if first is not None else node.end_lineno
+        seg = lines[node.lineno - 1:end_ln]
+        if not seg:
+            return ""
+        if first is not None:
+            # decorator nodes start after their "@"
+            cut = first.col_offset - (1 if first is not node.body[0] else 0)
+            seg[-1] = seg[-1].encode("utf-8")[:max(cut, 0)].decode("utf-8", "ignore")
+        seg[0] = seg[0].encode("utf-8")[node.col_offset:].decode("utf-8", "ignore")
+        return " ".join(" ".join(seg).split())[:200]
+
+    defs: List[List[Any]] = []
+
+    def visit(body: List[Any], owners: List[str]) -> None:
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                defs.append([".".join([p for p in [module] + owners + [node.name] if p]), "class",
+                             out_line(node.lineno), out_line(node.end_lineno), header(node)])
+                visit(node.body, owners + [node.name])
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                defs.append([".".join([p for p in [module] + owners + [node.name] if p]),
+                             "method" if owners else "function",
+                             out_line(node.lineno), out_line(node.end_lineno), header(node)])
+            else:
+                # defs under if/try/with blocks at module or class level
+                for field_name in ("body", "orelse", "finalbody", "handlers"):
+                    sub = getattr(node, field_name, None)
+                    if isinstance(sub, list):
+                        visit(sub, owners)
+
+    visit(tree.body, [])
+
+    sites: List[Tuple[int, int, str]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            f = node.func
+            if isinstance(f, ast.Name):
+                sites.append((f.lineno, f.col_offset, f.id))
+            elif isinstance(f, ast.Attribute):
+                sites.append((f.end_lineno, f.end_col_offset - len(f.attr.encode("utf-8")), f.attr))
+    sites.sort()
+    calls = [[name, out_line(ln), char_col(ln, col)] for ln, col, name in sites]
+    return defs, calls
+
+
+# ----------------------------
+# Tree-sitter engine (optional: tree-sitter + grammar wheels)
+# ----------------------------
+
+_TS_QUERIES = {
+    "java": """
+(class_declaration name: (identifier)) @class
+(interface_declaration name: (identifier)) @class
+(enum_declaration name: (identifier)) @class
+(annotation_type_declaration name: (identifier)) @class
+(method_declaration name: (identifier)) @method
+(constructor_declaration name: (identifier)) @method
+(annotation_type_element_declaration name: (identifier)) @method
+(method_invocation name: (identifier) @call)
+(explicit_constructor_invocation constructor: (_) @call)
+(object_creation_expression type: (_) @new)
+""",
+    "python": """
+(class_definition name: (identifier)) @class
+(function_definition name: (identifier)) @function
+(call function: (identifier) @call)
+(call function: (attribute attribute: (identifier) @call))
+""",
+}
+
+_TS_JAVA_CLASS_TYPES = {
+    "class_declaration": "class",
+    "interface_declaration": "interface",
+    "enum_declaration": "enum",
+    "annotation_type_declaration": "interface",
+}
+_TS_JAVA_BODY_TYPES = {"class_body", "interface_body", "enum_body", "enum_body_declarations", "annotation_type_body"}
+
+# language -> (parser, query, captures) once loaded in this process, None if unavailable
+_TS_LANGS: Dict[str, Any] = {}
+
+
+def _ts_load(language: str) -> Optional[Tuple[Any, Any, Callable[[Any, Any], Any]]]:
+    """
+    Parser + compiled query for a language, or None when tree-sitter or its grammar is missing.
+    Supports the per-language grammar wheels (tree-sitter >= 0.22) and tree_sitter_languages (< 0.22).
+    """
+    if language in _TS_LANGS:
+        return _TS_LANGS[language]
+    loaded = None
+    try:
+        import importlib
+        import tree_sitter
+
+        try:
+            lang = tree_sitter.Language(importlib.import_module(f"tree_sitter_{language}").language())
+        except (ImportError, TypeError):
+            import tree_sitter_languages
+            lang = tree_sitter_languages.get_language(language)
+        try:
+            parser = tree_sitter.Parser(lang)
+        except TypeError:
+            parser = tree_sitter.Parser()
+            parser.set_language(lang)
+        try:
+            query = tree_sitter.Query(lang, _TS_QUERIES[language])
+        except (AttributeError, TypeError):
+            query = lang.query(_TS_QUERIES[language])
+        if hasattr(tree_sitter, "QueryCursor"):
+            cursor_cls = tree_sitter.QueryCursor
+            captures = lambda q, node: cursor_cls(q).captures(node)  # noqa: E731
+        else:
+            captures = lambda q, node: q.captures(node)  # noqa: E731
+        loaded = (parser, query, captures)
+    except Exception:
+        loaded = None
+    _TS_LANGS[language] = loaded
+    return loaded
+
+
+def _ts_captures(loaded: Tuple[Any, Any, Callable[[Any, Any], Any]], root: Any) -> Dict[str, List[Any]]:
+    _, query, captures = loaded
+    res = captures(query, root)
+    if isinstance(res, dict):
+        return res
+    # tree-sitter < 0.23 returns [(node, capture_name), ...]
+    out: Dict[str, List[Any]] = {}
+    for node, name in res:
+        out.setdefault(name, []).append(node)
+    return out
+
+
+def _ts_positions(text: str, src: bytes) -> Tuple[Callable[[int], int], Callable[[int, int], int]]:
+    """
+    Byte offset -> 1-based line (str.splitlines numbering, like read_span) and 1-based column.
+    """
+    starts = [0]
+    acc = 0
+    ascii_only = len(src) == len(text)
+    for ln in text.splitlines(True):
+        acc += len(ln) if ascii_only else len(ln.encode("utf-8"))
+        starts.append(acc)
+
+    def line_of(b: int) -> int:
+        return bisect.bisect_right(starts, b)
+
+    def col_of(b: int, line: int) -> int:
+        if ascii_only:
+            return b - starts[line - 1] + 1
+        return len(src[starts[line - 1]:b].decode("utf-8", "ignore")) + 1
+
+    return line_of, col_of
+
 
-        # entering comment/string/char
-        if ch == "/" and nxt == "/":
+def _ts_index_java_source(text: str, loaded: Tuple[Any, Any, Callable[[Any, Any], Any]]) -> Tuple[List[List[Any]], List[List[Any]]]:
+    """
+    Same (defs, calls) shape as _scan_java_source, from a tree-sitter parse.
+    Files the grammar cannot parse cleanly fall back to the scanner.
+    """
+    src = text.encode("utf-8")
+    root = loaded[0].parse(src).root_node
+    if root.has_error:
+        return _scan_java_source(text)
+    line_of, col_of = _ts_positions(text, src)
+
+    def node_text(n: Any) -> str:
+        return src[n.start_byte:n.end_byte].decode("utf-8", "ignore")
+
+    pkg = ""
+    for child in root.children:
+        if child.type == "package_declaration":
+            for part in child.named_children:
+                if part.type in ("scoped_identifier", "identifier"):
+                    pkg = node_text(part)
             break
-        if ch == "/" and nxt == "*":
-            state["in_block_comment"] = True
-            i += 2
-            continue
-        if ch == "\"":
-            state["in_string"] = True
-            i += 1
-            continue
-        if ch == "'":
-            state["in_char"] = True
-            i += 1
-            continue
 
-        out.append(ch)
-        i += 1
-    return "".join(out)
+    def owner_names(node: Any) -> Optional[List[str]]:
+        # Enclosing class names, or None inside local/anonymous class scopes (as the scanner)
+        names: List[str] = []
+        p = node.parent
+        while p is not None and p.type != "program":
+            if p.type in _TS_JAVA_CLASS_TYPES:
+                names.append(node_text(p.child_by_field_name("name")))
+            elif p.type not in _TS_JAVA_BODY_TYPES:
+                return None
+            p = p.parent
+        names.reverse()
+        return names
+
+    caps = _ts_captures(loaded, root)
+    found: List[Tuple[int, List[Any]]] = []
+    for capture in ("class", "method"):
+        for node in caps.get(capture, []):
+            owners = owner_names(node)
+            if owners is None or (capture == "method" and not owners):
+                continue
+            name = node_text(node.child_by_field_name("name"))
+            fqn = "$".join(owners + [name] if capture == "class" else owners)
+            owner = f"{pkg}.{fqn}" if pkg else fqn
+            # Declaration starts after leading annotations
+            start = node.start_byte
+            for child in node.children:
+                if child.type == "modifiers":
+                    plain = [g for g in child.children if g.type not in ("annotation", "marker_annotation")]
+                    if not plain:
+                        continue
+                    start = plain[0].start_byte
+                else:
+                    start = child.start_byte
+                break
+            end_line = line_of(max(node.start_byte, node.end_byte - 1))
+            if capture == "class":
+                found.append((node.start_byte, [owner, "class", line_of(start), end_line, _TS_JAVA_CLASS_TYPES[node.type]]))
+                continue
+            body = node.child_by_field_name("body")
+            sig_end = body.start_byte + 1 if body is not None else node.end_byte
+            kind, member = ("constructor", "<init>") if node.type == "constructor_declaration" else ("method", name)
+            found.append((node.start_byte, [f"{owner}.{member}", kind, line_of(start), end_line,
+                                            " ".join(src[start:sig_end].decode("utf-8", "ignore").split())[:200]]))
+    found.sort(key=lambda t: t[0])
+
+    sites: List[Tuple[int, str]] = [(n.start_byte, node_text(n)) for n in caps.get("call", [])]
+    for n in caps.get("new", []):
+        # new a.b.Foo<Bar>(...) -> Foo
+        sites.append((n.start_byte, node_text(n).split("<", 1)[0].rsplit(".", 1)[-1].strip()))
+    sites.sort(key=lambda t: t[0])
+    calls: List[List[Any]] = []
+    for b, name in sites:
+        ln = line_of(b)
+        calls.append([name, ln, col_of(b, ln)])
+    return [d for _, d in found], calls
+
+
+def _ts_index_python_source(
+    text: str,
+    module: str,
+    loaded: Tuple[Any, Any, Callable[[Any, Any], Any]],
+) -> Tuple[List[List[Any]], List[List[Any]]]:
+    """
+    (defs, calls) for a Python module: classes, module-level functions and methods
+    (nested classes qualified by their enclosing classes; defs inside functions are skipped).
+    """
+    src = text.encode("utf-8")
+    root = loaded[0].parse(src).root_node
+    line_of, col_of = _ts_positions(text, src)
+
+    def node_text(n: Any) -> str:
+        return src[n.start_byte:n.end_byte].decode("utf-8", "ignore")
+
+    def owner_names(node: Any) -> Optional[List[str]]:
+        names: List[str] = []
+        p = node.parent
+        while p is not None and p.type != "module":
+            if p.type == "class_definition":
+                names.append(node_text(p.child_by_field_name("name")))
+            elif p.type in ("function_definition", "lambda"):
+                return None
+            p = p.parent
+        names.reverse()
+        return names
+
+    caps = _ts_captures(loaded, root)
+    found: List[Tuple[int, List[Any]]] = []
+    for capture in ("class", "function"):
+        for node in caps.get(capture, []):
+            owners = owner_names(node)
+            if owners is None:
+                continue
+            name = node_text(node.child_by_field_name("name"))
+            symbol = ".".join([p for p in [module] + owners + [name] if p])
+            if capture == "class":
+                kind = "class"
+            else:
+                kind = "method" if owners else "function"
+            body = node.child_by_field_name("body")
+            sig_end = body.start_byte if body is not None else node.end_byte
+            sig = " ".join(src[node.start_byte:sig_end].decode("utf-8", "ignore").split())[:200]
+            found.append((node.start_byte, [symbol, kind, line_of(node.start_byte),
+                                            line_of(max(node.start_byte, node.end_byte - 1)), sig]))
+    found.sort(key=lambda t: t[0])
+
+    calls: List[List[Any]] = []
+    for n in sorted(caps.get("call", []), key=lambda n: n.start_byte):
+        ln = line_of(n.start_byte)
+        calls.append([node_text(n), ln, col_of(n.start_byte, ln)])
+    return [d for _, d in found], calls
 
 
-def _find_block_end(lines: List[str], start_idx: int) -> int:
+# ----------------------------
+# Layer-1 build driver
+# ----------------------------
+
+# Per-(language, engine) output version; bump whenever that indexer's output changes,
+# so stale per-file cache entries are ignored.
+_INDEXER_VERSIONS = {
+    ("java", "scanner"): "java-l1-2",
+    ("java", "treesitter"): "java-ts-1",
+    ("python", "treesitter"): "py-ts-1",
+    ("python", "ast"): "py-ast-1",
+}
+
+# Languages whose symbols are derived from the file path (module name), so cache keys include it
+_PATH_QUALIFIED_LANGUAGES = ("python",)
+
+INDEX_ENGINES = ("auto", "treesitter", "scanner", "ast")
+
+
+def _resolve_engine(language: str, engine: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
     """
-    Find end line (1-based) for the block that starts with an opening '{'
-    somewhere on lines[start_idx:].
+    (engine, error). "auto": the stdlib ast for Python; for Java tree-sitter when its
+    grammar is installed, else the scanner.
     """
-    state = {"in_block_comment": False, "in_string": False, "in_char": False}
-    depth = 0
-    started = False
-    for i in range(start_idx, len(lines)):
-        s = _strip_comments_and_strings(lines[i], state)
-        for ch in s:
-            if ch == "{":
-                depth += 1
-                started = True
-            elif ch == "}":
-                if started:
-                    depth -= 1
-                    if depth == 0:
-                        return i + 1  # 1-based
-    return len(lines)
+    eng = (engine or "auto").lower()
+    if eng not in INDEX_ENGINES:
+        return None, f"unknown index engine: {engine} (expected one of {', '.join(INDEX_ENGINES)})"
+    if not any(lang == language for lang, _ in _INDEXER_VERSIONS):
+        return None, f"language not supported yet: {language}"
+    if eng == "auto":
+        if language == "python":
+            return "ast", None
+        return ("treesitter" if _ts_load(language) is not None else "scanner"), None
+    if eng == "treesitter" and _ts_load(language) is None:
+        return None, f"tree-sitter grammar for {language} is not installed"
+    if (language, eng) not in _INDEXER_VERSIONS:
+        return None, f"index engine {eng} does not support {language}"
+    return eng, None
+
+
+def _iter_python_files(workdir: Path) -> List[Path]:
+    files: List[Path] = []
+    for root, dirs, names in os.walk(workdir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in ("__pycache__", "node_modules", "site-packages")]
+        files.extend(Path(root) / n for n in names if n.endswith(".py"))
+    files.sort(key=lambda p: str(p))
+    return files
 
 
-_PACKAGE_RE = re.compile(r"^\s*package\s+([a-zA-Z0-9_.]+)\s*;")
-_CLASS_RE = re.compile(r"\b(class|interface|enum)\s+([A-Za-z_][A-Za-z0-9_]*)\b")
+def _source_files(workdir: Path, language: str) -> List[Path]:
+    if language == "python":
+        return _iter_python_files(workdir)
+    return _iter_code_files(workdir, ["src/main/java", "src/test/java"], (".java",))
 
 
-def _looks_like_method_decl(line: str) -> bool:
-    # quick filters
-    if "(" not in line or ")" not in line or "{" not in line:
-        return False
-    s = line.strip()
-    if not s:
-        return False
-    if s.startswith("@"):
-        return False
-    head = s.split(None, 1)[0]
-    if head in JAVA_KEYWORDS:
-        return False
-    if s.startswith(("if", "for", "while", "switch", "catch", "try")):
-        return False
-    if s.endswith(";"):
-        return False
-    return True
+def _index_file(workdir: Path, fp: Path, language: str, engine: str) -> Tuple[List[List[Any]], List[List[Any]]]:
+    """Layer-1 (defs, calls) for one file, without paths (see _unpack_file_result)."""
+    text = _read_text(fp)
+    if language == "python":
+        module = _python_module_name(_safe_relpath(workdir, fp))
+        if engine == "ast":
+            try:
+                return _ast_index_python_source(text, module)
+            except (SyntaxError, ValueError):
+                # Not parseable by this interpreter (e.g. Python 2 files): tree-sitter if present
+                pass
+        loaded = _ts_load(language)
+        return _ts_index_python_source(text, module, loaded) if loaded is not None else ([], [])
+    if engine == "treesitter":
+        loaded = _ts_load(language)
+        if loaded is not None:
+            return _ts_index_java_source(text, loaded)
+    return _scan_java_source(text)
+
+
+def _index_file_task(args: Tuple[str, str, str, str]) -> Tuple[List[List[Any]], List[List[Any]]]:
+    # Top-level (picklable) entry point for process-pool workers
+    workdir, fp, language, engine = args
+    return _index_file(Path(workdir), Path(fp), language, engine)
+
+
+def _default_file_cache_dir() -> Optional[Path]:
+    """TRACE_INDEX_FILE_CACHE (path, or "off"); default under TRACE_WORK_ROOT."""
+    v = os.environ.get("TRACE_INDEX_FILE_CACHE")
+    if v is not None:
+        return None if v.strip().lower() in ("", "0", "off", "none", "false") else Path(v)
+    return Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")) / "index_file_cache"
 
 
-def _extract_method_name(line: str) -> Optional[str]:
-    # Remove generics noise a bit
-    # Try to capture "... name ( ... ) {"
-    m = re.search(r"([A-Za-z_][A-Za-z0-9_]*)\s*\(", line)
-    if not m:
-        return None
-    name = m.group(1)
-    if name in JAVA_KEYWORDS:
-        return None
-    return name
+class _FileIndexCache:
+    """
+    Content-addressed per-file Layer-1 results: sha1(file bytes) -> defs/calls.
+
+    Entries do not contain the file path (it is re-attached on load), so one entry serves
+    every bug/revision that ships the same file. Stored in one SQLite file per cache dir;
+    concurrent builders are serialized by SQLite's own locking.
+    """
+
+    _SCHEMA = "CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, defs TEXT NOT NULL, calls TEXT NOT NULL)"
+
+    def __init__(self, cache_dir: Path):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_dir / "files.sqlite"), timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(self._SCHEMA)
+
+    @staticmethod
+    def key(data: bytes, version: str, rel: Optional[str] = None) -> str:
+        import hashlib
+        h = hashlib.sha1(data)
+        if rel is not None:
+            h.update(b"\0" + rel.encode("utf-8"))
+        return f"{version}:{h.hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, Tuple[List[List[Any]], List[List[Any]]]]:
+        found: Dict[str, Tuple[List[List[Any]], List[List[Any]]]] = {}
+        uniq = sorted(set(keys))
+        for i in range(0, len(uniq), 500):
+            chunk = uniq[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT key, defs, calls FROM files WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for k, d, c in rows:
+                found[k] = (json.loads(d), json.loads(c))
+        return found
+
+    def put_many(self, items: Dict[str, Tuple[List[List[Any]], List[List[Any]]]]) -> None:
+        if not items:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                [(k, json.dumps(d, ensure_ascii=False), json.dumps(c, ensure_ascii=False)) for k, (d, c) in items.items()],
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _unpack_file_result(rel: str, packed: Tuple[List[List[Any]], List[List[Any]]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    defs, calls = packed
+    # Fixed key order, so cached and fresh builds serialize identically
+    return ([{"symbol": d[0], "kind": d[1], "path": rel, "start": d[2], "end": d[3], "sig": d[4]} for d in defs],
+            [{"text": c[0], "path": rel, "line": c[1], "col": c[2]} for c in calls])
+
+
+def _build_struct_index(
+    workdir: Path,
+    language: str = "java",
+    workers: int = 1,
+    cache_dir: Optional[Path] = None,
+    engine: str = "scanner",
+) -> Dict[str, Any]:
+    """
+    Layer-1 index: Java over src/main/java and src/test/java, Python over all .py files.
 
+    With workers > 1 files are sharded across a process pool; results are merged in
+    the same deterministic file order, so the output is identical to the serial build.
+    With cache_dir, files whose bytes were already indexed (any bug/revision) are not reparsed.
+    """
+    files = _source_files(workdir, language)
+    version = _INDEXER_VERSIONS[(language, engine)]
+    rels = [_safe_relpath(workdir, fp) for fp in files]
 
-def _build_java_struct_index(workdir: Path) -> Dict[str, Any]:
-    roots = ["src/main/java", "src/test/java"]
-    files = _iter_code_files(workdir, roots, (".java",))
+    cache: Optional[_FileIndexCache] = None
+    if cache_dir is not None:
+        try:
+            cache = _FileIndexCache(cache_dir)
+        except (OSError, sqlite3.Error) as e:
+            import sys
+            print(f"[WARN] index file cache unavailable at {cache_dir}: {e}", file=sys.stderr, flush=True)
+    keys: List[Optional[str]] = [None] * len(files)
+    cached: Dict[str, Tuple[List[List[Any]], List[List[Any]]]] = {}
+    if cache is not None:
+        path_qualified = language in _PATH_QUALIFIED_LANGUAGES
+        for n, fp in enumerate(files):
+            try:
+                keys[n] = _FileIndexCache.key(fp.read_bytes(), version, rels[n] if path_qualified else None)
+            except OSError:
+                keys[n] = None
+        cached = cache.get_many([k for k in keys if k])
+
+    todo = [n for n, k in enumerate(keys) if k is None or k not in cached]
+    if workers > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        tasks = [(str(workdir), str(files[n]), language, engine) for n in todo]
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            fresh = list(ex.map(_index_file_task, tasks, chunksize=chunksize))
+    else:
+        fresh = [_index_file(workdir, files[n], language, engine) for n in todo]
+    fresh_by_file = dict(zip(todo, fresh))
 
     defs: List[Dict[str, Any]] = []
     fallback_calls: List[Dict[str, Any]] = []
+    new_entries: Dict[str, Tuple[List[List[Any]], List[List[Any]]]] = {}
+    for n in range(len(files)):
+        if n in fresh_by_file:
+            packed = fresh_by_file[n]
+            if keys[n]:
+                new_entries[keys[n]] = packed
+        else:
+            packed = cached[keys[n]]
+        file_defs, file_calls = _unpack_file_result(rels[n], packed)
+        defs.extend(file_defs)
+        fallback_calls.extend(file_calls)
 
-    for fp in files:
-        rel = _safe_relpath(workdir, fp)
-        content = _read_text(fp)
-        lines = content.splitlines()
+    stats = {"files": len(files), "parsed": len(todo), "reused": len(files) - len(todo)}
+    if cache is not None:
+        try:
+            cache.put_many(new_entries)
+        finally:
+            cache.close()
 
-        pkg = ""
-        for ln in lines[:50]:
-            m = _PACKAGE_RE.match(ln)
-            if m:
-                pkg = m.group(1)
-                break
+    return {"defs": defs, "fallback_calls": fallback_calls, "file_cache": stats}
 
-        # Walk linearly tracking class nesting by brace depth heuristics
-        brace_state = {"in_block_comment": False, "in_string": False, "in_char": False}
-        brace_depth = 0
-        class_stack: List[_ClassCtx] = []
-        pending_class: Optional[str] = None
-        pending_class_depth: Optional[int] = None
-
-        # Multi-line signature buffering for methods/constructors
-        sig_buf: List[str] = []
-        sig_start_line: Optional[int] = None
-
-        def flush_sig():
-            nonlocal sig_buf, sig_start_line
-            sig_buf = []
-            sig_start_line = None
-
-        def current_class_name() -> Optional[str]:
-            return class_stack[-1].name if class_stack else None
-
-        def make_class_fqn() -> str:
-            return "$".join([c.name for c in class_stack]) if class_stack else ""
-
-        def is_control_like(sig: str) -> bool:
-            s0 = sig.strip()
-            if not s0:
-                return True
-            head = s0.split(None, 1)[0]
-            if head in JAVA_KEYWORDS:
-                return True
-            if s0.startswith(("if", "for", "while", "switch", "catch", "try", "do")):
-                return True
-            return False
-
-        def extract_callable_name(sig: str) -> Optional[str]:
-            # Find the identifier immediately before the first '(' in the signature
-            m = re.search(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(", sig)
-            if not m:
-                return None
-            name = m.group(1)
-            if name in JAVA_KEYWORDS:
-                return None
-            return name
-
-        def signature_has_body(sig: str) -> bool:
-            # A declaration ends with '{' for body; abstract/interface often ends with ';'
-            return "{" in sig
-
-        def signature_is_terminated(sig: str) -> bool:
-            # If body starts or terminates with ';' we can flush
-            s = sig.strip()
-            return ("{" in s) or s.endswith(";")
-
-        i = 0
-        while i < len(lines):
-            raw = lines[i]
-            s = _strip_comments_and_strings(raw, brace_state)
-
-            # detect class declarations
-            m = _CLASS_RE.search(s)
-            if m:
-                cname = m.group(2)
-                pending_class = cname
-                pending_class_depth = brace_depth
-
-            # update brace depth char-by-char to place class enter/exit
-            for ch in s:
-                if ch == "{":
-                    brace_depth += 1
-                    # enter pending class at the first '{' after decl
-                    if pending_class is not None and pending_class_depth is not None and brace_depth == pending_class_depth + 1:
-                        class_stack.append(_ClassCtx(name=pending_class, brace_depth_enter=brace_depth))
-                        # record class def span (best-effort)
-                        class_fqn = "$".join([c.name for c in class_stack])
-                        sym = f"{pkg}.{class_fqn}" if pkg else class_fqn
-                        start_line = i + 1
-                        end_line = _find_block_end(lines, i)
-                        defs.append({
-                            "symbol": sym,
-                            "kind": "class",
-                            "path": rel,
-                            "start": start_line,
-                            "end": end_line,
-                            "sig": m.group(1) if m else None,
-                        })
-                        pending_class = None
-                        pending_class_depth = None
-                elif ch == "}":
-                    # exit class scopes if needed
-                    if class_stack and brace_depth == class_stack[-1].brace_depth_enter:
-                        class_stack.pop()
-                    brace_depth = max(0, brace_depth - 1)
-
-            # detect method declarations (best-effort)
-            if class_stack:
-                # Start buffering signature if we see '(' but haven't started
-                if sig_start_line is None:
-                    # Avoid starting on obvious control statements
-                    if "(" in s and not is_control_like(s) and not s.strip().startswith("@"):
-                        sig_buf = [s.strip()]
-                        sig_start_line = i + 1
-                else:
-                    # Continue buffering
-                    if s.strip():
-                        sig_buf.append(s.strip())
-
-                if sig_start_line is not None:
-                    sig_joined = " ".join(sig_buf)
-                    # stop buffering if it grows too much
-                    if len(sig_buf) > 12:
-                        flush_sig()
-                    elif signature_is_terminated(sig_joined):
-                        # Decide if this is a method/constructor
-                        name = extract_callable_name(sig_joined)
-                        if name and not is_control_like(sig_joined):
-                            cls_name = current_class_name()
-                            class_fqn = make_class_fqn()
-                            is_ctor = (cls_name is not None and name == cls_name)
-                            kind = "method"
-                            member = name
-                            if is_ctor:
-                                kind = "constructor"
-                                member = "<init>"
-                            sym = f"{pkg}.{class_fqn}.{member}" if pkg else f"{class_fqn}.{member}"
-
-                            start_line = sig_start_line
-                            # If no body, treat as single-line span
-                            if signature_has_body(sig_joined):
-                                end_line = _find_block_end(lines, i if "{" in s else (sig_start_line - 1))
-                            else:
-                                end_line = start_line
-
-                            defs.append({
-                                "symbol": sym,
-                                "kind": kind,
-                                "path": rel,
-                                "start": start_line,
-                                "end": end_line,
-                                "sig": sig_joined[:200],
-                            })
-
-                            # gather weak calls only for bodies
-                            if end_line > start_line:
-                                body_end = min(end_line, len(lines))
-                                for j in range(start_line, body_end):
-                                    ln2 = lines[j - 1]
-                                    s2 = ln2.strip()
-                                    if not s2 or s2.startswith("@"):
-                                        continue
-                                    for cm in re.finditer(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(", s2):
-                                        callee = cm.group(1)
-                                        if callee in JAVA_KEYWORDS:
-                                            continue
-                                        fallback_calls.append({
-                                            "text": callee,
-                                            "path": rel,
-                                            "line": j,
-                                            "col": cm.start(1) + 1,
-                                        })
-
-                                # jump to end of block
-                                i = end_line - 1
-                        flush_sig()
-            i += 1
-
-    return {"defs": defs, "fallback_calls": fallback_calls}
+
+# ----------------------------
+# Compact on-disk format (SQLite)
+# ----------------------------
+
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+_SQLITE_SUFFIXES = (".sqlite", ".db")
+
+_SQLITE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE defs (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    last TEXT NOT NULL,
+    kind TEXT,
+    path TEXT,
+    start INTEGER,
+    "end" INTEGER,
+    sig TEXT
+);
+CREATE TABLE calls (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    path TEXT,
+    line INTEGER,
+    col INTEGER,
+    caller TEXT
+);
+"""
+
+_SQLITE_INDEXES = """
+CREATE INDEX defs_symbol ON defs(symbol);
+CREATE INDEX defs_last ON defs(last);
+CREATE INDEX defs_path ON defs(path, start);
+CREATE INDEX calls_text ON calls(text);
+"""
+
+
+def _is_sqlite_index(p: Path) -> bool:
+    if p.suffix in _SQLITE_SUFFIXES:
+        return True
+    try:
+        with p.open("rb") as f:
+            return f.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def _enclosing_callables(defs: List[Dict[str, Any]]) -> Callable[[str, int], str]:
+    """
+    Build a resolver (path, line) -> symbol of the innermost method/constructor
+    whose span contains the line ("" if none).
+    """
+    by_path: Dict[str, List[Tuple[int, int, str]]] = {}
+    for d in defs:
+        if d.get("kind") in ("method", "constructor", "function"):
+            by_path.setdefault(d.get("path", ""), []).append(
+                (int(d.get("start") or 0), int(d.get("end") or 0), d.get("symbol", "")))
+    starts_by_path: Dict[str, List[int]] = {}
+    for path, spans in by_path.items():
+        spans.sort(key=lambda t: (t[0], -t[1]))
+        starts_by_path[path] = [t[0] for t in spans]
+
+    def resolve(path: str, line: int) -> str:
+        spans = by_path.get(path)
+        if not spans:
+            return ""
+        # Innermost = latest-starting span that still contains the line
+        i = bisect.bisect_right(starts_by_path[path], line) - 1
+        while i >= 0:
+            start, end, sym = spans[i]
+            if start <= line <= end:
+                return sym
+            i -= 1
+        return ""
+
+    return resolve
+
+
+def _write_sqlite_index(out: Path, index_obj: Dict[str, Any]) -> None:
+    """
+    Write a v1 index object as SQLite (defs + fallback_calls with lookup indexes).
+    Written to a temp file and renamed, so readers holding the old file keep a consistent view.
+    """
+    tmp = out.with_name(out.name + f".tmp{os.getpid()}")
+    if tmp.exists():
+        tmp.unlink()
+    defs = index_obj.get("defs", []) or []
+    calls = index_obj.get("fallback_calls", []) or []
+    caller_of = _enclosing_callables(defs)
+
+    conn = sqlite3.connect(str(tmp))
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(_SQLITE_SCHEMA)
+        meta = {k: v for k, v in index_obj.items() if k not in ("defs", "fallback_calls", "refs", "edges")}
+        meta["index_format"] = "sqlite"
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()])
+        conn.executemany(
+            'INSERT INTO defs (symbol, last, kind, path, start, "end", sig) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [((d.get("symbol") or "").strip(), _last_segment((d.get("symbol") or "").strip()), d.get("kind"),
+              d.get("path"), d.get("start"), d.get("end"), d.get("sig")) for d in defs],
+        )
+        conn.executemany(
+            "INSERT INTO calls (text, path, line, col, caller) VALUES (?, ?, ?, ?, ?)",
+            [(c.get("text") or "", c.get("path"), c.get("line"), c.get("col"),
+              caller_of(c.get("path", ""), int(c.get("line") or 0))) for c in calls],
+        )
+        conn.executescript(_SQLITE_INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, out)
+
+
+class _SqliteIndex:
+    """
+    Read-only, memory-mapped view of a SQLite index.
+
+    Opening costs a few milliseconds; pages are served from the OS page cache, so
+    workers on one node that open the same index share its memory.
+    """
+
+    MMAP_SIZE = 1 << 30
+
+    def __init__(self, p: Path):
+        self._uri = f"{p.resolve().as_uri()}?mode=ro&immutable=1"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.meta = {k: json.loads(v) for k, v in self._query("SELECT key, value FROM meta")}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={self.MMAP_SIZE}")
+        return conn
+
+    def _query(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            # Reopened on demand: a caller may still hold this store after the cache closed it
+            if self._conn is None:
+                self._conn = self._connect()
+            return self._conn.execute(sql, params).fetchall()
+
+    def def_candidates(self, q: str) -> List[Dict[str, Any]]:
+        """Defs that can score > 0 against normalized query q, in index order."""
+        if not q:
+            return []
+        # symbol contains q (exact/suffix/substring), q ends with symbol, or same last segment
+        clauses = ["instr(symbol, ?) > 0", "instr(?, symbol) > 0"]
+        params: List[Any] = [q, q]
+        q_last = _last_segment(q)
+        if q_last:
+            clauses.append("last = ?")
+            params.append(q_last)
+        rows = self._query(
+            f'SELECT symbol, kind, path, start, "end", sig FROM defs WHERE symbol != \'\' AND ({" OR ".join(clauses)}) ORDER BY id',
+            tuple(params),
+        )
+        return [{"symbol": r[0], "kind": r[1], "path": r[2], "start": r[3], "end": r[4], "sig": r[5]} for r in rows]
+
+    def def_spans(self) -> List[Dict[str, Any]]:
+        rows = self._query('SELECT symbol, kind, path, start, "end" FROM defs ORDER BY id')
+        return [{"symbol": r[0], "kind": r[1], "path": r[2], "start": r[3], "end": r[4]} for r in rows]
+
+    def calls_to(self, name: str) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT path, line, col, caller FROM calls WHERE text = ? ORDER BY id", (name,))
+        return [{"path": r[0], "line": r[1], "col": r[2], "caller": r[3]} for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
 
 # ----------------------------
@@ -423,10 +1156,23 @@ def build_retrieval_index(
     revision: Optional[str] = None,
     language: str = "java",
     force: bool = False,
+    index_format: Optional[str] = None,
+    workers: int = 1,
+    file_cache_dir: Optional[str] = None,
+    engine: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Build stable retrieval index JSON.
-    Currently implements Java Layer-1 structural indexing (regex+brace fallback).
+    Layer-1 structural indexing for Java (tree-sitter or single-pass scanner) and Python
+    (stdlib ast; tree-sitter on request or for files ast cannot parse).
+
+    index_format: "json" or "sqlite"; inferred from the out_path suffix (.sqlite/.db) when omitted.
+    workers: processes used to parse source files (output is identical to workers=1).
+    file_cache_dir: per-file content-hash cache shared across bugs/revisions, so only changed
+        files are reparsed (default: TRACE_INDEX_FILE_CACHE or $TRACE_WORK_ROOT/index_file_cache;
+        "off" disables it).
+    engine: "auto" (Python: the stdlib ast; Java: tree-sitter when its grammar is installed,
+        else the scanner), "treesitter", "scanner" or "ast"; default TRACE_INDEX_ENGINE or "auto".
     """
     wd = Path(workdir).resolve()
     out = Path(out_path)
@@ -436,10 +1182,16 @@ def build_retrieval_index(
         return {"ok": True, "out_path": str(out), "cached": True}
 
     t0 = time.time()
-    if language.lower() == "java":
-        layer1 = _build_java_struct_index(wd)
+    eng, err = _resolve_engine(language.lower(), engine or os.environ.get("TRACE_INDEX_ENGINE"))
+    if err:
+        return {"ok": False, "error": err, "out_path": str(out)}
+    if file_cache_dir is None:
+        cache_dir = _default_file_cache_dir()
+    elif file_cache_dir.strip().lower() in ("", "0", "off", "none", "false"):
+        cache_dir = None
     else:
-        return {"ok": False, "error": f"language not supported yet: {language}", "out_path": str(out)}
+        cache_dir = Path(file_cache_dir)
+    layer1 = _build_struct_index(wd, language.lower(), workers=workers, cache_dir=cache_dir, engine=eng)
 
     index_obj = {
         "repo": str(wd),
@@ -455,8 +1207,22 @@ def build_retrieval_index(
         "fallback_calls": layer1.get("fallback_calls", []),
     }
 
-    out.write_text(json.dumps(index_obj, ensure_ascii=False), encoding="utf-8")
-    return {"ok": True, "out_path": str(out), "cached": False, "duration_s": round(time.time() - t0, 3)}
+    fmt = (index_format or ("sqlite" if out.suffix in _SQLITE_SUFFIXES else "json")).lower()
+    if fmt == "sqlite":
+        _write_sqlite_index(out, index_obj)
+    elif fmt == "json":
+        out.write_text(json.dumps(index_obj, ensure_ascii=False), encoding="utf-8")
+    else:
+        return {"ok": False, "error": f"unknown index format: {index_format}", "out_path": str(out)}
+    return {
+        "ok": True,
+        "out_path": str(out),
+        "cached": False,
+        "format": fmt,
+        "engine": eng,
+        "duration_s": round(time.time() - t0, 3),
+        "file_cache": layer1.get("file_cache"),
+    }
 
 
 def _codeql_available() -> bool:
@@ -745,129 +1511,296 @@ def augment_index_with_codeql(
     return {"ok": True, "refs": len(merged_refs), "edges": len(merged_edges), "db_dir": str(db_dir)}
 
 
-def symbol_lookup(index_path: str, symbol: str, max_candidates: int = 10) -> Dict[str, Any]:
+# ----------------------------
+# Loaded-index cache
+# ----------------------------
+
+@dataclass
+class _LoadedIndex:
+    path: str
+    key: Tuple[int, int]  # (mtime_ns, size) of the file when it was parsed
+    obj: Dict[str, Any]
+    nbytes: int
+    # Open SQLite store for compact indexes (obj then only holds the meta table)
+    store: Optional[_SqliteIndex] = None
+    # Derived lookup structures, built at most once per load (see _index_view)
+    views: Dict[str, Any] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class _IndexCache:
     """
-    Look up symbol definitions in ABCoder format index.
-    
-    Only supports ABCoder format (Graph/Modules structure).
+    Process-wide LRU of parsed index files keyed by (path, mtime, size).
+
+    An index is parsed once per process; later tool calls reuse the parsed object
+    and any derived structures. Entries are dropped when the file changes on disk.
+    The memory cap is an estimate of resident bytes: a JSON index counts as its file
+    size times _JSON_MEMORY_FACTOR (parsed objects plus derived views), a SQLite index
+    as the part of its file that can be mmapped into the process.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[str, _LoadedIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "parse_seconds": 0.0}
+
+    def get(self, p: Path) -> _LoadedIndex:
+        path = str(p.resolve())
+        st = p.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(path)
+                self._stats["hits"] += 1
+                return entry
+            if entry is not None:
+                self._stats["reloads"] += 1
+                del self._entries[path]
+                _close_entry(entry)
+            self._stats["misses"] += 1
+
+        t0 = time.perf_counter()
+        if _is_sqlite_index(p):
+            # Pages are mmapped and shared via the OS page cache; nothing large is held on the heap.
+            store = _SqliteIndex(p)
+            nbytes = min(st.st_size, _SqliteIndex.MMAP_SIZE)
+            entry = _LoadedIndex(path=path, key=key, obj=store.meta, nbytes=nbytes, store=store)
+        else:
+            obj = json.loads(p.read_text(encoding="utf-8"))
+            entry = _LoadedIndex(path=path, key=key, obj=obj, nbytes=st.st_size * _JSON_MEMORY_FACTOR)
+        elapsed = time.perf_counter() - t0
+
+        with self._lock:
+            self._stats["parse_seconds"] += elapsed
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        # Always keep the most recently used entry, even if it alone exceeds the cap.
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or sum(e.nbytes for e in self._entries.values()) > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            _close_entry(entry)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["parse_seconds"] = round(out["parse_seconds"], 3)
+            out["entries"] = len(self._entries)
+            out["bytes"] = sum(e.nbytes for e in self._entries.values())
+            return out
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                _close_entry(entry)
+            self._entries.clear()
+
+
+def _close_entry(entry: _LoadedIndex) -> None:
+    if entry.store is not None:
+        entry.store.close()
+
+
+# Resident size of a parsed JSON index (dicts, strings, derived _SymbolTable/views)
+# relative to its file size (about 7x measured with lookups + references on a stdlib index).
+_JSON_MEMORY_FACTOR = int(os.environ.get("TRACE_INDEX_CACHE_JSON_FACTOR", "8"))
+
+_INDEX_CACHE = _IndexCache(
+    max_entries=int(os.environ.get("TRACE_INDEX_CACHE_MAX_ENTRIES", "8")),
+    max_bytes=int(os.environ.get("TRACE_INDEX_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+)
+
+
+def get_index_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/parse-time counters of the loaded-index cache (for run metrics)."""
+    return _INDEX_CACHE.stats()
+
+
+def clear_index_cache() -> None:
+    """Drop all parsed indexes held by this process."""
+    _INDEX_CACHE.clear()
+
+
+def _load_index(index_path: str) -> Tuple[Optional[_LoadedIndex], Optional[Dict[str, Any]]]:
+    """
+    Return (loaded_index, None) or (None, error_result) for an index file.
     """
     p = Path(index_path)
     if not p.exists():
-        return {"ok": False, "error": f"index not found: {index_path}"}
-    obj = json.loads(p.read_text(encoding="utf-8"))
-    
-    # Only support ABCoder format
+        return None, {"ok": False, "error": f"index not found: {index_path}"}
+    try:
+        return _INDEX_CACHE.get(p), None
+    except (OSError, ValueError, sqlite3.Error) as e:
+        return None, {"ok": False, "error": f"failed to load index {index_path}: {e}"}
+
+
+def symbol_lookup(index_path: str, symbol: str, max_candidates: int = 10) -> Dict[str, Any]:
+    """
+    Look up symbol definitions in an ABCoder format index (Graph/Modules structure)
+    or a v1 index written by build_retrieval_index (JSON `defs` or SQLite).
+    """
+    loaded, err = _load_index(index_path)
+    if err is not None:
+        return err
+    return _symbol_lookup_loaded(loaded, symbol, max_candidates)
+
+
+def _symbol_lookup_loaded(loaded: _LoadedIndex, symbol: str, max_candidates: int = 10) -> Dict[str, Any]:
+    obj = loaded.obj
+    if loaded.store is not None:
+        q = _normalize_symbol_query(symbol)
+        return _rank_defs(q, symbol, loaded.store.def_candidates(q), max_candidates, engine="sqlite")
+
+    if "defs" in obj:
+        # v1 index from build_retrieval_index - def table is built once per loaded index
+        q = _normalize_symbol_query(symbol)
+        v1 = _index_view(loaded, "v1", _V1View)
+        return _rank_defs(q, symbol, v1.def_candidates(q), max_candidates, engine="index_v1")
+
     if "Graph" not in obj and "Modules" not in obj:
-        return {"ok": False, "error": f"Unsupported index format. Only ABCoder format (Graph/Modules) is supported."}
-    
-    # ABCoder format - parse directly
-    return _symbol_lookup_abcoder(obj, symbol, max_candidates)
+        return {"ok": False, "error": "Unsupported index format. Expected ABCoder (Graph/Modules), v1 (defs) or SQLite index."}
+
+    # ABCoder format - lookup tables are built once per loaded index
+    view = _index_view(loaded, "abcoder", _AbcoderView)
+    return _symbol_lookup_abcoder(obj, symbol, max_candidates, view=view)
+
+
+class _AbcoderView:
+    """
+    Lookup tables derived once from an ABCoder index (Graph/Modules structure).
 
+    - nodes: one entry per Graph node with its full symbol, name and kind
+    - symbols: _SymbolTable over the nodes' full symbols (full symbol -> nodes)
+    - defs_by_name: name -> Functions/Types entries (File/Line/end line), in Modules order
+    """
+
+    def __init__(self, abcoder_obj: Dict[str, Any]):
+        graph = abcoder_obj.get("Graph", {}) or {}
+        modules = abcoder_obj.get("Modules", {}) or {}
+
+        self.nodes: List[Dict[str, Any]] = []
+        for node_key, node_data in graph.items():
+            if not isinstance(node_data, dict):
+                continue
+            node_name = node_data.get("Name", "")
+            pkg_path = node_data.get("PkgPath", "")
+            # Build full symbol: pkg.Class.method or pkg.symbol
+            if pkg_path and node_name:
+                # Parse node_key to get symbol: "mod?pkg#symbol"
+                if "?" in node_key and "#" in node_key:
+                    full_symbol = f"{pkg_path}.{node_key.split('#')[-1]}"
+                else:
+                    full_symbol = f"{pkg_path}.{node_name}" if pkg_path else node_name
+            else:
+                full_symbol = node_name
+            node_type = node_data.get("Type", "")
+            kind = {"FUNC": "method", "TYPE": "class", "VAR": "variable"}.get(node_type, "unknown")
+            self.nodes.append({"key": node_key, "symbol": full_symbol, "name": node_name, "kind": kind})
+        self.symbols = _SymbolTable([n["symbol"] for n in self.nodes])
+
+        # Only the first Functions/Types entry with a given name per package is ever used,
+        # so later duplicates within a package are not recorded.
+        self.defs_by_name: Dict[Any, List[Dict[str, Any]]] = {}
+        for mod_name, mod_data in modules.items():
+            if not isinstance(mod_data, dict):
+                continue
+            packages = mod_data.get("Packages", {}) or {}
+            for pkg_name, pkg_data in packages.items():
+                if not isinstance(pkg_data, dict):
+                    continue
+                for section, def_kind in (("Functions", "func"), ("Types", "type")):
+                    seen = set()
+                    for info in (pkg_data.get(section, {}) or {}).values():
+                        if not isinstance(info, dict):
+                            continue
+                        name = info.get("Name")
+                        if name in seen:
+                            continue
+                        seen.add(name)
+                        start_line = info.get("Line", 0)
+                        content = info.get("Content", "")
+                        end_line = start_line + len(content.splitlines()) - 1 if content else start_line
+                        self.defs_by_name.setdefault(name, []).append({
+                            "def_kind": def_kind,
+                            "module": mod_name,
+                            "pkg": pkg_name,
+                            "file": info.get("File", ""),
+                            "start": start_line,
+                            "end": end_line,
+                            "sig": info.get("Signature", "") if def_kind == "func" else "",
+                            "content": content,
+                        })
 
-def _symbol_lookup_abcoder(abcoder_obj: Dict[str, Any], symbol: str, max_candidates: int = 10) -> Dict[str, Any]:
+    def location(self, name: Any) -> Tuple[str, int, int, str]:
+        """
+        (file, start, end, sig) for a node name. The last matching Functions/Types entry
+        in Modules order wins for the span; the signature comes from the last function.
+        """
+        file_path, start_line, end_line, sig = "", 0, 0, ""
+        for d in self.defs_by_name.get(name, ()):
+            file_path, start_line, end_line = d["file"], d["start"], d["end"]
+            if d["def_kind"] == "func":
+                sig = d["sig"]
+        return file_path, start_line, end_line, sig
+
+
+def _index_view(loaded: _LoadedIndex, name: str, builder: Callable[[Dict[str, Any]], Any]) -> Any:
+    """Return a derived structure for a loaded index, building it once per load."""
+    view = loaded.views.get(name)
+    if view is None:
+        with loaded.lock:
+            view = loaded.views.get(name)
+            if view is None:
+                view = builder(loaded.obj)
+                loaded.views[name] = view
+    return view
+
+
+def _symbol_lookup_abcoder(
+    abcoder_obj: Dict[str, Any],
+    symbol: str,
+    max_candidates: int = 10,
+    view: Optional[_AbcoderView] = None,
+) -> Dict[str, Any]:
     """
     Look up symbol in ABCoder format index.
-    
+
     ABCoder structure:
     - Graph: { "mod?pkg#symbol": { "Type": "FUNC|TYPE", "Name": "...", "PkgPath": "...", ... } }
     - Modules: { "mod": { "Packages": { "pkg": { "Functions": {...}, "Types": {...} } } } }
     """
-    graph = abcoder_obj.get("Graph", {}) or {}
-    modules = abcoder_obj.get("Modules", {}) or {}
-    
+    if view is None:
+        view = _AbcoderView(abcoder_obj)
+
+    q = _normalize_symbol_query(symbol)
     scored = []
-    
-    # Search in Graph nodes
-    for node_key, node_data in graph.items():
-        if not isinstance(node_data, dict):
+    # Candidates come back in Graph order, so the stable sort below matches a full scan.
+    for i in view.symbols.candidates(q):
+        node = view.nodes[i]
+        score = _score_normalized(q, node["symbol"])
+        if score <= 0:
             continue
-        
-        # Extract symbol name from node
-        node_name = node_data.get("Name", "")
-        pkg_path = node_data.get("PkgPath", "")
-        
-        # Build full symbol: pkg.Class.method or pkg.symbol
-        if pkg_path and node_name:
-            # Parse node_key to get symbol: "mod?pkg#symbol"
-            if "?" in node_key and "#" in node_key:
-                symbol_part = node_key.split("#")[-1]
-                if "." in symbol_part:
-                    # Method: Class.method()
-                    class_method = symbol_part
-                    full_symbol = f"{pkg_path}.{class_method}"
-                else:
-                    # Type or variable
-                    full_symbol = f"{pkg_path}.{symbol_part}"
-            else:
-                full_symbol = f"{pkg_path}.{node_name}" if pkg_path else node_name
-        else:
-            full_symbol = node_name
-        
-        # Score match
-        score = _score_symbol(symbol, full_symbol)
-        if score > 0:
-            # Get file and line info from Modules if available
-            file_path = ""
-            start_line = 0
-            end_line = 0
-            sig = ""
-            kind = "unknown"
-            
-            node_type = node_data.get("Type", "")
-            if node_type == "FUNC":
-                kind = "method"
-            elif node_type == "TYPE":
-                kind = "class"
-            elif node_type == "VAR":
-                kind = "variable"
-            
-            # Try to find in Modules for file/line info
-            for mod_name, mod_data in modules.items():
-                if not isinstance(mod_data, dict):
-                    continue
-                packages = mod_data.get("Packages", {}) or {}
-                for pkg_name, pkg_data in packages.items():
-                    if not isinstance(pkg_data, dict):
-                        continue
-                    
-                    # Check Functions
-                    functions = pkg_data.get("Functions", {}) or {}
-                    for func_name, func_info in functions.items():
-                        if isinstance(func_info, dict) and func_info.get("Name") == node_name:
-                            file_path = func_info.get("File", "")
-                            start_line = func_info.get("Line", 0)
-                            sig = func_info.get("Signature", "")
-                            content = func_info.get("Content", "")
-                            if content:
-                                end_line = start_line + len(content.splitlines()) - 1
-                            else:
-                                end_line = start_line
-                            break
-                    
-                    # Check Types
-                    types = pkg_data.get("Types", {}) or {}
-                    for type_name, type_info in types.items():
-                        if isinstance(type_info, dict) and type_info.get("Name") == node_name:
-                            file_path = type_info.get("File", "")
-                            start_line = type_info.get("Line", 0)
-                            content = type_info.get("Content", "")
-                            if content:
-                                end_line = start_line + len(content.splitlines()) - 1
-                            else:
-                                end_line = start_line
-                            break
-            
-            scored.append((score, {
-                "symbol": full_symbol,
-                "kind": kind,
-                "path": file_path,
-                "start": start_line,
-                "end": end_line,
-                "sig": sig,
-            }))
-    
+        file_path, start_line, end_line, sig = view.location(node["name"])
+        scored.append((score, {
+            "symbol": node["symbol"],
+            "kind": node["kind"],
+            "path": file_path,
+            "start": start_line,
+            "end": end_line,
+            "sig": sig,
+        }))
+
     scored.sort(key=lambda t: (-t[0], t[1].get("path", ""), t[1].get("start", 0)))
-    
+
     hits = []
     for score, d in scored[: max_candidates or 10]:
         hits.append({
@@ -879,156 +1812,321 @@ def _symbol_lookup_abcoder(abcoder_obj: Dict[str, Any], symbol: str, max_candida
             "score": score,
             "sig": d.get("sig"),
         })
-    
+
     return {"ok": True, "query": symbol, "hits": hits, "engine": "abcoder"}
 
 
 def find_references(index_path: str, symbol: str) -> Dict[str, Any]:
     """
-    Find references to a symbol in ABCoder format index.
-    
-    Only supports ABCoder format (Graph/Modules structure).
+    Find references to a symbol in an ABCoder format index (Graph/Modules structure)
+    or a v1 index written by build_retrieval_index (JSON or SQLite; call sites from
+    CodeQL edges when present, otherwise fallback_calls).
     """
-    p = Path(index_path)
-    if not p.exists():
-        return {"ok": False, "error": f"index not found: {index_path}"}
-    obj = json.loads(p.read_text(encoding="utf-8"))
-    
-    # Only support ABCoder format
+    loaded, err = _load_index(index_path)
+    if err is not None:
+        return err
+    return _find_references_loaded(loaded, symbol)
+
+
+def _find_references_loaded(loaded: _LoadedIndex, symbol: str) -> Dict[str, Any]:
+    obj = loaded.obj
+    if loaded.store is not None:
+        return _references_from_calls(symbol, loaded.store.calls_to(_callee_name(symbol)), engine="sqlite")
+
+    if "defs" in obj:
+        # v1 index from build_retrieval_index - call-name inverted index is built once per loaded index
+        v1 = _index_view(loaded, "v1", _V1View)
+        return _references_from_calls(symbol, v1.calls_by_name.get(_callee_name(symbol), []), engine="index_v1")
+
     if "Graph" not in obj and "Modules" not in obj:
-        return {"ok": False, "error": f"Unsupported index format. Only ABCoder format (Graph/Modules) is supported."}
-    
-    # ABCoder format - parse directly
-    return _find_references_abcoder(obj, symbol)
+        return {"ok": False, "error": "Unsupported index format. Expected ABCoder (Graph/Modules), v1 (defs) or SQLite index."}
+
+    # ABCoder format - callee -> caller table is built once per loaded index
+    view = _index_view(loaded, "abcoder_refs", _AbcoderRefView)
+    return _find_references_abcoder(obj, symbol, view=view)
+
+
+class _AbcoderRefView:
+    """
+    Inverted callee -> caller table derived once from an ABCoder index.
 
+    Every distinct References/Dependencies target (by Name and by PkgPath.Name) maps to
+    the Graph nodes that mention it; callers holds the per-node location and caller name.
+    """
+
+    def __init__(self, abcoder_obj: Dict[str, Any]):
+        graph = abcoder_obj.get("Graph", {}) or {}
+        modules = abcoder_obj.get("Modules", {}) or {}
 
-def _find_references_abcoder(abcoder_obj: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+        # node_key -> file/line info from Modules
+        node_info_cache: Dict[str, Dict[str, Any]] = {}
+        for mod_name, mod_data in modules.items():
+            if not isinstance(mod_data, dict):
+                continue
+            packages = mod_data.get("Packages", {}) or {}
+            for pkg_name, pkg_data in packages.items():
+                if not isinstance(pkg_data, dict):
+                    continue
+                for section in ("Functions", "Types"):
+                    for info in (pkg_data.get(section, {}) or {}).values():
+                        if isinstance(info, dict):
+                            node_name = info.get("Name", "")
+                            if node_name:
+                                # Build node key: "mod?pkg#symbol"
+                                node_info_cache[f"{mod_name}?{pkg_name}#{node_name}"] = {
+                                    "file": info.get("File", ""),
+                                    "line": info.get("Line", 0),
+                                    "pkg": pkg_name,
+                                    "name": node_name,
+                                }
+
+        self.callers: List[Dict[str, Any]] = []
+        by_name: Dict[str, set] = {}
+        by_symbol: Dict[str, set] = {}
+        for node_key, node_data in graph.items():
+            if not isinstance(node_data, dict):
+                continue
+            idx = len(self.callers)
+            caller_info = node_info_cache.get(node_key, {})
+            caller_pkg = node_data.get("PkgPath", caller_info.get("pkg", ""))
+            caller_name = node_data.get("Name", caller_info.get("name", ""))
+            self.callers.append({
+                "path": caller_info.get("file", ""),
+                "line": caller_info.get("line", 0),
+                "caller": f"{caller_pkg}.{caller_name}" if caller_pkg else caller_name,
+            })
+            for field_name in ("References", "Dependencies"):
+                for ref in node_data.get(field_name, []) or []:
+                    if not isinstance(ref, dict):
+                        continue
+                    ref_name = ref.get("Name", "") or ""
+                    ref_pkg = ref.get("PkgPath", "")
+                    ref_symbol = f"{ref_pkg}.{ref_name}" if (ref_pkg and ref_name) else ref_name
+                    by_name.setdefault(ref_name, set()).add(idx)
+                    by_symbol.setdefault(ref_symbol, set()).add(idx)
+
+        self._names = list(by_name.keys())
+        self._name_nodes = [by_name[n] for n in self._names]
+        self._names_text = _JoinedStrings(self._names)
+        self._symbols = list(by_symbol.keys())
+        self._symbol_nodes = [by_symbol[n] for n in self._symbols]
+        self._symbols_text = _JoinedStrings(self._symbols)
+
+    def referencing_nodes(self, symbol: str, symbol_name: str) -> List[int]:
+        """Graph nodes (in Graph order) with a reference whose PkgPath.Name contains symbol or Name contains symbol_name."""
+        nodes: set = set()
+        for i in self._symbols_text.containing(symbol):
+            nodes |= self._symbol_nodes[i]
+        for i in self._names_text.containing(symbol_name):
+            nodes |= self._name_nodes[i]
+        return sorted(nodes)
+
+
+def _find_references_abcoder(
+    abcoder_obj: Dict[str, Any],
+    symbol: str,
+    view: Optional[_AbcoderRefView] = None,
+) -> Dict[str, Any]:
     """
     Find references to a symbol in ABCoder format index.
-    
+
     ABCoder Graph nodes have "References" and "Dependencies" fields that contain
     references to other symbols.
     """
-    graph = abcoder_obj.get("Graph", {}) or {}
-    modules = abcoder_obj.get("Modules", {}) or {}
-    
+    if view is None:
+        view = _AbcoderRefView(abcoder_obj)
+
     # Extract symbol name (last part after .)
     symbol_name = symbol.split(".")[-1].split("(")[0]  # Remove method params
-    
-    # Build a cache of node_key -> file/line info from Modules
-    node_info_cache: Dict[str, Dict[str, Any]] = {}
-    for mod_name, mod_data in modules.items():
-        if not isinstance(mod_data, dict):
-            continue
-        packages = mod_data.get("Packages", {}) or {}
-        for pkg_name, pkg_data in packages.items():
-            if not isinstance(pkg_data, dict):
-                continue
-            
-            # Process Functions
-            functions = pkg_data.get("Functions", {}) or {}
-            for func_name, func_info in functions.items():
-                if isinstance(func_info, dict):
-                    node_name = func_info.get("Name", "")
-                    if node_name:
-                        # Build node key: "mod?pkg#symbol"
-                        node_key = f"{mod_name}?{pkg_name}#{node_name}"
-                        node_info_cache[node_key] = {
-                            "file": func_info.get("File", ""),
-                            "line": func_info.get("Line", 0),
-                            "pkg": pkg_name,
-                            "name": node_name,
-                        }
-            
-            # Process Types
-            types = pkg_data.get("Types", {}) or {}
-            for type_name, type_info in types.items():
-                if isinstance(type_info, dict):
-                    node_name = type_info.get("Name", "")
-                    if node_name:
-                        node_key = f"{mod_name}?{pkg_name}#{node_name}"
-                        node_info_cache[node_key] = {
-                            "file": type_info.get("File", ""),
-                            "line": type_info.get("Line", 0),
-                            "pkg": pkg_name,
-                            "name": node_name,
-                        }
-    
+
     hits = []
     seen_refs = set()  # Avoid duplicates
-    
-    # Find all nodes that reference the target symbol
-    for node_key, node_data in graph.items():
-        if not isinstance(node_data, dict):
+    for idx in view.referencing_nodes(symbol, symbol_name):
+        caller = view.callers[idx]
+        ref_key = f"{caller['path']}:{caller['line']}:{symbol}"
+        if ref_key in seen_refs:
             continue
-        
-        # Get caller info
-        caller_info = node_info_cache.get(node_key, {})
-        caller_file = caller_info.get("file", "")
-        caller_line = caller_info.get("line", 0)
-        caller_pkg = node_data.get("PkgPath", caller_info.get("pkg", ""))
-        caller_name = node_data.get("Name", caller_info.get("name", ""))
-        
-        # Check References field
-        references = node_data.get("References", []) or []
-        for ref in references:
-            if isinstance(ref, dict):
-                ref_name = ref.get("Name", "")
-                ref_pkg = ref.get("PkgPath", "")
-                
-                # Build full reference symbol for matching
-                if ref_pkg and ref_name:
-                    ref_symbol = f"{ref_pkg}.{ref_name}"
-                else:
-                    ref_symbol = ref_name
-                
-                # Check if this reference matches our target symbol
-                if (symbol in ref_symbol or 
-                    symbol_name in ref_name or 
-                    ref_name == symbol_name or
-                    ref_symbol == symbol):
-                    ref_key = f"{caller_file}:{caller_line}:{symbol}"
-                    if ref_key not in seen_refs:
-                        seen_refs.add(ref_key)
-                        hits.append({
-                            "symbol": symbol,
-                            "path": caller_file,
-                            "line": caller_line,
-                            "caller": f"{caller_pkg}.{caller_name}" if caller_pkg else caller_name,
-                        })
-        
-        # Check Dependencies field
-        dependencies = node_data.get("Dependencies", []) or []
-        for dep in dependencies:
-            if isinstance(dep, dict):
-                dep_name = dep.get("Name", "")
-                dep_pkg = dep.get("PkgPath", "")
-                
-                if dep_pkg and dep_name:
-                    dep_symbol = f"{dep_pkg}.{dep_name}"
-                else:
-                    dep_symbol = dep_name
-                
-                if (symbol in dep_symbol or 
-                    symbol_name in dep_name or 
-                    dep_name == symbol_name or
-                    dep_symbol == symbol):
-                    ref_key = f"{caller_file}:{caller_line}:{symbol}"
-                    if ref_key not in seen_refs:
-                        seen_refs.add(ref_key)
-                        hits.append({
-                            "symbol": symbol,
-                            "path": caller_file,
-                            "line": caller_line,
-                            "caller": f"{caller_pkg}.{caller_name}" if caller_pkg else caller_name,
-                        })
-    
-    return {"ok": True, "query": symbol, "engine": "abcoder", "hits": hits[:200]}
+        seen_refs.add(ref_key)
+        hits.append({
+            "symbol": symbol,
+            "path": caller["path"],
+            "line": caller["line"],
+            "caller": caller["caller"],
+        })
+        if len(hits) >= 200:
+            break
+
+    return {"ok": True, "query": symbol, "engine": "abcoder", "hits": hits}
 
 
-def read_span(path: str, start_line: int, end_line: int, workdir: str) -> Dict[str, Any]:
+class _V1View:
+    """
+    Lookup tables derived once from a v1 index (build_retrieval_index output).
+
+    - defs: def entries with a _SymbolTable over their symbols
+    - calls_by_name: callee name -> call sites (path/line/col + enclosing caller), from
+      CodeQL `edges` when present, otherwise from `fallback_calls`
+    """
+
+    def __init__(self, index_obj: Dict[str, Any]):
+        self.defs: List[Dict[str, Any]] = [d for d in (index_obj.get("defs", []) or []) if isinstance(d, dict)]
+        self.symbols = _SymbolTable([d.get("symbol", "") for d in self.defs])
+
+        self.calls_by_name: Dict[str, List[Dict[str, Any]]] = {}
+        edges = [e for e in (index_obj.get("edges", []) or []) if isinstance(e, dict)]
+        if edges:
+            for e in edges:
+                name = _callee_name(str(e.get("callee", "")))
+                self.calls_by_name.setdefault(name, []).append({
+                    "path": e.get("path"), "line": e.get("line"), "caller": e.get("caller", ""),
+                })
+        else:
+            caller_of = _enclosing_callables(self.defs)
+            for c in index_obj.get("fallback_calls", []) or []:
+                if not isinstance(c, dict):
+                    continue
+                self.calls_by_name.setdefault(c.get("text", ""), []).append({
+                    "path": c.get("path"),
+                    "line": c.get("line"),
+                    "col": c.get("col"),
+                    "caller": caller_of(c.get("path", ""), int(c.get("line") or 0)),
+                })
+
+    def def_candidates(self, q: str) -> List[Dict[str, Any]]:
+        return [self.defs[i] for i in self.symbols.candidates(q)]
+
+
+def _rank_defs(
+    q: str,
+    symbol: str,
+    candidates: List[Dict[str, Any]],
+    max_candidates: int = 10,
+    engine: str = "index",
+) -> Dict[str, Any]:
+    """Score v1 defs (symbol/kind/path/start/end/sig) against normalized query q; same ranking as ABCoder lookups."""
+    scored = []
+    for d in candidates:
+        score = _score_normalized(q, d.get("symbol", ""))
+        if score > 0:
+            scored.append((score, d))
+    scored.sort(key=lambda t: (-t[0], t[1].get("path") or "", t[1].get("start") or 0))
+    hits = []
+    for score, d in scored[: max_candidates or 10]:
+        hits.append({
+            "symbol": d.get("symbol"),
+            "kind": d.get("kind"),
+            "path": d.get("path"),
+            "start_line": d.get("start"),
+            "end_line": d.get("end"),
+            "score": score,
+            "sig": d.get("sig"),
+        })
+    return {"ok": True, "query": symbol, "hits": hits, "engine": engine}
+
+
+def _callee_name(symbol: str) -> str:
+    """Bare callee name as recorded in fallback_calls (constructors are called by class name)."""
+    parts = [p for p in _normalize_symbol_query(symbol).split(".") if p]
+    if not parts:
+        return ""
+    if parts[-1] == "<init>" and len(parts) >= 2:
+        return parts[-2].split("$")[-1]
+    return parts[-1]
+
+
+def _references_from_calls(symbol: str, calls: List[Dict[str, Any]], engine: str = "index") -> Dict[str, Any]:
+    """Turn call sites (path/line/caller) into find_references hits, one per (path, line), capped at 200."""
+    hits = []
+    seen_refs = set()
+    for c in calls:
+        ref_key = (c.get("path"), c.get("line"))
+        if ref_key in seen_refs:
+            continue
+        seen_refs.add(ref_key)
+        hits.append({
+            "symbol": symbol,
+            "path": c.get("path"),
+            "line": c.get("line"),
+            "caller": c.get("caller") or "",
+        })
+        if len(hits) >= 200:
+            break
+    return {"ok": True, "query": symbol, "engine": engine, "hits": hits}
+
+
+class _DefSpans:
+    """
+    Definition spans per file, derived once from a loaded index (for read_span's snap_to_def).
+
+    by_path: index path -> [(start, end, kind, symbol)] of classes/methods/functions.
+    """
+
+    def __init__(self, defs: List[Dict[str, Any]]):
+        self.by_path: Dict[str, List[Tuple[int, int, str, str]]] = {}
+        for d in defs:
+            start, end = int(d.get("start") or 0), int(d.get("end") or 0)
+            if start <= 0 or end < start:
+                continue
+            self.by_path.setdefault(d.get("path") or "", []).append((start, end, d.get("kind") or "", d.get("symbol") or ""))
+        self._resolved: Dict[str, str] = {}
+
+    def _spans_for(self, rel: str) -> List[Tuple[int, int, str, str]]:
+        if rel in self.by_path:
+            return self.by_path[rel]
+        key = self._resolved.get(rel)
+        if key is None:
+            # Index paths may be relative to a source/module root rather than the workdir
+            key = next((p for p in self.by_path if p and (rel.endswith("/" + p) or p.endswith("/" + rel))), "")
+            self._resolved[rel] = key
+        return self.by_path.get(key, []) if key else []
+
+    def enclosing(self, rel: str, start: int, end: int) -> Optional[Tuple[int, int, str, str]]:
+        """Innermost definition whose span contains start..end, or None."""
+        best = None
+        for span in self._spans_for(rel):
+            if span[0] <= start and end <= span[1] and (best is None or span[1] - span[0] < best[1] - best[0]):
+                best = span
+        return best
+
+
+def _def_spans(index_path: str) -> Tuple[Optional[_DefSpans], Optional[str]]:
+    """(definition spans of an index, None) or (None, reason they are unavailable)."""
+    loaded, err = _load_index(index_path)
+    if err is not None:
+        return None, err["error"]
+    if loaded.store is not None:
+        store = loaded.store
+        return _index_view(loaded, "def_spans", lambda _obj: _DefSpans(store.def_spans())), None
+    obj = loaded.obj
+    if "defs" in obj:
+        # Views are built under the index lock, so the v1 view must exist before this one is built
+        v1 = _index_view(loaded, "v1", _V1View)
+        return _index_view(loaded, "def_spans", lambda _obj: _DefSpans(v1.defs)), None
+    if "Graph" in obj or "Modules" in obj:
+        view = _index_view(loaded, "abcoder", _AbcoderView)
+        return _index_view(loaded, "def_spans", lambda _obj: _DefSpans([
+            {"symbol": f"{d['pkg']}.{name}" if d["pkg"] else str(name), "path": d["file"], "start": d["start"],
+             "end": d["end"], "kind": "method" if d["def_kind"] == "func" else "class"}
+            for name, entries in view.defs_by_name.items() for d in entries
+        ])), None
+    return None, "unsupported index format"
+
+
+def read_span(
+    path: str,
+    start_line: int,
+    end_line: int,
+    workdir: str,
+    index_path: Optional[str] = None,
+    snap_to_def: bool = False,
+    max_lines: int = 200,
+) -> Dict[str, Any]:
     """
     Read code span with line numbers. Path can be relative to workdir or absolute.
+
+    With snap_to_def (and an index_path), the span is widened to the innermost indexed
+    method/class that contains it, unless that definition is longer than max_lines;
+    the result then carries the definition under "def" (otherwise "snap_skipped" says why).
     """
     fp = Path(path)
     if not fp.is_absolute():
@@ -1039,10 +2137,383 @@ def read_span(path: str, start_line: int, end_line: int, workdir: str) -> Dict[s
     start = max(1, int(start_line))
     end = max(start, int(end_line))
 
-    lines = fp.read_text(encoding="utf-8", errors="ignore").splitlines()
-    out_lines = []
-    for i in range(start, min(end, len(lines)) + 1):
-        out_lines.append(f"{i:4d}: {lines[i-1]}")
-    return {"ok": True, "path": str(fp), "start_line": start, "end_line": min(end, len(lines)), "content": "\n".join(out_lines)}
+    snapped: Optional[Dict[str, Any]] = None
+    skipped = None
+    if snap_to_def:
+        spans, skipped = _def_spans(index_path) if index_path else (None, "no index_path given")
+        if spans is not None:
+            try:
+                rel = fp.resolve().relative_to(Path(workdir).resolve()).as_posix()
+            except ValueError:
+                rel = Path(path).as_posix()
+            enclosing = spans.enclosing(rel, start, end)
+            if enclosing is None:
+                skipped = "no indexed definition encloses the span"
+            elif enclosing[1] - enclosing[0] + 1 > max(1, int(max_lines)):
+                skipped = f"enclosing {enclosing[2]} {enclosing[3]} spans {enclosing[1] - enclosing[0] + 1} lines (> max_lines={max_lines})"
+            else:
+                start, end = enclosing[0], enclosing[1]
+                snapped = {"symbol": enclosing[3], "kind": enclosing[2], "start_line": start, "end_line": end}
+
+    from agent.file_view import read_lines
+
+    lines, n_lines = read_lines(fp, start, end, errors="ignore")
+    out_lines = [f"{i:4d}: {line}" for i, line in enumerate(lines, start)]
+    res = {"ok": True, "path": str(fp), "start_line": start, "end_line": min(end, n_lines), "content": "\n".join(out_lines)}
+    if snapped is not None:
+        res["def"] = snapped
+    elif snap_to_def:
+        res["snap_skipped"] = skipped
+    return res
+
+
+def _json_chars(text: str) -> int:
+    """Length of text once serialized as a JSON string value (quotes excluded)."""
+    return len(json.dumps(text, ensure_ascii=False)) - 2
+
+
+def _result_chars(res: Dict[str, Any]) -> int:
+    return len(json.dumps(res, ensure_ascii=False))
+
+
+def _halve_list(res: Dict[str, Any], key: str) -> bool:
+    """Drop the second half of res[key], counting the dropped items in res[key + "_more"]."""
+    items = res.get(key) or []
+    if len(items) <= 1:
+        return False
+    keep = len(items) // 2
+    res[f"{key}_more"] = res.get(f"{key}_more", 0) + len(items) - keep
+    res[key] = items[:keep]
+    return True
+
+
+def read_spans(spans: List[Any], workdir: str, max_chars: int = 8000) -> Dict[str, Any]:
+    """
+    Read several spans in one call. spans: [{"path", "start_line", "end_line"}] (or
+    [path, start, end]). Overlapping/adjacent ranges of one file are merged and each line
+    is returned once; files keep the order of their first request. Once max_chars of
+    content (counted as serialized JSON) is reached the remaining ranges are listed under
+    "omitted" instead. The whole result stays within MAX_TOOL_RESULT_CHARS, so the agent
+    loop never has to cut it mid-JSON.
+    """
+    from agent.file_view import read_lines
+    from agent.tool_runtime import MAX_TOOL_RESULT_CHARS
+
+    if not isinstance(spans, list) or not spans:
+        return {"ok": False, "error": "spans must be a non-empty list of {path, start_line, end_line}"}
+
+    ranges: "OrderedDict[str, List[List[int]]]" = OrderedDict()
+    shown: Dict[str, str] = {}
+    errors: List[Dict[str, Any]] = []
+    for item in spans:
+        try:
+            if isinstance(item, dict):
+                path, start, end = item["path"], int(item.get("start_line", 1)), int(item.get("end_line", item.get("start_line", 1)))
+            else:
+                path, start, end = item[0], int(item[1]), int(item[2])
+        except (KeyError, IndexError, TypeError, ValueError):
+            errors.append({"span": item, "error": "expected {path, start_line, end_line}"})
+            continue
+        fp = Path(path)
+        if not fp.is_absolute():
+            fp = Path(workdir) / path
+        if not fp.exists() or fp.is_dir():
+            errors.append({"path": path, "error": f"file not found: {path}"})
+            continue
+        key = str(fp.resolve())
+        shown.setdefault(key, str(fp))
+        start = max(1, start)
+        ranges.setdefault(key, []).append([start, max(start, end)])
+
+    files: List[Dict[str, Any]] = []
+    omitted: List[Dict[str, Any]] = []
+    used = 0
+    for key, rs in ranges.items():
+        rs.sort()
+        merged = [rs[0]]
+        for start, end in rs[1:]:
+            if start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        out_spans = []
+        for start, end in merged:
+            if used >= max_chars:
+                omitted.append({"path": shown[key], "start_line": start, "end_line": end})
+                continue
+            lines, n_lines = read_lines(Path(key), start, end, errors="ignore")
+            out_lines = []
+            for i, line in enumerate(lines, start):
+                text = f"{i:4d}: {line}"
+                cost = _json_chars(text) + 2
+                if used + cost > max_chars and out_lines:
+                    omitted.append({"path": shown[key], "start_line": i, "end_line": min(end, n_lines)})
+                    used = max_chars
+                    break
+                out_lines.append(text)
+                used += cost
+            if out_lines:
+                out_spans.append({"start_line": start, "end_line": start + len(out_lines) - 1, "content": "\n".join(out_lines)})
+        if out_spans:
+            files.append({"path": shown[key], "spans": out_spans})
+
+    res: Dict[str, Any] = {"ok": bool(files) or not errors, "files": files, "spans_read": 0}
+    if omitted:
+        res["omitted"] = omitted
+    if errors:
+        res["errors"] = errors
+        if not files:
+            res["error"] = errors[0]["error"]
+    # Paths and omitted/error entries are not covered by max_chars: shed spans from the
+    # end, then list entries, until the serialized result fits
+    while _result_chars(res) > MAX_TOOL_RESULT_CHARS:
+        if files:
+            span = files[-1]["spans"].pop()
+            omitted.append({"path": files[-1]["path"], "start_line": span["start_line"], "end_line": span["end_line"]})
+            res["omitted"] = omitted
+            if not files[-1]["spans"]:
+                files.pop()
+        elif not (_halve_list(res, "omitted") or _halve_list(res, "errors")):
+            break
+    res["spans_read"] = sum(len(f["spans"]) for f in files)
+    if res.get("omitted"):
+        res["truncated"] = True
+    return res
+
+
+def explain_symbols(
+    index_path: str,
+    symbols: List[str],
+    workdir: str,
+    max_defs: int = 2,
+    max_callers: int = 5,
+    max_body_lines: int = 40,
+    max_blocks: int = 10,
+    max_chars: int = 6000,
+) -> Dict[str, Any]:
+    """
+    symbol_lookup + read_span of the hits + find_references for several symbols, over one
+    loaded index. Each symbol gets its top max_defs definitions, the bodies of those
+    (first max_body_lines lines) and its first max_callers distinct callers. At most
+    max_blocks bodies (one per definition) and max_chars of body text (counted as serialized
+    JSON) are returned in total; later definitions are listed without a body ("body_omitted").
+    If definitions and callers still push the result past MAX_TOOL_RESULT_CHARS, bodies are
+    dropped from the end, then callers, then whole symbols ("omitted_symbols").
+    """
+    from agent.file_view import read_lines
+    from agent.tool_runtime import MAX_TOOL_RESULT_CHARS
+
+    if not isinstance(symbols, list) or not symbols:
+        return {"ok": False, "error": "symbols must be a non-empty list of symbol names"}
+    loaded, err = _load_index(index_path)
+    if err is not None:
+        return err
+
+    out: List[Dict[str, Any]] = []
+    blocks = used = 0
+    for symbol in dict.fromkeys(str(s) for s in symbols):
+        lookup = _symbol_lookup_loaded(loaded, symbol, max_defs)
+        if not lookup.get("ok"):
+            return lookup
+        defs = []
+        for hit in lookup.get("hits", []):
+            d = dict(hit)
+            start, end = int(hit.get("start_line") or 0), int(hit.get("end_line") or 0)
+            fp = Path(workdir) / (hit.get("path") or "")
+            if start <= 0 or not fp.is_file():
+                d["body_error"] = "definition file not found in workdir"
+            elif blocks >= max_blocks or used >= max_chars:
+                d["body_omitted"] = True
+            else:
+                lines, n_lines = read_lines(fp, start, min(max(start, end), start + max_body_lines - 1), errors="ignore")
+                body = []
+                for i, line in enumerate(lines, start):
+                    text = f"{i:4d}: {line}"
+                    cost = _json_chars(text) + 2
+                    if used + cost > max_chars and body:
+                        break
+                    body.append(text)
+                    used += cost
+                d["body"] = "\n".join(body)
+                shown_end = start + len(body) - 1
+                if shown_end < min(max(start, end), n_lines):
+                    d["body_truncated_at"] = shown_end
+                blocks += 1
+            defs.append(d)
+
+        refs = _find_references_loaded(loaded, symbol)
+        callers: List[Dict[str, Any]] = []
+        seen = set()
+        for ref in refs.get("hits", []) if refs.get("ok") else []:
+            key = ref.get("caller") or (ref.get("path"), ref.get("line"))
+            if key in seen:
+                continue
+            seen.add(key)
+            callers.append({"caller": ref.get("caller"), "path": ref.get("path"), "line": ref.get("line")})
+            if len(callers) >= max_callers:
+                break
+        out.append({
+            "query": symbol,
+            "defs": defs,
+            "callers": callers,
+            "references_total": len(refs.get("hits", [])) if refs.get("ok") else 0,
+        })
+    res: Dict[str, Any] = {"ok": True, "engine": lookup.get("engine"), "symbols": out, "blocks": blocks}
+    while _result_chars(res) > MAX_TOOL_RESULT_CHARS:
+        with_body = [d for sym in out for d in sym["defs"] if "body" in d]
+        if with_body:
+            d = with_body[-1]
+            d.pop("body")
+            d.pop("body_truncated_at", None)
+            d["body_omitted"] = True
+            res["blocks"] -= 1
+            continue
+        with_callers = [sym for sym in out if len(sym["callers"]) > 1]
+        if with_callers:
+            with_callers[-1]["callers"] = with_callers[-1]["callers"][: len(with_callers[-1]["callers"]) // 2]
+            continue
+        if len(out) <= 1:
+            break
+        res.setdefault("omitted_symbols", []).insert(0, out.pop()["query"])
+    return res
+
+
+# ----------------------------
+# Batch build (CLI)
+# ----------------------------
+
+def _build_retrieval_index_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        res = build_retrieval_index(**job)
+    except Exception as e:
+        res = {"ok": False, "error": f"{type(e).__name__}: {e}", "out_path": job.get("out_path")}
+    res.setdefault("project", job.get("project"))
+    res.setdefault("revision", job.get("revision"))
+    return res
+
+
+def build_retrieval_indexes(jobs: List[Dict[str, Any]], max_workers: int = 1) -> List[Dict[str, Any]]:
+    """
+    Build several indexes concurrently, one process per job.
+    Each job is a dict of build_retrieval_index keyword arguments; results keep the job order.
+    """
+    if max_workers <= 1 or len(jobs) <= 1:
+        return [_build_retrieval_index_job(j) for j in jobs]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(_build_retrieval_index_job, jobs))
+
+
+def _defects4j_jobs(
+    bugs_file: str,
+    index_format: str,
+    force: bool,
+    file_cache_dir: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Jobs for a bug list with lines like "Chart 1" (paths under TRACE_WORK_ROOT)."""
+    work_root = Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work"))
+    jobs: List[Dict[str, Any]] = []
+    for line in Path(bugs_file).read_text(encoding="utf-8").splitlines():
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        pid, bid = parts[0], parts[1]
+        bug_id = f"{pid}-{bid}b"
+        jobs.append({
+            "workdir": str(work_root / "workdirs" / "defects4j" / bug_id),
+            "out_path": str(work_root / "defects4j_index" / f"{bug_id}_index.{index_format}"),
+            "benchmark": "defects4j",
+            "project": pid,
+            "revision": f"{bid}b",
+            "language": "java",
+            "force": force,
+            "index_format": index_format,
+            "file_cache_dir": file_cache_dir,
+            "engine": engine,
+        })
+    return jobs
+
+
+def _swebench_jobs(
+    instances_file: str,
+    index_format: str,
+    force: bool,
+    file_cache_dir: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Jobs for a SWE-bench instance list (one instance_id per line, paths under TRACE_WORK_ROOT)."""
+    work_root = Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work"))
+    jobs: List[Dict[str, Any]] = []
+    for line in Path(instances_file).read_text(encoding="utf-8").splitlines():
+        instance_id = line.strip()
+        if not instance_id or instance_id.startswith("#"):
+            continue
+        jobs.append({
+            "workdir": str(work_root / "workdirs" / "swebench_verified" / instance_id),
+            "out_path": str(work_root / "swebench_index" / f"{instance_id}_index.{index_format}"),
+            "benchmark": "swebench_verified",
+            "project": instance_id,
+            "language": "python",
+            "force": force,
+            "index_format": index_format,
+            "file_cache_dir": file_cache_dir,
+            "engine": engine,
+        })
+    return jobs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Build Layer-1 retrieval indexes")
+    parser.add_argument("--bugs-file", help="Defects4J bug list (lines: PID BID); workdirs/indexes under TRACE_WORK_ROOT")
+    parser.add_argument("--instances-file", help="SWE-bench instance list (one instance_id per line); Python, under TRACE_WORK_ROOT")
+    parser.add_argument("--workdir", help="Single checkout to index (with --out)")
+    parser.add_argument("--out", help="Output index path for --workdir")
+    parser.add_argument("--language", default="java")
+    parser.add_argument("--format", dest="index_format", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--jobs", type=int, default=1, help="Bugs indexed concurrently (--bugs-file/--instances-file)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes per index for file parsing (--workdir)")
+    parser.add_argument("--force", action="store_true", help="Rebuild existing indexes")
+    parser.add_argument("--file-cache", default=None,
+                        help="Per-file content-hash cache dir ('off' to disable; default $TRACE_WORK_ROOT/index_file_cache)")
+    parser.add_argument("--engine", default=None, choices=list(INDEX_ENGINES),
+                        help="Layer-1 parser (default TRACE_INDEX_ENGINE or auto: ast for Python, tree-sitter for Java if installed)")
+    args = parser.parse_args(argv)
+
+    if args.bugs_file or args.instances_file:
+        if args.bugs_file:
+            jobs = _defects4j_jobs(args.bugs_file, args.index_format, args.force, args.file_cache, args.engine)
+        else:
+            jobs = _swebench_jobs(args.instances_file, args.index_format, args.force, args.file_cache, args.engine)
+        missing = [j for j in jobs if not Path(j["workdir"]).exists()]
+        for j in missing:
+            print(json.dumps({"ok": False, "error": f"workdir not found: {j['workdir']}", "out_path": j["out_path"]}), flush=True)
+        results = build_retrieval_indexes([j for j in jobs if j not in missing], max_workers=args.jobs)
+    elif args.workdir and args.out:
+        results = [build_retrieval_index(
+            workdir=args.workdir,
+            out_path=args.out,
+            language=args.language,
+            force=args.force,
+            index_format=args.index_format,
+            workers=args.workers,
+            file_cache_dir=args.file_cache,
+            engine=args.engine,
+        )]
+    else:
+        parser.error("one of --bugs-file, --instances-file or --workdir with --out is required")
+        return 2
+
+    for r in results:
+        print(json.dumps(r, ensure_ascii=False), flush=True)
+    failed = [r for r in results if not r.get("ok")]
+    print(f"[INFO] indexes built: {len(results) - len(failed)} ok, {len(failed)} failed", file=sys.stderr, flush=True)
+    return 1 if failed else 0
 
 
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,15 @@
+import os
 import shutil
 import subprocess
+import tempfile
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
+from agent.file_view import read_lines
+from agent.tools_search import indexed_search
+from agent.utils import invalidate_file_fingerprints
+from agent.workdir_snapshot import diff_paths, record_originals, restore_workdir
+
 def _run(cmd: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
     # Be robust to non-UTF8 bytes from tools/logs (avoid crashing the whole run).
     p = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, encoding="utf-8", errors="replace")
@@ -12,45 +19,78 @@ def read_file(path: str, start_line: int = 1, end_line: int = 200) -> Dict[str,
     p = Path(path)
     if not p.exists():
         return {"ok": False, "error": f"file not found: {path}"}
-    lines = p.read_text(encoding="utf-8", errors="replace").splitlines()
     start = max(1, start_line)
-    end = min(len(lines), end_line)
-    snippet = "\n".join(f"{i+1}: {lines[i]}" for i in range(start-1, end))
+    # Shared mmapped view: only the requested lines are decoded
+    lines, n_lines = read_lines(p, start, end_line, errors="replace")
+    end = min(n_lines, end_line)
+    snippet = "\n".join(f"{i}: {line}" for i, line in enumerate(lines, start))
     return {"ok": True, "path": str(p), "start_line": start, "end_line": end, "snippet": snippet}
 
-def search_in_files(query: str, root: str, glob: str = "*", max_hits: int = 50) -> Dict[str, Any]:
+def _rg_search(rg: str, query: str, rootp: Path, glob: str, max_hits: int, file_type: Optional[str]) -> Dict[str, Any]:
+    """
+    Stream rg output and stop it after max_hits (+1 to detect truncation), so time and memory
+    are bounded by the hit limit rather than by how often the query matches.
+    """
+    cmd = [rg, "-n", "--no-heading", "--with-filename", "--null", "--color", "never",
+           "--max-count", str(max_hits + 1),
+           "--max-filesize", os.environ.get("TRACE_SEARCH_MAX_FILESIZE", "2M"),
+           "--glob", glob]
+    if file_type:
+        cmd += ["--type", file_type]
+    cmd += ["-e", query, str(rootp)]
+    hits: List[Dict[str, Any]] = []
+    truncated = False
+    with tempfile.TemporaryFile() as err:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+        try:
+            for raw in p.stdout:
+                # --null: "path\0line:text"
+                path, sep, rest = raw.rstrip(b"\r\n").partition(b"\0")
+                line_no, sep2, text = rest.partition(b":")
+                if not sep or not sep2 or not line_no.isdigit():
+                    continue
+                if len(hits) >= max_hits:
+                    truncated = True
+                    break
+                hits.append({
+                    "path": path.decode("utf-8", errors="replace"),
+                    "line": int(line_no),
+                    "text": text.decode("utf-8", errors="replace"),
+                })
+        finally:
+            if truncated:
+                p.kill()
+            p.stdout.close()
+            rc = p.wait()
+        if not truncated and rc not in (0, 1):  # 1 means no matches
+            err.seek(0)
+            stderr = err.read().decode("utf-8", errors="replace")
+            return {"ok": False, "error": "rg failed", "rc": rc, "stdout": "", "stderr": stderr[-2000:]}
+    return {"ok": True, "engine": "rg", "hits": hits, "truncated": truncated}
+
+def search_in_files(
+    query: str,
+    root: str,
+    glob: str = "*",
+    max_hits: int = 50,
+    file_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Regex search under root: {"path", "line", "text"} hits, at most max_hits of them
+    ("truncated" tells whether more exist). file_type is a ripgrep type name such as "py" or "java".
+    """
     rootp = Path(root)
     if not rootp.exists():
         return {"ok": False, "error": f"root not found: {root}"}
+    max_hits = max(1, int(max_hits))
 
-    rg = shutil.which("rg")
-    hits = []
+    engine = os.environ.get("TRACE_SEARCH_ENGINE", "auto").lower()
+    rg = shutil.which("rg") if engine != "index" else None
     if rg:
-        cmd = [rg, "-n", "--no-heading", "--glob", glob, query, str(rootp)]
-        r = _run(cmd)
-        if r["rc"] not in (0, 1):  # 1 means no matches
-            return {"ok": False, "error": "rg failed", **r}
-        for line in (r["stdout"] or "").splitlines()[:max_hits]:
-            parts = line.split(":", 2)
-            if len(parts) == 3:
-                try:
-                    hits.append({"path": parts[0], "line": int(parts[1]), "text": parts[2]})
-                except Exception:
-                    continue
-        return {"ok": True, "engine": "rg", "hits": hits}
+        return _rg_search(rg, query, rootp, glob, max_hits, file_type)
 
-    # fallback (slower)
-    for fp in rootp.rglob(glob):
-        try:
-            txt = fp.read_text(encoding="utf-8", errors="replace").splitlines()
-        except Exception:
-            continue
-        for i, s in enumerate(txt, start=1):
-            if query in s:
-                hits.append({"path": str(fp), "line": i, "text": s})
-                if len(hits) >= max_hits:
-                    return {"ok": True, "engine": "py", "hits": hits}
-    return {"ok": True, "engine": "py", "hits": hits}
+    # No ripgrep: in-process trigram index (built once per root, kept across queries)
+    return indexed_search(query, root, glob, max_hits, file_type)
 
 def apply_patch(workdir: str, unified_diff: str) -> Dict[str, Any]:
     wd = Path(workdir)
@@ -74,12 +114,16 @@ def apply_patch(workdir: str, unified_diff: str) -> Dict[str, Any]:
         error_detail = (check_r.get("stderr", "") or check_r.get("stdout", ""))[:800]
         return {"ok": False, "error": "patch check failed (patch may be corrupt or incompatible)", "stderr": error_detail, "check_failed": True, **check_r}
     
+    # Save what the patch is about to change, so a rejection only restores those files
+    record_originals(str(wd), diff_paths(unified_diff))
     # Try to apply with more lenient options
     r = _run(["git", "apply", "--whitespace=nowarn", "--ignore-space-change", "--ignore-whitespace", str(patch_path)], cwd=str(wd))
+    # Files changed (or were reset): cached tool results must be re-keyed by their new content
+    invalidate_file_fingerprints()
     if r["rc"] != 0:
         # Get more detailed error information
         error_detail = (r.get("stderr", "") or r.get("stdout", ""))[:800]
-        _run(["git", "reset", "--hard"], cwd=str(wd))
+        restore_workdir(str(wd))
         return {"ok": False, "error": f"git apply failed; repo reset", "stderr": error_detail, **r}
     return {"ok": True, "applied": True}
 
@@ -188,7 +232,9 @@ def apply_edits(workdir: str, edits_json: str) -> Dict[str, Any]:
                 continue
             
             # Content changed, write it
+            record_originals(workdir, [file_edit["path"]])
             file_path.write_text(new_content, encoding="utf-8")
+            invalidate_file_fingerprints([str(file_path)])
             applied_files.append(file_edit["path"])
             
         except Exception as e:
@@ -208,9 +254,9 @@ def apply_edits(workdir: str, edits_json: str) -> Dict[str, Any]:
     
     return {"ok": True, "applied_files": applied_files}
 
-def get_git_diff(workdir: str) -> Dict[str, Any]:
+def get_git_diff(workdir: str, paths: Optional[List[str]] = None) -> Dict[str, Any]:
     """
-    Get git diff of current changes in workdir.
+    Get git diff of current changes in workdir (limited to workdir-relative paths if given).
     Returns the unified diff format that can be used as a patch.
     """
     wd = Path(workdir)
@@ -221,7 +267,7 @@ def get_git_diff(workdir: str) -> Dict[str, Any]:
         return {"ok": False, "error": f"not a git repository: {workdir}"}
     
     # Get diff
-    r = _run(["git", "diff", "--no-color"], cwd=str(wd))
+    r = _run(["git", "--literal-pathspecs", "diff", "--no-color", *(["--", *paths] if paths else [])], cwd=str(wd))
     if r["rc"] != 0:
         return {"ok": False, "error": "git diff failed", **r}
     
@@ -4,16 +4,17 @@ Localize phase tools (LLM-callable).
 These tools are intended for the LOCALIZE stage:
 - read_file
 - search_in_files
-- (G2/TRACE) symbol_lookup / find_references / read_span
+- (G2/TRACE) symbol_lookup / find_references / read_span / read_spans / explain_symbols
 """
 
 from __future__ import annotations
 
+import threading
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from agent.tools_common import read_file, search_in_files
-from agent.tools_build_index import symbol_lookup, find_references, read_span
+from agent.tools_build_index import symbol_lookup, find_references, read_span, read_spans, explain_symbols
 
 
 def localize_tool_schemas(*, enable_index_retrieval: bool) -> List[Dict[str, Any]]:
@@ -29,12 +30,13 @@ def localize_tool_schemas(*, enable_index_retrieval: bool) -> List[Dict[str, Any
         }},
         {"type": "function", "function": {
             "name": "search_in_files",
-            "description": "Search query under root",
+            "description": "Search query (regex) under root; returns at most max_hits hits and whether more were cut off",
             "parameters": {"type": "object", "properties": {
                 "query": {"type": "string"},
                 "root": {"type": "string"},
                 "glob": {"type": "string"},
                 "max_hits": {"type": "integer"},
+                "file_type": {"type": "string", "description": "Only files of this type, e.g. py or java"},
             }, "required": ["query", "root"]},
         }},
     ]
@@ -59,20 +61,93 @@ def localize_tool_schemas(*, enable_index_retrieval: bool) -> List[Dict[str, Any
             }},
             {"type": "function", "function": {
                 "name": "read_span",
-                "description": "Read a span of code from a file (workdir-relative supported)",
+                "description": "Read a span of code from a file (workdir-relative supported); "
+                               "with snap_to_def and index_path, widen it to the whole enclosing method/class",
                 "parameters": {"type": "object", "properties": {
                     "path": {"type": "string"},
                     "start_line": {"type": "integer"},
                     "end_line": {"type": "integer"},
+                    "index_path": {"type": "string"},
+                    "snap_to_def": {"type": "boolean", "description": "Return the innermost enclosing definition instead of the exact range"},
+                    "max_lines": {"type": "integer", "description": "Do not snap to definitions longer than this (default 200)"},
                 }, "required": ["path", "start_line", "end_line"]},
             }},
+            {"type": "function", "function": {
+                "name": "read_spans",
+                "description": "Read several spans (possibly from several files) in one call; "
+                               "overlapping ranges are merged and the output is capped at max_chars",
+                "parameters": {"type": "object", "properties": {
+                    "spans": {"type": "array", "items": {"type": "object", "properties": {
+                        "path": {"type": "string"},
+                        "start_line": {"type": "integer"},
+                        "end_line": {"type": "integer"},
+                    }, "required": ["path", "start_line", "end_line"]}},
+                    "max_chars": {"type": "integer", "description": "Total content budget (default 8000)"},
+                }, "required": ["spans"]},
+            }},
+            {"type": "function", "function": {
+                "name": "explain_symbols",
+                "description": "For each symbol: top definitions with their (trimmed) bodies and the top callers, "
+                               "i.e. symbol_lookup + read_span + find_references in one call",
+                "parameters": {"type": "object", "properties": {
+                    "index_path": {"type": "string"},
+                    "symbols": {"type": "array", "items": {"type": "string"}},
+                    "max_callers": {"type": "integer", "description": "Callers per symbol (default 5)"},
+                }, "required": ["index_path", "symbols"]},
+            }},
         ])
 
     return schemas
 
 
-def register_localize_tools(func_map: Dict[str, Any], *, workdir: str, enable_index_retrieval: bool) -> None:
-    """Populate func_map with localize-stage tools."""
+class SymbolBlockBudget:
+    """
+    G2 working-set limit of one localization round, in symbol blocks.
+
+    The agent loop charges the blocks it counts per tool result; explain_symbols claims
+    everything left before reading bodies and releases what it did not use, so calls
+    running concurrently in one turn cannot overrun the limit together.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reset(self, limit: Optional[int] = None) -> None:
+        with self._lock:
+            if limit is not None:
+                self.limit = limit
+            self.used = 0
+
+    def charge(self, n: int) -> None:
+        with self._lock:
+            self.used += n
+
+    def claim(self) -> int:
+        with self._lock:
+            n = max(0, self.limit - self.used)
+            self.used += n
+            return n
+
+    def release(self, n: int) -> None:
+        with self._lock:
+            self.used -= max(0, n)
+
+
+def register_localize_tools(
+    func_map: Dict[str, Any],
+    *,
+    workdir: str,
+    enable_index_retrieval: bool,
+    max_symbol_blocks: int = 10,
+    block_budget: Optional[SymbolBlockBudget] = None,
+) -> None:
+    """
+    Populate func_map with localize-stage tools. explain_symbols returns at most the blocks
+    left in block_budget (a fresh max_symbol_blocks budget when not given).
+    """
+    budget = block_budget if block_budget is not None else SymbolBlockBudget(max_symbol_blocks)
 
     def read_file_wrapper(path: str, start_line=None, end_line=None):
         p = Path(path)
@@ -86,14 +161,26 @@ def register_localize_tools(func_map: Dict[str, Any], *, workdir: str, enable_in
 
     func_map["read_file"] = read_file_wrapper
     # search_in_files doesn't support start_line/end_line, ignore them if provided
-    def search_in_files_wrapper(query: str, root: str, glob: str = "**/*", max_hits: int = 50, **kwargs):
+    def search_in_files_wrapper(query: str, root: str, glob: str = "**/*", max_hits: int = 50, file_type=None, **kwargs):
         # Ignore unsupported parameters like start_line, end_line that LLM might pass
-        return search_in_files(query, root, glob, max_hits)
+        return search_in_files(query, root, glob, max_hits, file_type)
     func_map["search_in_files"] = search_in_files_wrapper
 
     if enable_index_retrieval:
         func_map["symbol_lookup"] = lambda index_path, symbol, max_candidates=10: symbol_lookup(index_path, symbol, max_candidates)
         func_map["find_references"] = lambda index_path, symbol: find_references(index_path, symbol)
-        func_map["read_span"] = lambda path, start_line, end_line: read_span(path, start_line, end_line, workdir)
+        func_map["read_span"] = lambda path, start_line, end_line, index_path=None, snap_to_def=False, max_lines=200: read_span(
+            path, start_line, end_line, workdir, index_path=index_path, snap_to_def=snap_to_def, max_lines=max_lines)
+        func_map["read_spans"] = lambda spans, max_chars=8000: read_spans(spans, workdir, max_chars=max_chars)
+
+        def explain_symbols_wrapper(index_path: str, symbols, max_callers: int = 5):
+            claimed = budget.claim()
+            res: Dict[str, Any] = {}
+            try:
+                res = explain_symbols(index_path, symbols, workdir, max_callers=max_callers, max_blocks=claimed)
+            finally:
+                budget.release(claimed - int(res.get("blocks", 0)))
+            return res
+        func_map["explain_symbols"] = explain_symbols_wrapper
 
 
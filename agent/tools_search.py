@@ -0,0 +1,369 @@
+"""
+In-process search over a checkout, backed by a per-root trigram index.
+
+search_in_files falls back to this engine when ripgrep is not installed (or when
+TRACE_SEARCH_ENGINE=index). The first query under a root reads every text file once
+and records which files contain each 3-character sequence; later queries only scan
+the files that contain all trigrams of the query's literal parts.
+
+Edits reported through agent.utils.invalidate_file_fingerprints mark single files
+dirty (they are re-read on the next query, and files the index did not hold yet are
+added); a tree-wide invalidation drops the index.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from agent.utils import on_files_invalidated
+
+# ripgrep --type names understood without ripgrep (file name patterns)
+_FILE_TYPES: Dict[str, Tuple[str, ...]] = {
+    "py": ("*.py", "*.pyi"),
+    "java": ("*.java", "*.jsp", "*.properties"),
+    "js": ("*.js", "*.jsx", "*.mjs", "*.cjs", "*.vue"),
+    "ts": ("*.ts", "*.tsx", "*.cts", "*.mts"),
+    "c": ("*.c", "*.h", "*.H"),
+    "cpp": ("*.cpp", "*.cc", "*.cxx", "*.hpp", "*.hh", "*.hxx", "*.h", "*.inl"),
+    "go": ("*.go",),
+    "rust": ("*.rs",),
+    "kotlin": ("*.kt", "*.kts"),
+    "scala": ("*.scala", "*.sbt"),
+    "xml": ("*.xml", "*.xsd", "*.xsl", "*.xslt", "*.dtd"),
+    "json": ("*.json", "*.jsonl"),
+    "yaml": ("*.yaml", "*.yml"),
+    "toml": ("*.toml",),
+    "md": ("*.md", "*.markdown", "*.mdx"),
+    "rst": ("*.rst",),
+    "txt": ("*.txt",),
+    "html": ("*.html", "*.htm", "*.xhtml"),
+    "css": ("*.css", "*.scss"),
+    "sh": ("*.sh", "*.bash", "*.zsh"),
+}
+
+_REGEX_META = set(".^$*+?{}[]()|\\")
+_ESCAPED_LITERALS = set(".^$*+?{}[]()|\\/-#&~\"' ")
+
+
+# Files with longer lines (data, minified code, logs) are not worth trigram-indexing;
+# they are kept as plain text and scanned on every query instead.
+_MAX_INDEXED_LINE = 1000
+
+
+def _line_trigrams(text: str) -> Optional[Set[str]]:
+    """Trigrams of the file's lines (matches never span lines); None if a line is too long to index."""
+    grams: Set[str] = set()
+    for ln in set(text.splitlines()):
+        if len(ln) > _MAX_INDEXED_LINE:
+            return None
+        grams.update(ln[i:i + 3] for i in range(len(ln) - 2))
+    return grams
+
+
+def _skip_group(query: str, i: int) -> int:
+    """Index of the char closing the class/group that opens at query[i] (len(query) if unclosed)."""
+    n = len(query)
+    if query[i] == "[":
+        j = i + 1
+        if j < n and query[j] == "^":
+            j += 1
+        if j < n and query[j] == "]":
+            j += 1
+        while j < n and query[j] != "]":
+            j += 2 if query[j] == "\\" else 1
+        return j
+    depth, j = 0, i
+    while j < n:
+        c = query[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "[":
+            j = _skip_group(query, j)
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+        j += 1
+    return n
+
+
+def _required_literals(query: str) -> List[str]:
+    """
+    Literal substrings every match of regex `query` must contain (conservative; may be empty).
+    Alternations disable filtering; groups and classes are skipped; a quantified char ends a run.
+    """
+    if "|" in query or query.startswith("(?"):
+        return []
+    runs: List[str] = []
+    cur: List[str] = []
+    i, n = 0, len(query)
+
+    def flush() -> None:
+        if cur:
+            runs.append("".join(cur))
+            cur.clear()
+
+    while i < n:
+        c = query[i]
+        if c == "\\" and i + 1 < n:
+            if query[i + 1] in _ESCAPED_LITERALS:
+                cur.append(query[i + 1])
+            else:
+                flush()
+            i += 2
+            continue
+        if c in "?*{":
+            # the previous char is optional (or repeated a variable number of times)
+            if cur:
+                cur.pop()
+            flush()
+            if c == "{":
+                close = query.find("}", i)
+                i = close + 1 if close >= 0 else n
+                continue
+        elif c in "[(":
+            flush()
+            i = _skip_group(query, i)
+            # a quantifier after the group/class makes it optional; nothing was kept from it anyway
+        elif c in _REGEX_META:
+            flush()
+        else:
+            cur.append(c)
+        i += 1
+    flush()
+    return [r for r in runs if len(r) >= 3]
+
+
+def _compile_query(query: str) -> Tuple[List[str], Callable[[str], Any]]:
+    """(required literals, line predicate) for a regex query; invalid patterns are searched literally."""
+    try:
+        return _required_literals(query), re.compile(query).search
+    except re.error:
+        return ([query] if query else []), (lambda s: query in s)
+
+
+def _match_lines(path: str, text: str, match: Callable[[str], Any], hits: List[Dict[str, Any]], max_hits: int) -> bool:
+    """Append matching lines of one file to hits; True once max_hits is reached."""
+    for i, s in enumerate(text.splitlines(), start=1):
+        if match(s):
+            hits.append({"path": path, "line": i, "text": s})
+            if len(hits) >= max_hits:
+                return True
+    return False
+
+
+class _TrigramIndex:
+    """Text files under one root, their contents, and trigram -> file ids postings."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.paths: List[Path] = []
+        self.texts: List[Optional[str]] = []
+        self.postings: Dict[str, List[int]] = {}
+        # Files edited since the build: postings are stale for them, so they are always candidates
+        self.dirty: Set[int] = set()
+        self._reread: Set[int] = set()
+        self.unindexed: Set[int] = set()
+        self._glob_ids: Dict[str, FrozenSet[int]] = {}
+        self._id_of: Dict[str, int] = {}
+        # Files added after the build have ids out of walk order
+        self._added = False
+        self.lock = threading.Lock()
+        self._build()
+
+    def _build(self) -> None:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if d != ".git")
+            for fn in sorted(filenames):
+                fp = Path(dirpath) / fn
+                text = self._read(fp)
+                if text is None:
+                    continue
+                fid = len(self.paths)
+                self.paths.append(fp)
+                self.texts.append(text)
+                self._id_of[str(fp)] = fid
+                grams = _line_trigrams(text)
+                if grams is None:
+                    self.unindexed.add(fid)
+                    continue
+                for g in grams:
+                    ids = self.postings.get(g)
+                    if ids is None:
+                        self.postings[g] = [fid]
+                    else:
+                        ids.append(fid)
+
+    @staticmethod
+    def _read(fp: Path) -> Optional[str]:
+        try:
+            data = fp.read_bytes()
+        except OSError:
+            return None
+        # Binary files are skipped (as ripgrep does by default)
+        if b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def mark_dirty(self, path: str) -> None:
+        """Re-read path on the next query; a path the build did not keep (new, binary, unreadable) is added."""
+        with self.lock:
+            fid = self._id_of.get(path)
+            if fid is None:
+                fp = Path(path)
+                if ".git" in fp.relative_to(self.root).parts:
+                    return
+                fid = len(self.paths)
+                self.paths.append(fp)
+                self.texts.append(None)
+                self._id_of[path] = fid
+                self._glob_ids.clear()
+                self._added = True
+            self.dirty.add(fid)
+            self._reread.add(fid)
+
+    def _walk_key(self, fid: int) -> Tuple[Tuple[int, str], ...]:
+        # os.walk order of _build: sorted, and a directory's files before its subdirectories
+        parts = self.paths[fid].relative_to(self.root).parts
+        return tuple((1, d) for d in parts[:-1]) + ((0, parts[-1]),)
+
+    def _ids_for_glob(self, glob: str, file_type: Optional[str] = None) -> FrozenSet[int]:
+        key = f"{glob}\0{file_type or ''}"
+        ids = self._glob_ids.get(key)
+        if ids is None:
+            # Same file selection as the previous rglob-based fallback
+            ids = frozenset(self._id_of[str(p)] for p in self.root.rglob(glob) if str(p) in self._id_of)
+            if file_type:
+                pats = _FILE_TYPES[file_type]
+                ids = frozenset(i for i in ids if any(fnmatch.fnmatchcase(self.paths[i].name, pat) for pat in pats))
+            self._glob_ids[key] = ids
+        return ids
+
+    def _candidates(self, literals: List[str]) -> Optional[Set[int]]:
+        grams = {lit[i:i + 3] for lit in literals for i in range(len(lit) - 2)}
+        if not grams:
+            return None
+        lists = sorted((self.postings.get(g, []) for g in grams), key=len)
+        out = set(lists[0])
+        for ids in lists[1:]:
+            if not out:
+                break
+            out.intersection_update(ids)
+        return out
+
+    def search(self, query: str, glob: str, max_hits: int, file_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        literals, match = _compile_query(query)
+        with self.lock:
+            for fid in self._reread:
+                self.texts[fid] = self._read(self.paths[fid])
+            self._reread.clear()
+            dirty = set(self.dirty)
+
+        ids = self._ids_for_glob(glob, file_type)
+        cand = self._candidates(literals)
+        if cand is not None:
+            ids = ids & (cand | dirty | self.unindexed)
+
+        hits: List[Dict[str, Any]] = []
+        for fid in sorted(ids, key=self._walk_key) if self._added else sorted(ids):
+            text = self.texts[fid]
+            if not text:
+                continue
+            if literals and not all(lit in text for lit in literals):
+                continue
+            if _match_lines(str(self.paths[fid]), text, match, hits, max_hits):
+                break
+        return hits
+
+
+class _SearchIndexCache:
+    """Process-wide LRU of trigram indexes keyed by resolved root."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, _TrigramIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"builds": 0, "hits": 0, "invalidations": 0}
+
+    def get(self, root: Path) -> _TrigramIndex:
+        key = str(root)
+        with self._lock:
+            idx = self._entries.get(key)
+            if idx is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return idx
+        idx = _TrigramIndex(root)
+        with self._lock:
+            self._stats["builds"] += 1
+            self._entries[key] = idx
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return idx
+
+    def invalidate(self, paths: Optional[List[str]] = None) -> None:
+        with self._lock:
+            self._stats["invalidations"] += 1
+            if paths is None:
+                self._entries.clear()
+                return
+            for p in paths:
+                rp = str(Path(p).resolve())
+                for key, idx in self._entries.items():
+                    if rp.startswith(key.rstrip(os.sep) + os.sep):
+                        idx.mark_dirty(rp)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+            return out
+
+
+_SEARCH_INDEXES = _SearchIndexCache(max_entries=int(os.environ.get("TRACE_SEARCH_INDEX_MAX_ENTRIES", "2")))
+on_files_invalidated(_SEARCH_INDEXES.invalidate)
+
+
+def get_search_index_stats() -> Dict[str, Any]:
+    return _SEARCH_INDEXES.stats()
+
+
+def indexed_search(
+    query: str,
+    root: str,
+    glob: str = "*",
+    max_hits: int = 50,
+    file_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """search_in_files over the trigram index of `root` (built on first use)."""
+    rootp = Path(root).resolve()
+    if not rootp.exists():
+        return {"ok": False, "error": f"root not found: {root}"}
+    if file_type and file_type not in _FILE_TYPES:
+        return {"ok": False, "error": f"unrecognized file type: {file_type} (known: {', '.join(sorted(_FILE_TYPES))})"}
+    if not rootp.is_dir():
+        # A single file is searched directly (explicit paths bypass the glob, as in rg)
+        literals, match = _compile_query(query)
+        text = _TrigramIndex._read(rootp) or ""
+        hits: List[Dict[str, Any]] = []
+        if all(lit in text for lit in literals):
+            _match_lines(root, text, match, hits, max_hits + 1)
+        return {"ok": True, "engine": "index", "hits": hits[:max_hits], "truncated": len(hits) > max_hits}
+    idx = _SEARCH_INDEXES.get(rootp)
+    # One extra hit tells whether the result was cut at max_hits
+    hits = idx.search(query, glob, max_hits + 1, file_type)
+    truncated = len(hits) > max_hits
+    hits = hits[:max_hits]
+    if str(rootp) != root:
+        # Report paths under the root as given, like `rg ... <root>` and rglob do
+        hits = [dict(h, path=str(Path(root) / Path(h["path"]).relative_to(rootp))) for h in hits]
+    return {"ok": True, "engine": "index", "hits": hits, "truncated": truncated}
@@ -3,49 +3,307 @@ Utility functions for the APR framework.
 """
 import json
 import hashlib
+import os
 import re
 import sys
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
-# Global tool call cache
-_tool_call_cache = {}
 
+# Tools whose results depend only on their args and the files they read
+CACHEABLE_TOOLS = ("read_file", "read_span", "read_spans", "symbol_lookup", "find_references")
 
-def get_cache_key(func_name: str, args: dict) -> str:
+# path -> (size, mtime_ns, sha1 of content, time of hashing in ns); content hashes are only
+# recomputed when the stat changes, or when the file was modified so close to the hashing
+# that a same-size rewrite could have kept its mtime (filesystem timestamp granularity)
+_file_fingerprints: Dict[str, Tuple[int, int, str, int]] = {}
+_MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+def _file_fingerprint(path: Path, content_hash: bool = True) -> Optional[str]:
+    """Fingerprint of a file's current state ("" if missing); None if it cannot be read."""
+    key = str(path)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        _file_fingerprints.pop(key, None)
+        return ""
+    except OSError:
+        return None
+    if not content_hash:
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    memo = _file_fingerprints.get(key)
+    if (
+        memo is not None
+        and memo[0] == st.st_size
+        and memo[1] == st.st_mtime_ns
+        and memo[3] - st.st_mtime_ns > _MTIME_GRANULARITY_NS
+    ):
+        return memo[2]
+    hashed_at = time.time_ns()
+    try:
+        digest = hashlib.sha1(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+    _file_fingerprints[key] = (st.st_size, st.st_mtime_ns, digest, hashed_at)
+    return digest
+
+
+# Other per-file caches (e.g. the search index) that must drop state when files change
+_invalidation_listeners: List[Callable[[Optional[List[str]]], None]] = []
+
+
+def on_files_invalidated(listener: Callable[[Optional[List[str]]], None]) -> None:
+    """Register listener(paths) to be called on invalidate_file_fingerprints (None = whole tree)."""
+    _invalidation_listeners.append(listener)
+
+
+def invalidate_file_fingerprints(paths: Optional[List[str]] = None) -> None:
+    """Forget memoized file hashes (all, or the given paths) after the tree was modified."""
+    if paths is None:
+        _file_fingerprints.clear()
+    else:
+        for p in paths:
+            _file_fingerprints.pop(str(Path(p).resolve()), None)
+    for listener in _invalidation_listeners:
+        listener(paths)
+
+
+def _tool_dependencies(func_name: str, args: dict, workdir: Optional[str]) -> Optional[List[str]]:
+    """
+    Fingerprints of the files a cacheable tool call reads, or None when the call should not be cached.
+    Source files are hashed by content (an edit changes the key even within one mtime tick);
+    retrieval indexes, which are only replaced wholesale, by size and mtime.
+    """
+    if func_name not in CACHEABLE_TOOLS:
+        return None
+    if func_name in ("symbol_lookup", "find_references"):
+        sources = [(args.get("index_path"), False)]
+    elif func_name == "read_spans":
+        spans = args.get("spans")
+        if not isinstance(spans, list):
+            return None
+        paths = {sp.get("path") if isinstance(sp, dict) else (sp[0] if isinstance(sp, list) and sp else None) for sp in spans}
+        sources = [(p, True) for p in sorted(paths, key=str)]
+    else:
+        sources = [(args.get("path"), True)]
+        if args.get("snap_to_def") and args.get("index_path"):
+            # Snapped spans also depend on the index's definition spans
+            sources.append((args.get("index_path"), False))
+    deps: List[str] = []
+    for path, content_hash in sources:
+        if not isinstance(path, str) or not path:
+            return None
+        p = Path(path)
+        if not p.is_absolute():
+            if not workdir:
+                return None
+            p = Path(workdir) / p
+        p = p.resolve()
+        fp = _file_fingerprint(p, content_hash=content_hash)
+        if fp is None:
+            return None
+        deps.extend((str(p), fp))
+    return deps
+
+
+# Bump when a cacheable tool's output for the same inputs changes, so persisted
+# results from older runs are not served (2: read_spans fits MAX_TOOL_RESULT_CHARS)
+_TOOL_RESULT_FORMAT = 2
+
+
+def get_cache_key(func_name: str, args: dict, deps: Optional[List[str]] = None) -> str:
     """Generate a cache key for a tool call."""
     # Sort args to ensure consistent keys
     sorted_args = json.dumps(args, sort_keys=True, ensure_ascii=False)
-    key_str = f"{func_name}:{sorted_args}"
+    key_str = f"{_TOOL_RESULT_FORMAT}:{func_name}:{sorted_args}"
+    if deps:
+        key_str += "\0" + "\0".join(deps)
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
-def get_cached_result(func_name: str, args: dict) -> Optional[Dict[str, Any]]:
-    """Get cached result for a tool call if available."""
-    cache_key = get_cache_key(func_name, args)
-    if cache_key in _tool_call_cache:
-        cached = _tool_call_cache[cache_key]
-        # Mark as cached in the result
-        result = cached.copy()
-        result["_cached"] = True
-        return result
-    return None
+class _ToolResultCache:
+    """
+    Process-wide LRU of tool results, bounded by the serialized size of the entries.
+
+    Entries are stored already marked ``_cached`` and returned as-is on a hit (no copy);
+    callers only serialize tool results and must not mutate them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "evicted_bytes": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: str, result: Dict[str, Any], nbytes: int, from_disk: bool = False) -> Dict[str, Any]:
+        cached = dict(result)
+        cached["_cached"] = True
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (cached, nbytes)
+            self._bytes += nbytes
+            if from_disk:
+                self._stats["disk_hits"] += 1
+            self._evict()
+        return cached
+
+    def _evict(self) -> None:
+        # Always keep the most recently used entry, even if it alone exceeds the cap.
+        while len(self._entries) > 1 and self._bytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self._stats["evictions"] += 1
+            self._stats["evicted_bytes"] += nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["bytes"] = self._bytes
+            out["max_bytes"] = self.max_bytes
+            return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
 
+_TOOL_CACHE = _ToolResultCache(max_bytes=int(os.environ.get("TRACE_TOOL_CACHE_MAX_MB", "256")) * 1024 * 1024)
 
-def cache_tool_result(func_name: str, args: dict, result: Dict[str, Any]):
-    """Cache a tool call result."""
-    # Only cache successful results for certain functions
-    cacheable_functions = ["read_file", "read_span", "symbol_lookup", "find_references"]
-    if func_name in cacheable_functions and result.get("ok"):
-        cache_key = get_cache_key(func_name, args)
-        _tool_call_cache[cache_key] = result.copy()
+
+def get_tool_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters and current size of the in-process tool cache."""
+    return _TOOL_CACHE.stats()
+
+
+class _ToolResultStore:
+    """
+    On-disk tool results shared across runs (variants G0..TRACE of one bug, retries, batch workers).
+    Keys embed the fingerprints of the files a call read, so entries for edited files are simply
+    never hit again. One SQLite file per cache dir; concurrent runs rely on SQLite's locking.
+    """
+
+    _SCHEMA = "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tool TEXT NOT NULL, result TEXT NOT NULL)"
+
+    def __init__(self, cache_dir: Path):
+        import sqlite3
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_dir / "tool_results.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(self._SCHEMA)
+        # One connection shared by ToolRuntime's worker threads
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, tool: str, result_json: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, tool, result_json))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_tool_result_store: Optional[_ToolResultStore] = None
+_tool_result_store_dir: Optional[str] = None
+_tool_result_store_lock = threading.Lock()
+
+
+def _default_tool_cache_dir() -> Optional[Path]:
+    """TRACE_TOOL_CACHE (path, or "off"); default under TRACE_WORK_ROOT."""
+    v = os.environ.get("TRACE_TOOL_CACHE")
+    if v is not None:
+        return None if v.strip().lower() in ("", "0", "off", "none", "false") else Path(v)
+    return Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")) / "tool_cache"
+
+
+def _get_tool_result_store() -> Optional[_ToolResultStore]:
+    global _tool_result_store, _tool_result_store_dir
+    cache_dir = _default_tool_cache_dir()
+    wanted = str(cache_dir) if cache_dir is not None else None
+    with _tool_result_store_lock:
+        if wanted != _tool_result_store_dir:
+            if _tool_result_store is not None:
+                _tool_result_store.close()
+            _tool_result_store, _tool_result_store_dir = None, wanted
+            if cache_dir is not None:
+                try:
+                    _tool_result_store = _ToolResultStore(cache_dir)
+                except Exception as e:
+                    print(f"[WARN] Persistent tool cache disabled ({cache_dir}): {e}", file=sys.stderr, flush=True)
+        return _tool_result_store
+
+
+def get_cached_result(func_name: str, args: dict, workdir: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Get cached result for a tool call if available (in-process first, then the on-disk store).
+    The returned dict is shared with the cache and already marked ``_cached``; do not mutate it.
+    """
+    deps = _tool_dependencies(func_name, args, workdir)
+    if deps is None:
+        return None
+    cache_key = get_cache_key(func_name, args, deps)
+    cached = _TOOL_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    store = _get_tool_result_store()
+    if store is None:
+        return None
+    try:
+        result_json = store.get(cache_key)
+    except Exception as e:
+        print(f"[WARN] Persistent tool cache read failed: {e}", file=sys.stderr, flush=True)
+        return None
+    if result_json is None:
+        return None
+    return _TOOL_CACHE.put(cache_key, json.loads(result_json), len(result_json), from_disk=True)
+
+
+def cache_tool_result(func_name: str, args: dict, result: Dict[str, Any], workdir: Optional[str] = None):
+    """Cache a tool call result (only successful results of CACHEABLE_TOOLS)."""
+    if not result.get("ok"):
+        return
+    deps = _tool_dependencies(func_name, args, workdir)
+    if deps is None:
+        return
+    cache_key = get_cache_key(func_name, args, deps)
+    result_json = json.dumps(result, ensure_ascii=False)
+    _TOOL_CACHE.put(cache_key, result, len(result_json))
+    store = _get_tool_result_store()
+    if store is not None:
+        try:
+            store.put(cache_key, func_name, result_json)
+        except Exception as e:
+            print(f"[WARN] Persistent tool cache write failed: {e}", file=sys.stderr, flush=True)
 
 
 def clear_cache():
-    """Clear the tool call cache."""
-    global _tool_call_cache
-    _tool_call_cache = {}
+    """Clear the in-process tool call cache (the on-disk store is keyed by file state and kept)."""
+    _TOOL_CACHE.clear()
+    invalidate_file_fingerprints()
 
 
 def extract_test_failure_info(logfile: str, workdir: str) -> Dict[str, Any]:
@@ -0,0 +1,115 @@
+"""
+Copy-on-write snapshots of the files a patch touches.
+
+apply_edits / apply_patch record the original bytes (or absence) of every file just before
+they first modify it. restore_workdir() writes back exactly those files, so undoing a
+rejected candidate costs O(changed files) instead of a `git reset --hard` that stats the
+whole tree. Other writers of tracked files (the Defects4J adapter's build-config fixes)
+record their originals the same way. The restored paths are verified against HEAD; when
+the restore cannot be trusted (unrecorded writes, a diff whose paths could not be parsed,
+a failed write, or restored files that still differ from HEAD) the workdir falls back to
+`git reset --hard HEAD` as before.
+"""
+
+from __future__ import annotations
+
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent.utils import invalidate_file_fingerprints
+
+# resolved workdir -> {relative path: original bytes, None if the file did not exist};
+# None when something was changed that the snapshot cannot restore
+_snapshots: Dict[str, Optional[Dict[str, Optional[bytes]]]] = {}
+_lock = threading.Lock()
+
+_DIFF_GIT_RE = re.compile(r'^diff --git ("?)a/(.+?)\1 ("?)b/(.+?)\3$')
+_DIFF_FILE_RE = re.compile(r"^(?:---|\+\+\+) (?:\"?[ab]/)?([^\t\n]+?)\"?(?:\t.*)?$")
+
+
+def diff_paths(unified_diff: str) -> Optional[List[str]]:
+    """Workdir-relative paths a unified diff touches (both sides of renames), or None if unparseable."""
+    paths: List[str] = []
+    for line in unified_diff.splitlines():
+        m = _DIFF_GIT_RE.match(line)
+        if m:
+            paths += [m.group(2), m.group(4)]
+            continue
+        m = _DIFF_FILE_RE.match(line)
+        if m and m.group(1) != "/dev/null":
+            paths.append(m.group(1))
+    if not paths or any("\\" in p for p in paths):
+        # No headers, or C-quoted names with escapes: let the git fallback handle it
+        return None
+    return list(dict.fromkeys(paths))
+
+
+def record_originals(workdir: str, paths: Optional[Iterable[str]]) -> None:
+    """
+    Save the current content of workdir-relative paths unless already saved since the last
+    restore. paths=None marks the workdir as changed in ways the snapshot cannot undo.
+    """
+    key = str(Path(workdir).resolve())
+    with _lock:
+        if paths is None:
+            _snapshots[key] = None
+            return
+        if key in _snapshots and _snapshots[key] is None:
+            return
+        saved = _snapshots.setdefault(key, {})
+        for rel in paths:
+            if rel in saved:
+                continue
+            try:
+                saved[rel] = (Path(key) / rel).read_bytes()
+            except FileNotFoundError:
+                saved[rel] = None
+            except OSError:
+                _snapshots[key] = None
+                return
+
+
+def _git_reset(workdir: str) -> Dict[str, Any]:
+    if not (Path(workdir) / ".git").exists():
+        return {"ok": False, "method": "none", "error": f"not a git repository: {workdir}"}
+    r = subprocess.run(["git", "reset", "--hard", "-q", "HEAD"], cwd=workdir, capture_output=True, text=True)
+    invalidate_file_fingerprints()
+    if r.returncode != 0:
+        return {"ok": False, "method": "git-reset", "error": (r.stderr or r.stdout)[:500]}
+    return {"ok": True, "method": "git-reset"}
+
+
+def restore_workdir(workdir: str) -> Dict[str, Any]:
+    """Undo every recorded change in workdir (falling back to git reset --hard HEAD)."""
+    key = str(Path(workdir).resolve())
+    with _lock:
+        saved = _snapshots.pop(key, None)
+    if not saved:
+        # Nothing recorded (or not restorable): same reset as before
+        return _git_reset(key)
+    restored: List[str] = []
+    try:
+        for rel, data in saved.items():
+            p = Path(key) / rel
+            if data is None:
+                if p.exists():
+                    p.unlink()
+            else:
+                p.parent.mkdir(parents=True, exist_ok=True)
+                p.write_bytes(data)
+            restored.append(str(p))
+    except OSError as e:
+        print(f"[WARN] Snapshot restore failed ({e}); falling back to git reset --hard", file=sys.stderr, flush=True)
+        return _git_reset(key)
+    invalidate_file_fingerprints(restored)
+    if (Path(key) / ".git").exists():
+        # Only the restored paths: a whole-tree diff would stat every file again
+        r = subprocess.run(["git", "--literal-pathspecs", "diff", "--quiet", "HEAD", "--", *saved], cwd=key, capture_output=True)
+        if r.returncode != 0:
+            print("[WARN] Snapshot restore left changes against HEAD; falling back to git reset --hard", file=sys.stderr, flush=True)
+            return _git_reset(key)
+    return {"ok": True, "method": "snapshot", "restored": len(restored)}
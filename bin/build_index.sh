@@ -15,17 +15,21 @@ BID=""
 VF="b"
 INSTANCE_ID=""
 WORKDIR=""
+FORMAT="json"
 
 usage() {
   cat <<EOF
 Usage:
-  bash bin/build_index.sh --dataset d4j --pid PID --bid BID [--vf b|f] [--workdir DIR]
-  bash bin/build_index.sh --dataset swe --instance-id ID [--workdir DIR]
+  bash bin/build_index.sh --dataset d4j --pid PID --bid BID [--vf b|f] [--workdir DIR] [--format json|sqlite]
+  bash bin/build_index.sh --dataset swe --instance-id ID [--workdir DIR] [--format json|sqlite]
 
 Examples:
   # Defects4J (Chart-1b); workdir/index under TRACE_WORK_ROOT:
   TRACE_WORK_ROOT=/tmp/trace_work bash bin/build_index.sh --dataset d4j --pid Chart --bid 1
 
+  # Defects4J, compact memory-mapped index (Chart-1b_index.sqlite):
+  bash bin/build_index.sh --dataset d4j --pid Chart --bid 1 --format sqlite
+
   # SWE-bench (workdir default: TRACE_WORK_ROOT/workdirs/swebench_verified/ID):
   bash bin/build_index.sh --dataset swe --instance-id sympy__sympy-20590
 EOF
@@ -39,6 +43,7 @@ while [ $# -gt 0 ]; do
     --vf) VF="${2:-b}"; shift 2;;
     --instance-id) INSTANCE_ID="${2:-}"; shift 2;;
     --workdir) WORKDIR="${2:-}"; shift 2;;
+    --format) FORMAT="${2:-json}"; shift 2;;
     -h|--help) usage; exit 0;;
     *) echo "[ERROR] unknown arg: $1" >&2; usage; exit 2;;
   esac
@@ -50,6 +55,12 @@ if [ "$DATASET" != "d4j" ] && [ "$DATASET" != "swe" ]; then
   exit 2
 fi
 
+if [ "$FORMAT" != "json" ] && [ "$FORMAT" != "sqlite" ]; then
+  echo "[ERROR] --format must be json or sqlite" >&2
+  usage
+  exit 2
+fi
+
 if [ "$DATASET" = "d4j" ]; then
   if [ -z "$PID" ] || [ -z "$BID" ]; then
     echo "[ERROR] --pid and --bid are required for dataset d4j" >&2
@@ -69,6 +80,7 @@ if [ "$DATASET" = "d4j" ]; then
   echo "[INFO] dataset=d4j pid=${PID} bid=${BID} vf=${VF}"
   echo "[INFO] workdir=${WORKDIR}"
   echo "[INFO] index_dir=${INDEX_DIR}"
+  echo "[INFO] format=${FORMAT}"
 
   python - <<PYEOF
 from agent.tools_build_index import build_retrieval_index
@@ -79,7 +91,8 @@ index_dir = Path("${INDEX_DIR}")
 pid = "${PID}"
 bid = "${BID}"
 bug_id = f"{pid}-{bid}b"
-out = index_dir / f"{bug_id}_index.json"
+fmt = "${FORMAT}"
+out = index_dir / f"{bug_id}_index.{fmt}"
 
 res = build_retrieval_index(
     workdir=workdir,
@@ -89,6 +102,7 @@ res = build_retrieval_index(
     revision=f"{bid}b",
     language="java",
     force=False,
+    index_format=fmt,
 )
 print(res)
 PYEOF
@@ -111,24 +125,32 @@ if [ "$DATASET" = "swe" ]; then
   INDEX_DIR="${WORK_ROOT}/swebench_index"
   mkdir -p "${INDEX_DIR}"
 
-  _PARSE_SCRIPT="${ROOT_DIR}/../abcoder/bin/parse_swebench_instance.sh"
-  if [ ! -x "$_PARSE_SCRIPT" ]; then
-    echo "[ERROR] SWE parse script not found or not executable: $_PARSE_SCRIPT" >&2
-    exit 2
-  fi
-
   echo "[INFO] dataset=swe instance_id=${INSTANCE_ID}"
   echo "[INFO] workdir=${WORKDIR}"
   echo "[INFO] index_dir=${INDEX_DIR}"
+  echo "[INFO] format=${FORMAT}"
 
-  bash "$_PARSE_SCRIPT" "$INSTANCE_ID" "$WORKDIR" python "$INDEX_DIR"
-  OUT_JSON="${INDEX_DIR}/${INSTANCE_ID}_index.json"
-  if [ -f "$OUT_JSON" ]; then
-    echo "{\"ok\": true, \"out_path\": \"$OUT_JSON\", \"cached\": false}"
-  else
-    echo "[ERROR] Index output not found: $OUT_JSON" >&2
-    exit 1
-  fi
+  python - <<PYEOF
+from agent.tools_build_index import build_retrieval_index
+from pathlib import Path
+
+workdir = "${WORKDIR}"
+index_dir = Path("${INDEX_DIR}")
+instance_id = "${INSTANCE_ID}"
+fmt = "${FORMAT}"
+out = index_dir / f"{instance_id}_index.{fmt}"
+
+res = build_retrieval_index(
+    workdir=workdir,
+    out_path=str(out),
+    benchmark="swebench_verified",
+    project=instance_id,
+    language="python",
+    force=False,
+    index_format=fmt,
+)
+print(res)
+PYEOF
 
   exit 0
 fi
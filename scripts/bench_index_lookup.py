@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: per-query latency of symbol_lookup and find_references on an
+ABCoder index, full-scan implementations (before) vs. the lookup tables built
+once per loaded index (after).
+
+Usage:
+  python scripts/bench_index_lookup.py --index $TRACE_WORK_ROOT/defects4j_index/Closure-1b_index.json
+  python scripts/bench_index_lookup.py --index ... --query Compiler.compile --query NodeUtil.isGet --repeat 5
+
+Without --query, a deterministic sample of Graph symbols is used as queries.
+Results of both implementations are compared and any mismatch is reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from agent.tools_build_index import (
+    _AbcoderRefView,
+    _AbcoderView,
+    _find_references_abcoder,
+    _score_symbol,
+    _symbol_lookup_abcoder,
+)
+
+
+def legacy_symbol_lookup(abcoder_obj: Dict[str, Any], symbol: str, max_candidates: int = 10) -> Dict[str, Any]:
+    """Previous implementation: score every Graph node, scan all Modules per scored node."""
+    graph = abcoder_obj.get("Graph", {}) or {}
+    modules = abcoder_obj.get("Modules", {}) or {}
+    scored = []
+    for node_key, node_data in graph.items():
+        if not isinstance(node_data, dict):
+            continue
+        node_name = node_data.get("Name", "")
+        pkg_path = node_data.get("PkgPath", "")
+        if pkg_path and node_name:
+            if "?" in node_key and "#" in node_key:
+                full_symbol = f"{pkg_path}.{node_key.split('#')[-1]}"
+            else:
+                full_symbol = f"{pkg_path}.{node_name}"
+        else:
+            full_symbol = node_name
+        score = _score_symbol(symbol, full_symbol)
+        if score <= 0:
+            continue
+        file_path, start_line, end_line, sig = "", 0, 0, ""
+        node_type = node_data.get("Type", "")
+        kind = {"FUNC": "method", "TYPE": "class", "VAR": "variable"}.get(node_type, "unknown")
+        for mod_data in modules.values():
+            if not isinstance(mod_data, dict):
+                continue
+            for pkg_data in (mod_data.get("Packages", {}) or {}).values():
+                if not isinstance(pkg_data, dict):
+                    continue
+                for func_info in (pkg_data.get("Functions", {}) or {}).values():
+                    if isinstance(func_info, dict) and func_info.get("Name") == node_name:
+                        file_path = func_info.get("File", "")
+                        start_line = func_info.get("Line", 0)
+                        sig = func_info.get("Signature", "")
+                        content = func_info.get("Content", "")
+                        end_line = start_line + len(content.splitlines()) - 1 if content else start_line
+                        break
+                for type_info in (pkg_data.get("Types", {}) or {}).values():
+                    if isinstance(type_info, dict) and type_info.get("Name") == node_name:
+                        file_path = type_info.get("File", "")
+                        start_line = type_info.get("Line", 0)
+                        content = type_info.get("Content", "")
+                        end_line = start_line + len(content.splitlines()) - 1 if content else start_line
+                        break
+        scored.append((score, {"symbol": full_symbol, "kind": kind, "path": file_path,
+                               "start": start_line, "end": end_line, "sig": sig}))
+    scored.sort(key=lambda t: (-t[0], t[1].get("path", ""), t[1].get("start", 0)))
+    hits = [{
+        "symbol": d.get("symbol"),
+        "kind": d.get("kind"),
+        "path": d.get("path"),
+        "start_line": d.get("start"),
+        "end_line": d.get("end"),
+        "score": score,
+        "sig": d.get("sig"),
+    } for score, d in scored[: max_candidates or 10]]
+    return {"ok": True, "query": symbol, "hits": hits, "engine": "abcoder"}
+
+
+def legacy_find_references(abcoder_obj: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+    """Previous implementation: rebuild node info from Modules, substring-scan every Graph edge."""
+    graph = abcoder_obj.get("Graph", {}) or {}
+    modules = abcoder_obj.get("Modules", {}) or {}
+    symbol_name = symbol.split(".")[-1].split("(")[0]
+    node_info_cache: Dict[str, Dict[str, Any]] = {}
+    for mod_name, mod_data in modules.items():
+        if not isinstance(mod_data, dict):
+            continue
+        for pkg_name, pkg_data in (mod_data.get("Packages", {}) or {}).items():
+            if not isinstance(pkg_data, dict):
+                continue
+            for section in ("Functions", "Types"):
+                for info in (pkg_data.get(section, {}) or {}).values():
+                    if isinstance(info, dict) and info.get("Name", ""):
+                        node_info_cache[f"{mod_name}?{pkg_name}#{info['Name']}"] = {
+                            "file": info.get("File", ""), "line": info.get("Line", 0),
+                            "pkg": pkg_name, "name": info["Name"],
+                        }
+    hits = []
+    seen_refs = set()
+    for node_key, node_data in graph.items():
+        if not isinstance(node_data, dict):
+            continue
+        caller_info = node_info_cache.get(node_key, {})
+        caller_file = caller_info.get("file", "")
+        caller_line = caller_info.get("line", 0)
+        caller_pkg = node_data.get("PkgPath", caller_info.get("pkg", ""))
+        caller_name = node_data.get("Name", caller_info.get("name", ""))
+        for ref in (node_data.get("References", []) or []) + (node_data.get("Dependencies", []) or []):
+            if not isinstance(ref, dict):
+                continue
+            ref_name = ref.get("Name", "")
+            ref_pkg = ref.get("PkgPath", "")
+            ref_symbol = f"{ref_pkg}.{ref_name}" if (ref_pkg and ref_name) else ref_name
+            if symbol in ref_symbol or symbol_name in ref_name:
+                ref_key = f"{caller_file}:{caller_line}:{symbol}"
+                if ref_key not in seen_refs:
+                    seen_refs.add(ref_key)
+                    hits.append({
+                        "symbol": symbol,
+                        "path": caller_file,
+                        "line": caller_line,
+                        "caller": f"{caller_pkg}.{caller_name}" if caller_pkg else caller_name,
+                    })
+    return {"ok": True, "query": symbol, "engine": "abcoder", "hits": hits[:200]}
+
+
+def _sample_queries(obj: Dict[str, Any], n: int) -> List[str]:
+    keys = sorted(k for k, v in (obj.get("Graph", {}) or {}).items() if isinstance(v, dict))
+    if not keys:
+        return []
+    step = max(1, len(keys) // n)
+    return [k.split("#")[-1] for k in keys[::step][:n]]
+
+
+def _time_queries(fn: Callable[[str], Dict[str, Any]], queries: List[str], repeat: int) -> List[float]:
+    per_query_ms = []
+    for q in queries:
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(q)
+            dt = (time.perf_counter() - t0) * 1000.0
+            best = dt if best is None else min(best, dt)
+        per_query_ms.append(best or 0.0)
+    return per_query_ms
+
+
+def _summary(ms: List[float]) -> str:
+    if not ms:
+        return "n=0"
+    s = sorted(ms)
+    p95 = s[min(len(s) - 1, int(round(0.95 * (len(s) - 1))))]
+    return f"n={len(s)} mean={statistics.mean(s):.2f}ms median={statistics.median(s):.2f}ms p95={p95:.2f}ms max={s[-1]:.2f}ms"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark symbol_lookup/find_references on an ABCoder index")
+    parser.add_argument("--index", required=True, help="Path to an ABCoder {bug_id}_index.json")
+    parser.add_argument("--query", action="append", default=[], help="Symbol query (repeatable)")
+    parser.add_argument("--samples", type=int, default=50, help="Number of sampled queries when --query is not given")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per query (best time is reported)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    obj = json.loads(Path(args.index).read_text(encoding="utf-8"))
+    parse_ms = (time.perf_counter() - t0) * 1000.0
+    t0 = time.perf_counter()
+    view = _AbcoderView(obj)
+    build_ms = (time.perf_counter() - t0) * 1000.0
+    t0 = time.perf_counter()
+    ref_view = _AbcoderRefView(obj)
+    ref_build_ms = (time.perf_counter() - t0) * 1000.0
+
+    queries = args.query or _sample_queries(obj, args.samples)
+    print(f"index: {args.index}")
+    print(f"graph nodes: {len(view.nodes)}  parse: {parse_ms:.1f}ms")
+    print(f"tables built once per load: symbols {build_ms:.1f}ms, callee->caller {ref_build_ms:.1f}ms")
+
+    cases = [
+        ("symbol_lookup",
+         lambda q: legacy_symbol_lookup(obj, q),
+         lambda q: _symbol_lookup_abcoder(obj, q, view=view)),
+        ("find_references",
+         lambda q: legacy_find_references(obj, q),
+         lambda q: _find_references_abcoder(obj, q, view=ref_view)),
+    ]
+    mismatches = []
+    for name, legacy_fn, new_fn in cases:
+        mismatches.extend(f"{name}:{q}" for q in queries if legacy_fn(q) != new_fn(q))
+        before = _time_queries(legacy_fn, queries, args.repeat)
+        after = _time_queries(new_fn, queries, args.repeat)
+        print(f"{name} before: {_summary(before)}")
+        print(f"{name} after:  {_summary(after)}")
+        if before and after and sum(after) > 0:
+            print(f"{name} speedup (total): {sum(before) / sum(after):.1f}x")
+    if mismatches:
+        print(f"[WARN] results differ for {len(mismatches)} queries, e.g. {mismatches[:5]}")
+        return 1
+    print("results identical for all queries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
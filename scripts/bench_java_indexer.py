@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+"""
+Benchmark: Java Layer-1 structural indexing, previous line-based indexer (before)
+vs. the single-pass scanner (_scan_java_source, after), plus the tree-sitter engine
+when tree-sitter and tree-sitter-java are installed.
+
+Usage:
+  python scripts/bench_java_indexer.py                      # largest Defects4J checkouts under TRACE_WORK_ROOT
+  python scripts/bench_java_indexer.py --top 5 --repeat 3
+  python scripts/bench_java_indexer.py --workdir $TRACE_WORK_ROOT/workdirs/defects4j/Closure-1b
+
+Files are read once up front, so only parsing is timed. Def/call counts of both
+indexers are printed side by side; they are not expected to match exactly (the
+scanner no longer mistakes field initializers for methods, keeps nested-class
+scopes after method bodies, and ignores calls inside comments and strings).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from agent.tools_build_index import _iter_code_files, _read_text, _scan_java_source, _ts_index_java_source, _ts_load
+
+JAVA_ROOTS = ["src/main/java", "src/test/java"]
+
+
+# ----------------------------
+# Previous implementation (kept here for comparison only)
+# ----------------------------
+
+LEGACY_JAVA_KEYWORDS = {
+    "if", "for", "while", "switch", "catch", "return", "throw", "new",
+    "synchronized", "do", "try", "else", "case", "default",
+}
+
+
+@dataclass
+class _ClassCtx:
+    name: str
+    brace_depth_enter: int
+
+
+def _strip_comments_and_strings(line: str, state: Dict[str, Any]) -> str:
+    """
+    Very small lexer to make brace counting and signature detection less wrong.
+    state contains: in_block_comment, in_string, in_char
+    """
+    out = []
+    i = 0
+    while i < len(line):
+        ch = line[i]
+        nxt = line[i + 1] if i + 1 < len(line) else ""
+
+        if state.get("in_block_comment"):
+            if ch == "*" and nxt == "/":
+                state["in_block_comment"] = False
+                i += 2
+                continue
+            i += 1
+            continue
+
+        if state.get("in_string"):
+            if ch == "\\":
+                i += 2
+                continue
+            if ch == "\"":
+                state["in_string"] = False
+            i += 1
+            continue
+
+        if state.get("in_char"):
+            if ch == "\\":
+                i += 2
+                continue
+            if ch == "'":
+                state["in_char"] = False
+            i += 1
+            continue
+
+        # entering comment/string/char
+        if ch == "/" and nxt == "/":
+            break
+        if ch == "/" and nxt == "*":
+            state["in_block_comment"] = True
+            i += 2
+            continue
+        if ch == "\"":
+            state["in_string"] = True
+            i += 1
+            continue
+        if ch == "'":
+            state["in_char"] = True
+            i += 1
+            continue
+
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _find_block_end(lines: List[str], start_idx: int) -> int:
+    """
+    Find end line (1-based) for the block that starts with an opening '{'
+    somewhere on lines[start_idx:].
+    """
+    state = {"in_block_comment": False, "in_string": False, "in_char": False}
+    depth = 0
+    started = False
+    for i in range(start_idx, len(lines)):
+        s = _strip_comments_and_strings(lines[i], state)
+        for ch in s:
+            if ch == "{":
+                depth += 1
+                started = True
+            elif ch == "}":
+                if started:
+                    depth -= 1
+                    if depth == 0:
+                        return i + 1  # 1-based
+    return len(lines)
+
+
+_PACKAGE_RE = re.compile(r"^\s*package\s+([a-zA-Z0-9_.]+)\s*;")
+_CLASS_RE = re.compile(r"\b(class|interface|enum)\s+([A-Za-z_][A-Za-z0-9_]*)\b")
+
+
+def legacy_index_java_source(content: str, rel: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Previous implementation: per-line lexing, brace recount, _find_block_end rescan per method."""
+    defs: List[Dict[str, Any]] = []
+    fallback_calls: List[Dict[str, Any]] = []
+
+    lines = content.splitlines()
+
+    pkg = ""
+    for ln in lines[:50]:
+        m = _PACKAGE_RE.match(ln)
+        if m:
+            pkg = m.group(1)
+            break
+
+    # Walk linearly tracking class nesting by brace depth heuristics
+    brace_state = {"in_block_comment": False, "in_string": False, "in_char": False}
+    brace_depth = 0
+    class_stack: List[_ClassCtx] = []
+    pending_class: Optional[str] = None
+    pending_class_depth: Optional[int] = None
+
+    # Multi-line signature buffering for methods/constructors
+    sig_buf: List[str] = []
+    sig_start_line: Optional[int] = None
+
+    def flush_sig():
+        nonlocal sig_buf, sig_start_line
+        sig_buf = []
+        sig_start_line = None
+
+    def current_class_name() -> Optional[str]:
+        return class_stack[-1].name if class_stack else None
+
+    def make_class_fqn() -> str:
+        return "$".join([c.name for c in class_stack]) if class_stack else ""
+
+    def is_control_like(sig: str) -> bool:
+        s0 = sig.strip()
+        if not s0:
+            return True
+        head = s0.split(None, 1)[0]
+        if head in LEGACY_JAVA_KEYWORDS:
+            return True
+        if s0.startswith(("if", "for", "while", "switch", "catch", "try", "do")):
+            return True
+        return False
+
+    def extract_callable_name(sig: str) -> Optional[str]:
+        # Find the identifier immediately before the first '(' in the signature
+        m = re.search(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(", sig)
+        if not m:
+            return None
+        name = m.group(1)
+        if name in LEGACY_JAVA_KEYWORDS:
+            return None
+        return name
+
+    def signature_has_body(sig: str) -> bool:
+        # A declaration ends with '{' for body; abstract/interface often ends with ';'
+        return "{" in sig
+
+    def signature_is_terminated(sig: str) -> bool:
+        # If body starts or terminates with ';' we can flush
+        s = sig.strip()
+        return ("{" in s) or s.endswith(";")
+
+    i = 0
+    while i < len(lines):
+        raw = lines[i]
+        s = _strip_comments_and_strings(raw, brace_state)
+
+        # detect class declarations
+        m = _CLASS_RE.search(s)
+        if m:
+            cname = m.group(2)
+            pending_class = cname
+            pending_class_depth = brace_depth
+
+        # update brace depth char-by-char to place class enter/exit
+        for ch in s:
+            if ch == "{":
+                brace_depth += 1
+                # enter pending class at the first '{' after decl
+                if pending_class is not None and pending_class_depth is not None and brace_depth == pending_class_depth + 1:
+                    class_stack.append(_ClassCtx(name=pending_class, brace_depth_enter=brace_depth))
+                    # record class def span (best-effort)
+                    class_fqn = "$".join([c.name for c in class_stack])
+                    sym = f"{pkg}.{class_fqn}" if pkg else class_fqn
+                    start_line = i + 1
+                    end_line = _find_block_end(lines, i)
+                    defs.append({
+                        "symbol": sym,
+                        "kind": "class",
+                        "path": rel,
+                        "start": start_line,
+                        "end": end_line,
+                        "sig": m.group(1) if m else None,
+                    })
+                    pending_class = None
+                    pending_class_depth = None
+            elif ch == "}":
+                # exit class scopes if needed
+                if class_stack and brace_depth == class_stack[-1].brace_depth_enter:
+                    class_stack.pop()
+                brace_depth = max(0, brace_depth - 1)
+
+        # detect method declarations (best-effort)
+        if class_stack:
+            # Start buffering signature if we see '(' but haven't started
+            if sig_start_line is None:
+                # Avoid starting on obvious control statements
+                if "(" in s and not is_control_like(s) and not s.strip().startswith("@"):
+                    sig_buf = [s.strip()]
+                    sig_start_line = i + 1
+            else:
+                # Continue buffering
+                if s.strip():
+                    sig_buf.append(s.strip())
+
+            if sig_start_line is not None:
+                sig_joined = " ".join(sig_buf)
+                # stop buffering if it grows too much
+                if len(sig_buf) > 12:
+                    flush_sig()
+                elif signature_is_terminated(sig_joined):
+                    # Decide if this is a method/constructor
+                    name = extract_callable_name(sig_joined)
+                    if name and not is_control_like(sig_joined):
+                        cls_name = current_class_name()
+                        class_fqn = make_class_fqn()
+                        is_ctor = (cls_name is not None and name == cls_name)
+                        kind = "method"
+                        member = name
+                        if is_ctor:
+                            kind = "constructor"
+                            member = "<init>"
+                        sym = f"{pkg}.{class_fqn}.{member}" if pkg else f"{class_fqn}.{member}"
+
+                        start_line = sig_start_line
+                        # If no body, treat as single-line span
+                        if signature_has_body(sig_joined):
+                            end_line = _find_block_end(lines, i if "{" in s else (sig_start_line - 1))
+                        else:
+                            end_line = start_line
+
+                        defs.append({
+                            "symbol": sym,
+                            "kind": kind,
+                            "path": rel,
+                            "start": start_line,
+                            "end": end_line,
+                            "sig": sig_joined[:200],
+                        })
+
+                        # gather weak calls only for bodies
+                        if end_line > start_line:
+                            body_end = min(end_line, len(lines))
+                            for j in range(start_line, body_end):
+                                ln2 = lines[j - 1]
+                                s2 = ln2.strip()
+                                if not s2 or s2.startswith("@"):
+                                    continue
+                                for cm in re.finditer(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(", s2):
+                                    callee = cm.group(1)
+                                    if callee in LEGACY_JAVA_KEYWORDS:
+                                        continue
+                                    fallback_calls.append({
+                                        "text": callee,
+                                        "path": rel,
+                                        "line": j,
+                                        "col": cm.start(1) + 1,
+                                    })
+
+                            # jump to end of block
+                            i = end_line - 1
+                    flush_sig()
+        i += 1
+
+    return defs, fallback_calls
+
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+
+def _java_sources(workdir: Path) -> List[Tuple[str, str]]:
+    return [(str(fp.relative_to(workdir)), _read_text(fp)) for fp in _iter_code_files(workdir, JAVA_ROOTS, (".java",))]
+
+
+def _default_workdirs(top: int) -> List[Path]:
+    """Largest Defects4J checkouts (by Java source bytes) under TRACE_WORK_ROOT."""
+    base = Path(os.environ.get("TRACE_WORK_ROOT", "/tmp/trace_work")) / "workdirs" / "defects4j"
+    if not base.exists():
+        return []
+    sized = []
+    for wd in base.iterdir():
+        if wd.is_dir():
+            size = sum(fp.stat().st_size for fp in _iter_code_files(wd, JAVA_ROOTS, (".java",)))
+            if size:
+                sized.append((size, wd))
+    sized.sort(key=lambda t: (-t[0], str(t[1])))
+    return [wd for _, wd in sized[:top]]
+
+
+def _time_best(fn, repeat: int) -> Tuple[float, Any]:
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best or 0.0, out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Java structural indexer")
+    parser.add_argument("--workdir", action="append", default=[], help="Checkout to index (repeatable)")
+    parser.add_argument("--top", type=int, default=3, help="Largest Defects4J workdirs to use when --workdir is not given")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per tree (best time is reported)")
+    args = parser.parse_args()
+
+    workdirs = [Path(w) for w in args.workdir] or _default_workdirs(args.top)
+    if not workdirs:
+        print("no workdirs found (pass --workdir or set TRACE_WORK_ROOT)", file=sys.stderr)
+        return 2
+
+    ts = _ts_load("java")
+    total_before = total_after = 0.0
+    for wd in workdirs:
+        sources = _java_sources(wd)
+        n_lines = sum(text.count("\n") + 1 for _, text in sources)
+        before, old = _time_best(lambda: [legacy_index_java_source(text, rel) for rel, text in sources], args.repeat)
+        after, new = _time_best(lambda: [_scan_java_source(text) for _, text in sources], args.repeat)
+        total_before += before
+        total_after += after
+        print(f"{wd}: {len(sources)} files, {n_lines} lines")
+        print(f"  before: {before * 1000:.1f}ms  defs={sum(len(d) for d, _ in old)} calls={sum(len(c) for _, c in old)}")
+        print(f"  after:  {after * 1000:.1f}ms  defs={sum(len(d) for d, _ in new)} calls={sum(len(c) for _, c in new)}")
+        if after > 0:
+            print(f"  speedup: {before / after:.1f}x")
+        if ts is not None:
+            ts_time, ts_out = _time_best(lambda: [_ts_index_java_source(text, ts) for _, text in sources], args.repeat)
+            print(f"  tree-sitter: {ts_time * 1000:.1f}ms  defs={sum(len(d) for d, _ in ts_out)} "
+                  f"calls={sum(len(c) for _, c in ts_out)}  (vs before: {before / ts_time:.1f}x)")
+    if len(workdirs) > 1 and total_after > 0:
+        print(f"total: before {total_before:.2f}s, after {total_after:.2f}s, speedup {total_before / total_after:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
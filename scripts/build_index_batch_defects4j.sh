@@ -0,0 +1,20 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Build retrieval indexes for a list of Defects4J bugs concurrently.
+# Usage: ./scripts/build_index_batch_defects4j.sh bugs.txt [jobs] [json|sqlite]
+#
+# where bugs.txt contains lines like:
+#   Chart 1
+#   Lang 2
+# Workdirs must already be checked out under TRACE_WORK_ROOT/workdirs/defects4j/.
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+cd "${ROOT_DIR}"
+
+LIST_FILE="${1:?bug list file required}"
+JOBS="${2:-$(nproc 2>/dev/null || echo 4)}"
+FORMAT="${3:-json}"
+
+echo "[INFO] TRACE_WORK_ROOT: ${TRACE_WORK_ROOT:-/tmp/trace_work} jobs=${JOBS} format=${FORMAT}"
+exec python -m agent.tools_build_index --bugs-file "${LIST_FILE}" --jobs "${JOBS}" --format "${FORMAT}"
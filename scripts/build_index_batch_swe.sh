@@ -0,0 +1,20 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Build retrieval indexes for a list of SWE-bench instances concurrently (Python, stdlib ast).
+# Usage: ./scripts/build_index_batch_swe.sh instances.txt [jobs] [json|sqlite]
+#
+# where instances.txt contains one instance_id per line, e.g.:
+#   django__django-14311
+#   sympy__sympy-20590
+# Workdirs must already be prepared under TRACE_WORK_ROOT/workdirs/swebench_verified/.
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+cd "${ROOT_DIR}"
+
+LIST_FILE="${1:?instance list file required}"
+JOBS="${2:-$(nproc 2>/dev/null || echo 4)}"
+FORMAT="${3:-json}"
+
+echo "[INFO] TRACE_WORK_ROOT: ${TRACE_WORK_ROOT:-/tmp/trace_work} jobs=${JOBS} format=${FORMAT}"
+exec python -m agent.tools_build_index --instances-file "${LIST_FILE}" --jobs "${JOBS}" --format "${FORMAT}"